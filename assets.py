@@ -5,12 +5,20 @@ import time
 from PIL import Image
 
 import gfx
+import records
 from binary_reader import BinaryReader, BinaryArrayData
 from compression import decode_format80
 from entities import Dice
 from flags import *
+from maze import Maze, BINARY_EXTENSION
 import math
 
+try:
+    import numpy
+except ImportError:
+    # VCN tilesets are rasterized block by block with blit_block
+    numpy = None
+
 BLOCKS_ROWS = 15
 BLOCKS_COLUMNS = 22
 BLOCKS_SIZE = 8
@@ -135,24 +143,6 @@ class DecorationAssetsRef:
         }
 
 
-class Maze:
-    def __init__(self, name, width=0, height=0, faces=0, walls=[]):
-        self.name = name
-        self.width = width
-        self.height = height
-        self.faces = faces
-        self.walls = walls
-
-    def get_wall(self, x, y):
-        return self.walls[y * self.width + x]
-
-    def get_width(self):
-        return self.width
-
-    def get_height(self):
-        return self.height
-
-
 class DcrAsset:
     class SideData:
         def __init__(self):
@@ -190,9 +180,11 @@ class VcnAsset:
     def __init__(self):
         self.name = None
         self.blocks = []
+        self.data = None  # blocks as stored in the file, 32 bytes each
         self.bg_palette = None
         self.walls_palette = None
         self.exported = False
+        self._atlas = None
 
     def make_image(self, palette):
         num_blocks = len(self.blocks)
@@ -202,6 +194,19 @@ class VcnAsset:
         img_width = width_blocks * BLOCKS_SIZE
         img_height = height_blocks * BLOCKS_SIZE
 
+        if numpy is not None:
+            # the indexed atlas is the same whatever the palette, only build it once
+            if self._atlas is None:
+                data = self.data
+                if data is None:
+                    data = bytes(value for block in self.blocks for value in block)
+
+                self._atlas = tile_blocks(unpack_vcn_blocks(data), width_blocks)
+
+            img = Image.frombuffer('P', (img_width, img_height), self._atlas, 'raw', 'P', 0, 1)
+            img.putpalette(palette)
+            return img
+
         img = Image.new('P', (img_width, img_height))
         img.putpalette(palette)
 
@@ -218,7 +223,7 @@ class VcnAsset:
 
     def export(self, output_dir):
         if self.exported:
-            return
+            return []
 
         self.exported = True
 
@@ -241,12 +246,14 @@ class VcnAsset:
             "wallsGfx": walls_filename
         }
 
-        vcn_filename = f'{self.name}.vcn.json'
-        with open(os.path.join(output_dir, vcn_filename), 'w') as handle:
+        vcn_filename = os.path.join(output_dir, f'{self.name}.vcn.json')
+        with open(vcn_filename, 'w') as handle:
             json.dump(data, handle, indent=True, sort_keys=False)
 
+        return [bg_filename, walls_filename, vcn_filename]
+
     @staticmethod
-    def load(basename, vcn_filename, level_palette):
+    def load(basename, vcn_filename, palettes, palette_name):
         with BinaryReader(vcn_filename) as vcn_reader:
             vcn_data = decode_format80(vcn_reader)
 
@@ -257,26 +264,16 @@ class VcnAsset:
         bg_palette_indices = vcn_reader.read_ubyte(16)
         walls_palette_indices = vcn_reader.read_ubyte(16)
 
-        bg_palette = 48 * [0]
-        walls_palette = 48 * [0]
-
-        for i in range(16):
-            bg_palette[3*i] = level_palette[3*bg_palette_indices[i]]
-            bg_palette[3*i + 1] = level_palette[3*bg_palette_indices[i] + 1]
-            bg_palette[3*i + 2] = level_palette[3*bg_palette_indices[i] + 2]
+        bg_palette = palettes.get_sub_palette(palette_name, bg_palette_indices)
+        walls_palette = palettes.get_sub_palette(palette_name, walls_palette_indices)
 
-            walls_palette[3*i] = level_palette[3*walls_palette_indices[i]]
-            walls_palette[3*i + 1] = level_palette[3*walls_palette_indices[i] + 1]
-            walls_palette[3*i + 2] = level_palette[3*walls_palette_indices[i] + 2]
-
-        blocks = []
-        for _ in range(num_blocks):
-            raw = vcn_reader.read_ubyte(32)
-            blocks.append(raw)
+        data = vcn_reader.read_bytes(num_blocks * 32)
+        blocks = [tuple(data[i:i + 32]) for i in range(0, len(data), 32)]
 
         vcn = VcnAsset()
         vcn.name = basename
         vcn.blocks = blocks
+        vcn.data = data
         vcn.bg_palette = bg_palette
         vcn.walls_palette = walls_palette
 
@@ -347,7 +344,7 @@ class VmpAsset:
         self.vcn = None
 
     @staticmethod
-    def load(basename, vmp_filename, vcn_filename, level_palette):
+    def load(basename, vmp_filename, vcn_filename, palettes, palette_name):
         with BinaryReader(vmp_filename) as reader:
             shorts_per_tileset = 431
             file_size = reader.read_ushort()
@@ -359,7 +356,7 @@ class VmpAsset:
             # padding
             wall_tiles = reader.read_ushort(101 + num_wall_types*shorts_per_tileset)
 
-        vcn = VcnAsset.load(basename, vcn_filename, level_palette)
+        vcn = VcnAsset.load(basename, vcn_filename, palettes, palette_name)
         vmp_asset = VmpAsset()
         vmp_asset.vcn = vcn
         vmp_asset.name = basename
@@ -370,9 +367,9 @@ class VmpAsset:
     def export(self, output_dir):
 
         if self.exported:
-            return
+            return []
 
-        self.vcn.export(output_dir)
+        exported_files = self.vcn.export(output_dir)
 
         wall_tiles_infos = self._export_vmp_blocks(self.wall_tiles)
         bg_tiles = self._export_vmp_blocks(self.bg_tiles)
@@ -383,12 +380,15 @@ class VmpAsset:
             'wallTiles': [t.export() for t in wall_tiles_infos]
         }
 
-        vmp_filename = '%s.vmp.json' % self.name
-        with open(os.path.join(output_dir, vmp_filename), 'w') as handle:
+        vmp_filename = os.path.join(output_dir, '%s.vmp.json' % self.name)
+        with open(vmp_filename, 'w') as handle:
             json.dump(data, handle, indent=True, sort_keys=False)
 
         self.exported = True
 
+        exported_files.append(vmp_filename)
+        return exported_files
+
     @staticmethod
     def _export_vmp_blocks(tileset):
         exported_blocks = []
@@ -406,43 +406,127 @@ class AssetsManager:
     DATA_DIR = "data/"
     BUILD_DIR = "build/"
 
-    def __init__(self, data_dir=DATA_DIR, build_dir=BUILD_DIR):
+    # bump the version of an exporter when its output changes, so that the files exported by the previous
+    # version are not considered up to date anymore
+    EXPORT_VERSIONS = {
+        'cps': 1,
+        'dec': 1,
+        'texts': 1,
+        'maze': 2,
+        'items': 1,
+        'item_types': 1,
+        'vmp': 1,
+    }
+
+    def __init__(self, data_dir=DATA_DIR, build_dir=BUILD_DIR, cache=None, palettes=None):
         self.images = {}
         self.decorations = {}
         self.texts = []
         self.mazes = {}
         self.vmps = {}
+        # names of the VMPs exported, or found up to date
+        self.exported_vmps = set()
 
         self.id_gen = 0
         self.data_dir = data_dir
         self.build_dir = build_dir
-        self.palette_filename = None
-        self.palette = None
 
-    def set_palette(self, palette_filename):
-        palette_filename = os.path.join(self.data_dir, palette_filename.upper())
+        # palettes are given by name to the exports needing one
+        self.palettes = palettes if palettes is not None else gfx.PaletteRegistry(data_dir)
+
+        # BuildCache, exports are skipped when their outputs are up to date
+        self.cache = cache
+
+        # when a list, the exports of the assets levels share (images, decorations and VMPs) are only appended
+        # to it as (method name, arguments), for one process to run them all, see defer_shared_exports()
+        self.deferred_exports = None
+
+        # DEC files requested since defer_shared_exports(), the other requests return None like when they are
+        # exported
+        self.deferred_decorations = set()
+
+    def defer_shared_exports(self):
+        """
+        Record the shared exports instead of running them, until pop_deferred_exports() is called. Worker
+        processes decoding levels in parallel would otherwise write the same files, each one with the palette
+        of its own level.
+        :return:
+        """
+        self.deferred_exports = []
+        self.deferred_decorations = set()
+
+    def pop_deferred_exports(self):
+        """
+        Stop deferring the shared exports
+        :return: the exports recorded since defer_shared_exports(), see run_exports()
+        """
+        exports, self.deferred_exports = self.deferred_exports, None
+        return exports
+
+    def run_exports(self, exports):
+        """
+        Run deferred exports in order. An asset requested more than once is exported by its first request,
+        like when the levels are exported one after the other by a single AssetsManager.
+        :param exports: list of (method name, arguments)
+        :return:
+        """
+        for method, args in exports:
+            getattr(self, method)(*args)
+
+    def get_palette_filename(self, palette_name):
+        if palette_name is None:
+            return None
 
-        if not palette_filename.endswith(PAL_EXTENSION): palette_filename += PAL_EXTENSION
-        self.palette_filename = palette_filename
-        self.palette = gfx.load_palette(self.palette_filename)
+        return self.palettes.get_filename(palette_name)
 
-    def export_cps_image(self, cps_filename):
+    def export_cps_image(self, cps_filename, palette_name=None):
+        if self.deferred_exports is not None:
+            self.deferred_exports.append(('export_cps_image', (cps_filename, palette_name)))
+            return None
 
-        if cps_filename in self.images:
-            return
+        # images are registered under their PNG name, see _add_image()
+        image_asset = self.images.get(cps_filename + '.png')
+        if image_asset is not None:
+            return image_asset
 
         rel_cps_filename = os.path.join(self.data_dir, cps_filename.upper())
         if not rel_cps_filename.endswith(CPS_EXTENSION): rel_cps_filename += CPS_EXTENSION
 
-        img = gfx.load_cps(rel_cps_filename, self.palette)
-        image_asset = self._export_image(img, cps_filename + '.png')
+        key = 'cps:' + cps_filename
+        inputs = [rel_cps_filename, self.get_palette_filename(palette_name)]
+
+        if self._is_fresh('cps', key, inputs):
+            image_asset = self._add_image(self.cache.get_result(key), cps_filename + '.png')
+        else:
+            img = gfx.load_cps(rel_cps_filename, self.palettes.get(palette_name))
+            image_asset = self._export_image(img, cps_filename + '.png')
+            self._record('cps', key, inputs, [image_asset.filename], image_asset.filename)
+
         image_asset.original_asset = rel_cps_filename
 
         return image_asset
 
-    def export_dec_file(self, dec_assets_ref):
+    def get_decorations_filename(self, dec_assets_ref):
+        return os.path.join(self.build_dir, dec_assets_ref.get_dec_file())
 
+    def export_decorations(self, gfx_file, dec_file, palette_name=None):
+        return self.export_dec_file(DecorationAssetsRef(gfx_file, dec_file), palette_name)
+
+    def export_dec_file(self, dec_assets_ref, palette_name=None):
         dec_key = str(dec_assets_ref)
+
+        if self.deferred_exports is not None:
+            if dec_key in self.deferred_decorations:
+                return None
+            self.deferred_decorations.add(dec_key)
+
+            # plain values, the deferred exports are recorded in the build cache
+            self.deferred_exports.append(('export_decorations', (dec_assets_ref.get_gfx_file(),
+                                                                 dec_assets_ref.get_dec_file(), palette_name)))
+
+            # not decoded yet, only its filename is known
+            return DecorationsAsset(self.get_decorations_filename(dec_assets_ref))
+
         if dec_key in self.decorations:
             return
 
@@ -451,7 +535,8 @@ class AssetsManager:
 
         self.decorations[dec_key] = dec_asset
 
-        with BinaryReader('data/{file}'.format(file=dec_assets_ref.get_dec_file())) as reader:
+        dec_filename = os.path.join(self.data_dir, dec_assets_ref.get_dec_file())
+        with BinaryReader(dec_filename) as reader:
             count = reader.read_ushort()
 
             for i in range(count):
@@ -471,19 +556,33 @@ class AssetsManager:
                 rect[2] *= 8
                 dec_asset.append_rectangle(ShapeRect(*rect))
 
-        dec_exported_filename = os.path.join(self.build_dir, dec_assets_ref.get_dec_file())
-        image_asset = self.export_cps_image(dec_assets_ref.get_gfx_file())
+        dec_exported_filename = self.get_decorations_filename(dec_assets_ref)
+        image_asset = self.export_cps_image(dec_assets_ref.get_gfx_file(), palette_name)
 
         dec_asset.filename = dec_exported_filename
         dec_asset.image_filename = image_asset.filename
 
-        with open(dec_exported_filename, 'w') as handle:
-            json.dump(dec_asset.export(), handle, indent=True, sort_keys=False)
+        # the decorations are decoded anyway, they are needed by the level
+        key = 'dec:' + dec_key
+        inputs = [dec_filename]
+        if not self._is_fresh('dec', key, inputs):
+            with open(dec_exported_filename, 'w') as handle:
+                json.dump(dec_asset.export(), handle, indent=True, sort_keys=False)
+
+            self._record('dec', key, inputs, [dec_exported_filename])
 
         return dec_asset
 
     def export_texts(self):
         file = os.path.join(self.data_dir, 'TEXT.DAT')
+        texts_filename = os.path.join(self.build_dir, 'texts.json')
+
+        if self._is_fresh('texts', 'texts', [file]):
+            with open(texts_filename, 'r') as handle:
+                self.texts = json.load(handle)
+
+            return self.texts
+
         offsets = []
         with BinaryReader(file) as reader:
             while True:
@@ -501,9 +600,11 @@ class AssetsManager:
 
                 self.texts.append(reader.read_string(length))
 
-        with open(os.path.join(self.build_dir, 'texts.json'), 'w') as handle:
+        with open(texts_filename, 'w') as handle:
             json.dump(self.texts, handle, indent=True, sort_keys=False)
 
+        self._record('texts', 'texts', [file], [texts_filename])
+
         return self.texts
 
     def export_maze(self, maze_name):
@@ -511,60 +612,57 @@ class AssetsManager:
         if not maze_filename.endswith(MAZ_EXTENSION):
             maze_filename += MAZ_EXTENSION
 
-        with BinaryReader(os.path.join(self.data_dir, maze_filename)) as reader:
-
-            width = reader.read_ushort()
-            height = reader.read_ushort()
-            faces = reader.read_ushort()
+        maze_filename = os.path.join(self.data_dir, maze_filename)
+        exported_filename = os.path.join(self.build_dir, maze_name)
+        binary_filename = exported_filename + BINARY_EXTENSION
+        key = 'maze:' + maze_name
 
-            walls = [[None for _ in range(height)] for _ in range(width)]
-
-            for y in range(height):
-                for x in range(width):
-                    n = reader.read_ubyte()
-                    e = reader.read_ubyte()
-                    s = reader.read_ubyte()
-                    w = reader.read_ubyte()
+        if self._is_fresh('maze', key, [maze_filename]):
+            # the binary export is a copy of the MAZ file, read as is
+            self.mazes[maze_name] = Maze.load(maze_name, binary_filename)
+            return
 
-                    walls[x][y] = {
-                        'x': x,
-                        'y': y,
-                        'n': n,
-                        's': s,
-                        'w': w,
-                        'e': e,
-                    }
+        maze = Maze.load(maze_name, maze_filename)
+        self.mazes[maze_name] = maze
 
-            maze = Maze(maze_name, width, height, faces, walls)
-            self.mazes[maze_name] = maze
+        with open(exported_filename, 'w') as handle:
+            json.dump(maze.export(), handle, indent=True, sort_keys=False)
 
-        with open(os.path.join(self.build_dir, maze_name), 'w') as handle:
-            json.dump(maze.__dict__, handle, indent=True, sort_keys=False)
+        # the MAZ layout, for the tools mapping it with Maze.open()
+        with open(binary_filename, 'wb') as handle:
+            handle.write(maze.to_maz())
 
-    def load_dcr(self, name=''):
+        self._record('maze', key, [maze_filename], [exported_filename, binary_filename])
 
+    def get_dcr_filename(self, name):
         filename = name.upper()
         if not filename.endswith(DCR_EXTENSION):
             filename += DCR_EXTENSION
 
-        rel_filename = os.path.join(self.data_dir, filename)
+        return os.path.join(self.data_dir, filename)
+
+    def load_dcr(self, name=''):
+
+        rel_filename = self.get_dcr_filename(name)
         if not os.path.exists(rel_filename):
             return None
 
         with BinaryReader(rel_filename) as reader:
             count = reader.read_ushort()
+            side_records = records.DCR_SIDE.read(reader, count * 6)
+
             for i in range(count):
                 dcr_asset = DcrAsset(name)
 
                 sides = []
-                for j in range(6):
+                for record in side_records[i * 6:(i + 1) * 6]:
                     side = DcrAsset.SideData()
-                    side.cps_x = reader.read_ubyte() * 8
-                    side.cps_y = reader.read_ubyte()
-                    side.width = reader.read_ubyte() * 8
-                    side.height = reader.read_ubyte()
-                    side.screen_x = reader.read_ubyte()
-                    side.screen_y = reader.read_ubyte()
+                    side.cps_x = record['cps_x'] * 8
+                    side.cps_y = record['cps_y']
+                    side.width = record['width'] * 8
+                    side.height = record['height']
+                    side.screen_x = record['screen_x']
+                    side.screen_y = record['screen_y']
 
                     sides.append(side)
 
@@ -588,113 +686,111 @@ class AssetsManager:
         items = []  # ITEM.DAT
         items_names = []
 
-        with BinaryReader('data/ITEM.DAT') as reader:
+        items_filename = os.path.join(self.data_dir, 'ITEM.DAT')
+        exported_filename = os.path.join(self.build_dir, 'items.json')
+        if self._is_fresh('items', 'items', [items_filename]):
+            return
+
+        with BinaryReader(items_filename) as reader:
             count = reader.read_ushort()
-            for i in range(count):
-                item = {
-                    'unidentified_name': reader.read_ubyte(),
-                    'identified_name': reader.read_ubyte(),
-                    'flags': reader.read_ubyte(),
-                    'picture': reader.read_ubyte(),
-                    'type': reader.read_ubyte(),  # See types below
-
-                    # Where the item lies at position
-                    # In Maze:
-                    #      0..3-> Bottom
-                    #      4..7-> Wall (N,E,S,W)
-                    # For EotB I: 0..3-> Floor NW,NE,SW,SE
-                    #                8-> Compartment
-                    # If in inventory:
-                    #      0..26-> Position in Inventory
-                    'sub_position': reader.read_ubyte(),
-
-                    # Position in maze x + y * 32, consumed if <= 0
-                    'coordinate': reader.read_ushort(),
-                    'next': reader.read_ushort(),
-                    'previous': reader.read_ushort(),
-
-                    # Level, where the item lies, 0 <= no level
-                    'level': reader.read_ubyte(),
-
-                    # The value of item, -1 if consumed
-                    'value': reader.read_byte(),
-                }
+            for item in records.ITEM.read(reader, count):
                 pos = divmod(item['coordinate'], 32)
                 item['coordinate'] = {'x': pos[1], 'y': pos[0]}
                 items.append(item)
 
             count = reader.read_ushort()
-            for i in range(count):
-                name = reader.read_string(35)
-                items_names.append(name)
+            for record in records.ITEM_NAME.read(reader, count):
+                items_names.append(record['name'])
 
             for item in items:
                 item['unidentified_name'] = items_names[item['unidentified_name']]
                 item['identified_name'] = items_names[item['identified_name']]
 
-            with open(os.path.join(self.build_dir, 'items.json'), 'w') as handle:
+            with open(exported_filename, 'w') as handle:
                 json.dump(items, handle, indent=True, sort_keys=False)
 
+        self._record('items', 'items', [items_filename], [exported_filename])
+
     def export_item_types(self):
         item_types = []
-        with BinaryReader(os.path.join(self.data_dir, 'ITEMTYPE.DAT')) as reader:
+
+        item_types_filename = os.path.join(self.data_dir, 'ITEMTYPE.DAT')
+        exported_filename = os.path.join(self.build_dir, 'item_types.json')
+        if self._is_fresh('item_types', 'item_types', [item_types_filename]):
+            return
+
+        with BinaryReader(item_types_filename) as reader:
             count = reader.read_ushort()
-            for i in range(count):
+            for record in records.ITEM_TYPE.read(reader, count):
                 item_type = {
-                    # At which position in inventory it is allowed to be put. See InventoryUsage
-                    'slots': str(ItemSlotFlags(reader.read_ushort())),
-                    'flags': str(ItemFlags(reader.read_ushort())),
-                    'armor_class': reader.read_byte(),  # Adds to armor class
-                    'allowed_classes': str(ProfessionFlags(reader.read_ubyte())),
-                    # Allowed for this profession. See ClassUsage
-                    'allowed_hands': str(HandFlags(reader.read_ubyte())),  # Allowed for this hand
-                    'damage_vs_small': str(Dice(reader)),
-                    'damage_vs_big': str(Dice(reader)),
+                    'slots': str(ItemSlotFlags(record['slots'])),
+                    'flags': str(ItemFlags(record['flags'])),
+                    'armor_class': record['armor_class'],
+                    'allowed_classes': str(ProfessionFlags(record['allowed_classes'])),
+                    'allowed_hands': str(HandFlags(record['allowed_hands'])),
+                    'damage_vs_small': str(Dice.from_values(*record['damage_vs_small'])),
+                    'damage_vs_big': str(Dice.from_values(*record['damage_vs_big'])),
                     # 'damage_incs': reader.read_ubyte(),
-                    'unknown': reader.read_ubyte(),
-                    'usage': str(ItemTypeUsage(reader.read_ushort())),
+                    'unknown': record['unknown'],
+                    'usage': str(ItemTypeUsage(record['usage'])),
                 }
 
                 item_types.append(item_type)
 
-        with open(os.path.join(self.build_dir, 'item_types.json'), 'w') as handle:
+        with open(exported_filename, 'w') as handle:
             json.dump(item_types, handle, indent=True, sort_keys=False)
 
-    def load_vmp(self, vmp_name=''):
+        self._record('item_types', 'item_types', [item_types_filename], [exported_filename])
+
+    def load_vmp(self, vmp_name='', palette_name=None):
 
         if vmp_name in self.vmps:
             return self.vmps[vmp_name]
 
-        vmp_filename = vmp_name.upper()
-        if not vmp_filename.endswith(VMP_EXTENSION):
-            vmp_filename += VMP_EXTENSION
-
-        vmp_filename = os.path.join(self.data_dir, vmp_filename)
+        vmp_filename, vcn_filename = self._get_vmp_filenames(vmp_name)
         if not os.path.exists(vmp_filename):
             raise Exception('Cannot find VMP file %s' % vmp_filename)
 
-        vcn_filename = vmp_name.upper() + '.VCN'
-        vcn_filename = os.path.join(self.data_dir, vcn_filename)
         if not os.path.exists(vcn_filename):
             raise Exception('Cannot find the VCN file %s' % vcn_filename)
 
-        vmp_asset = VmpAsset.load(vmp_name, vmp_filename, vcn_filename, self.palette)
+        vmp_asset = VmpAsset.load(vmp_name, vmp_filename, vcn_filename, self.palettes, palette_name)
         self.vmps[vmp_name] = vmp_asset
 
         return vmp_asset
 
-    def export_vmp(self, vmp_name):
-        if vmp_name not in self.vmps:
-            vmp = self.load_vmp(vmp_name)
-        else:
-            vmp = self.vmps[vmp_name]
-            if vmp.exported:
-                return vmp
+    def export_vmp(self, vmp_name, palette_name):
+        if self.deferred_exports is not None:
+            self.deferred_exports.append(('export_vmp', (vmp_name, palette_name)))
+            return None
+
+        # exported by a previous request, maybe with another palette
+        if vmp_name in self.exported_vmps:
+            return self.vmps.get(vmp_name)
+
+        self.exported_vmps.add(vmp_name)
+
+        key = 'vmp:' + vmp_name
+        inputs = list(self._get_vmp_filenames(vmp_name)) + [self.get_palette_filename(palette_name)]
+
+        # up to date exports don't even load the VMP
+        if self._is_fresh('vmp', key, inputs):
+            return self.vmps.get(vmp_name)
+
+        vmp = self.load_vmp(vmp_name, palette_name)
+        self._record('vmp', key, inputs, vmp.export(self.build_dir))
 
-        vmp.export(self.build_dir)
-        vmp.exported = True
         return vmp
 
+    def _get_vmp_filenames(self, vmp_name):
+        vmp_filename = vmp_name.upper()
+        if not vmp_filename.endswith(VMP_EXTENSION):
+            vmp_filename += VMP_EXTENSION
+
+        vcn_filename = vmp_name.upper() + '.VCN'
+
+        return os.path.join(self.data_dir, vmp_filename), os.path.join(self.data_dir, vcn_filename)
+
     """
     def export_walls(self, wall_type, vmp):
         img_width = 24 * BLOCKS_SIZE
@@ -753,12 +849,27 @@ class AssetsManager:
         exported_filename = os.path.join(self.build_dir, filename.lower())
         pil_img.convert('RGB').save(exported_filename)
 
+        return self._add_image(exported_filename, filename)
+
+    def _add_image(self, exported_filename, filename):
         image_asset = ImageAsset(self.id_gen, exported_filename, full_path=os.path.abspath(exported_filename))
 
         self.images[filename] = image_asset
         self.id_gen += 1
         return image_asset
 
+    def _is_fresh(self, exporter, key, inputs):
+        if self.cache is None:
+            return False
+
+        return self.cache.is_fresh(key, self.EXPORT_VERSIONS[exporter], inputs)
+
+    def _record(self, exporter, key, inputs, outputs, result=None):
+        if self.cache is None:
+            return
+
+        self.cache.record(key, self.EXPORT_VERSIONS[exporter], inputs, outputs, result)
+
 
 def blit_block(image_data, img_width, x, y, vcn_block, flip):
     s = -1 if flip else 1
@@ -772,3 +883,43 @@ def blit_block(image_data, img_width, x, y, vcn_block, flip):
             coords = x + p + s * 2 * v + (y + w) * img_width
             image_data[coords] = col1
             image_data[coords + s] = col2
+
+
+def unpack_vcn_blocks(data, flipped=None):
+    """
+    Unpack VCN blocks to a (N, 8, 8) array of palette indices. A block is 8 rows of 4 bytes, two pixels
+    per byte with the left one in the high nibble.
+
+    :param data: the blocks, 32 bytes each
+    :param flipped: optional array of N booleans, the blocks to mirror horizontally
+    :return:
+    """
+    packed = numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, BLOCKS_SIZE, BLOCKS_SIZE // 2)
+
+    pixels = numpy.empty((len(packed), BLOCKS_SIZE, BLOCKS_SIZE), dtype=numpy.uint8)
+    pixels[:, :, 0::2] = packed >> 4
+    pixels[:, :, 1::2] = packed & 0x0f
+
+    if flipped is not None:
+        pixels[flipped] = pixels[flipped][:, :, ::-1]
+
+    return pixels
+
+
+def tile_blocks(pixels, width_blocks):
+    """
+    Lay out (N, 8, 8) blocks left to right and top to bottom, width_blocks per row. The last row is padded
+    with color 0.
+
+    :param pixels:
+    :param width_blocks:
+    :return: contiguous (rows * 8, width_blocks * 8) array
+    """
+    num_blocks = len(pixels)
+    height_blocks = -(-num_blocks // width_blocks)
+
+    atlas = numpy.zeros((height_blocks * width_blocks, BLOCKS_SIZE, BLOCKS_SIZE), dtype=numpy.uint8)
+    atlas[:num_blocks] = pixels
+
+    atlas = atlas.reshape(height_blocks, width_blocks, BLOCKS_SIZE, BLOCKS_SIZE).swapaxes(1, 2)
+    return numpy.ascontiguousarray(atlas).reshape(height_blocks * BLOCKS_SIZE, width_blocks * BLOCKS_SIZE)
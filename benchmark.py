@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:
+    # Windows, the peak memory of the extract.py runs isn't measured
+    resource = None
+
+import gfx
+import synthetic
+from assets import AssetsManager, VcnAsset, blit_block, BLOCKS_SIZE
+from binary_reader import BinaryArrayData, BinaryReader
+from compression import decode_format80, encode_format80_image
+from extract import Script
+
+# name -> (setup function, unit of the throughput)
+BENCHMARKS = OrderedDict()
+
+SEED = 2
+
+
+def benchmark(name, unit):
+    """
+    Register a benchmark. The decorated function gets the scale factor and a temporary directory, builds its
+    inputs and returns the function to time along with the number of units it processes per call.
+
+    :param name:
+    :param unit: unit of the throughput, e.g. 'MB', 'blocks' or 'tokens'
+    :return:
+    """
+    def register(setup):
+        BENCHMARKS[name] = (setup, unit)
+        return setup
+
+    return register
+
+
+def write_file(directory, name, data):
+    filename = os.path.join(directory, name)
+    with open(filename, 'wb') as handle:
+        handle.write(data)
+
+    return filename
+
+
+# region Benchmarks
+
+
+@benchmark('format80.decode', 'MB')
+def bench_format80_decode(scale, tmp_dir):
+    size = 64000 * scale
+    compressed = encode_format80_image(synthetic.make_image_data(random.Random(SEED), size))
+
+    return lambda: decode_format80(BinaryArrayData(compressed)), size / 1e6
+
+
+@benchmark('binary_reader.read_ubyte', 'MB')
+def bench_read_ubyte(scale, tmp_dir):
+    size = 100000 * scale
+    filename = write_file(tmp_dir, 'ubyte.bin', bytes(random.Random(SEED).randrange(256) for _ in range(size)))
+
+    def run():
+        with BinaryReader(filename) as reader:
+            for _ in range(size):
+                reader.read_ubyte()
+
+    return run, size / 1e6
+
+
+@benchmark('binary_reader.read_ushort', 'MB')
+def bench_read_ushort(scale, tmp_dir):
+    count = 50000 * scale
+    filename = write_file(tmp_dir, 'ushort.bin', bytes(random.Random(SEED).randrange(256) for _ in range(count * 2)))
+
+    def run():
+        with BinaryReader(filename) as reader:
+            for _ in range(count):
+                reader.read_ushort()
+
+    return run, count * 2 / 1e6
+
+
+@benchmark('binary_reader.read_bytes', 'MB')
+def bench_read_bytes(scale, tmp_dir):
+    chunk = 32
+    count = 20000 * scale
+    filename = write_file(tmp_dir, 'bytes.bin', bytes(count * chunk))
+
+    def run():
+        with BinaryReader(filename) as reader:
+            for _ in range(count):
+                reader.read_bytes(chunk)
+
+    return run, count * chunk / 1e6
+
+
+@benchmark('vcn.make_image', 'blocks')
+def bench_vcn_make_image(scale, tmp_dir):
+    num_blocks = 1000 * scale
+    data = synthetic.make_vcn_data(random.Random(SEED), num_blocks)
+
+    vcn = VcnAsset()
+    vcn.data = data
+    vcn.blocks = [tuple(data[i:i + 32]) for i in range(0, len(data), 32)]
+    palette = list(range(48))
+
+    def run():
+        # the atlas is cached by the asset, time the rasterization every time
+        vcn._atlas = None
+        vcn.make_image(palette)
+
+    return run, num_blocks
+
+
+@benchmark('blit_block', 'blocks')
+def bench_blit_block(scale, tmp_dir):
+    num_blocks = 1000 * scale
+    data = synthetic.make_vcn_data(random.Random(SEED), num_blocks)
+    blocks = [tuple(data[i:i + 32]) for i in range(0, len(data), 32)]
+
+    width = 32 * BLOCKS_SIZE
+    image_data = [0] * (width * BLOCKS_SIZE * -(-num_blocks // 32))
+
+    def run():
+        for i, block in enumerate(blocks):
+            blit_block(image_data, width, (i % 32) * BLOCKS_SIZE, (i // 32) * BLOCKS_SIZE, block, i & 1)
+
+    return run, num_blocks
+
+
+@benchmark('gfx.load_cps', 'MB')
+def bench_load_cps(scale, tmp_dir):
+    rng = random.Random(SEED)
+    filenames = [write_file(tmp_dir, 'IMAGE%d.CPS' % i, synthetic.make_cps(rng)) for i in range(scale)]
+    palette = bytes(rng.randrange(256) for _ in range(768))
+
+    def run():
+        for filename in filenames:
+            gfx.load_cps(filename, palette)
+
+    return run, 64000 * scale / 1e6
+
+
+@benchmark('assets.export_maze', 'cells')
+def bench_export_maze(scale, tmp_dir):
+    rng = random.Random(SEED)
+    names = ['level%d.maz' % i for i in range(scale)]
+    for name in names:
+        write_file(tmp_dir, name.upper(), synthetic.make_maze(rng))
+
+    build_dir = os.path.join(tmp_dir, 'build')
+    os.makedirs(build_dir, exist_ok=True)
+
+    # no build cache, every call exports again
+    assets_manager = AssetsManager(tmp_dir, build_dir)
+
+    def run():
+        for name in names:
+            assets_manager.export_maze(name)
+
+    return run, 32 * 32 * scale
+
+
+@benchmark('script.decompile', 'tokens')
+def bench_script_decompile(scale, tmp_dir):
+    rng = random.Random(SEED)
+    scripts = [synthetic.make_script(rng, 250)[0] for _ in range(scale)]
+
+    def run():
+        for data in scripts:
+            Script(BinaryArrayData(data))
+
+    return run, sum(len(Script(BinaryArrayData(data)).tokens) for data in scripts)
+
+
+# endregion
+
+
+def run_extract(data_dir=None, scale=1, jobs=None):
+    """
+    Time a full run of extract.py in a temporary directory
+    :param data_dir: game files, None to generate synthetic ones
+    :param scale: scale of the synthetic game files
+    :param jobs: number of worker processes, extract.py default if None
+    :return: seconds, peak resident memory of the largest process of the run in bytes, None when it can't be
+             told apart from the children run before
+    """
+    extract_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'extract.py')
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        if data_dir is None:
+            synthetic.generate(os.path.join(work_dir, 'data'), scale, SEED)
+        else:
+            os.symlink(os.path.abspath(data_dir), os.path.join(work_dir, 'data'))
+        os.makedirs(os.path.join(work_dir, 'build'))
+
+        command = [sys.executable, extract_script]
+        if jobs is not None:
+            command += ['-j', str(jobs)]
+
+        peak_before = get_children_peak_memory()
+
+        start = time.perf_counter()
+        subprocess.run(command, cwd=work_dir, check=True, stdout=subprocess.DEVNULL)
+        seconds = time.perf_counter() - start
+
+        peak_after = get_children_peak_memory()
+
+    # the peak of all the children waited for so far, it is the peak of this run only if the run raised it
+    if peak_after is None or peak_after <= peak_before:
+        return seconds, None
+
+    return seconds, peak_after
+
+
+def get_children_peak_memory():
+    """
+    :return: peak resident memory in bytes of the largest child process waited for so far, None if unknown
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    # bytes on macOS, kilobytes on Linux
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def measure(setup, scale, repeat):
+    """
+    :param setup: registered benchmark function
+    :param scale:
+    :param repeat: number of timed runs, the fastest is kept
+    :return: seconds of the fastest run, units processed per run, peak traced memory in bytes
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        run, amount = setup(scale, tmp_dir)
+
+        # warm up, e.g. imports and caches of the tested code
+        run()
+
+        seconds = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            seconds = elapsed if seconds is None else min(seconds, elapsed)
+
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return seconds, amount, peak
+
+
+def run_benchmarks(names=None, scale=1, repeat=5, data_dir=None, jobs=None):
+    """
+    :param names: names of the benchmarks to run, all by default
+    :param scale: multiplies the size of the synthetic inputs
+    :param repeat:
+    :param data_dir: game files of the full extraction, synthetic ones if None
+    :param jobs:
+    :return: name -> result
+    """
+    results = OrderedDict()
+
+    for name, (setup, unit) in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+
+        seconds, amount, peak = measure(setup, scale, repeat)
+        results[name] = {
+            'seconds': seconds,
+            'throughput': amount / seconds,
+            'unit': unit + '/s',
+            'peak_memory': peak,
+        }
+
+    if not names or 'extract' in names:
+        seconds, peak = run_extract(data_dir, scale, jobs)
+        results['extract'] = {
+            'seconds': seconds,
+            'throughput': 1 / seconds,
+            'unit': 'runs/s',
+            'peak_memory': peak,
+        }
+
+    return results
+
+
+def compare(results, baseline):
+    """
+    :param results:
+    :param baseline: results of a previous run
+    :return: name -> throughput relative to the baseline, for the benchmarks found in both
+    """
+    return {name: result['throughput'] / baseline[name]['throughput']
+            for name, result in results.items()
+            if name in baseline and baseline[name]['throughput']}
+
+
+def print_results(results, ratios):
+    print('{:<28} {:>10} {:>18} {:>12} {:>10}'.format('benchmark', 'time (ms)', 'throughput', 'peak (KiB)',
+                                                      'baseline'))
+    for name, result in results.items():
+        ratio = ratios.get(name)
+        peak = result['peak_memory']
+        print('{:<28} {:>10.2f} {:>18} {:>12} {:>10}'.format(
+            name, result['seconds'] * 1000, '{:.3g} {}'.format(result['throughput'], result['unit']),
+            '-' if peak is None else '{:.0f}'.format(peak / 1024),
+            '-' if ratio is None else '{:+.1%}'.format(ratio - 1)))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the decoders, rasterizers and exporters on '
+                                                 'synthetic inputs')
+    parser.add_argument('names', nargs='*', metavar='NAME',
+                        help='benchmarks to run, all by default: {names}, extract'.format(
+                            names=', '.join(BENCHMARKS)))
+    parser.add_argument('-s', '--scale', type=int, default=1, help='size factor of the synthetic inputs')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='timed runs per benchmark, the fastest is kept')
+    parser.add_argument('-d', '--data-dir', help='game files of the full extract.py run, synthetic files of the '
+                                                 'same scale by default')
+    parser.add_argument('-j', '--jobs', type=int, help='worker processes of the full extract.py run')
+    parser.add_argument('-b', '--baseline', help='JSON results of a previous run to compare with')
+    parser.add_argument('--save', help='write the results to this JSON file, e.g. to make a new baseline')
+    parser.add_argument('-t', '--tolerance', type=float,
+                        help='exit with an error if a throughput is lower than the baseline by more than this '
+                             'fraction, e.g. 0.1')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.names, args.scale, args.repeat, args.data_dir, args.jobs)
+
+    ratios = {}
+    if args.baseline:
+        with open(args.baseline, 'r') as handle:
+            ratios = compare(results, json.load(handle)['results'])
+
+    print_results(results, ratios)
+
+    if args.save:
+        with open(args.save, 'w') as handle:
+            json.dump({'scale': args.scale, 'results': results}, handle, indent=True)
+
+    if args.tolerance is not None:
+        regressions = [name for name, ratio in ratios.items() if ratio < 1 - args.tolerance]
+        if regressions:
+            print('slower than the baseline: {names}'.format(names=', '.join(regressions)))
+            sys.exit(1)
@@ -1,15 +1,41 @@
+import mmap
 import struct
 
+# compiled structs, keyed by (format character, count)
+_structs = {}
+
+
+def _get_struct(code, count):
+    """
+    Compiled little endian struct for count values of the given format character
+    :param code:
+    :param count:
+    :return:
+    """
+    compiled = _structs.get((code, count))
+
+    if compiled is None:
+        compiled = struct.Struct('<{count}{code}'.format(count=count, code=code))
+        _structs[(code, count)] = compiled
+
+    return compiled
+
 
 class BinaryReader:
     """
+    Reads little endian values from a file.
 
+    By default the file is memory mapped and values are unpacked in place at an integer cursor. With
+    mapped=False every read goes through the file handle instead.
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, mapped=True):
 
         self.filename = filename
+        self.mapped = mapped
         self.handle = None
+        self.buffer = None
+        self.pos = 0
 
     def __enter__(self):
         """
@@ -17,6 +43,14 @@ class BinaryReader:
         :return:
         """
         self.handle = open(self.filename, 'rb')
+        self.pos = 0
+
+        if self.mapped:
+            try:
+                self.buffer = mmap.mmap(self.handle.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty files can't be mapped
+                self.buffer = None
 
         return self
 
@@ -28,6 +62,10 @@ class BinaryReader:
         :param exc_tb:
         :return:
         """
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+
         if self.handle:
             self.handle.close()
             self.handle = None
@@ -41,6 +79,9 @@ class BinaryReader:
         if not self.handle:
             return None
 
+        if self.buffer is not None:
+            return self.pos
+
         return self.handle.tell()
 
     @property
@@ -51,13 +92,34 @@ class BinaryReader:
         """
         return hex(self.offset)
 
+    def _unpack(self, code, count):
+        """
+        Unpack count values of the given format character and move forward
+        :param code:
+        :param count:
+        :return: tuple
+        """
+        compiled = _structs.get((code, count)) or _get_struct(code, count)
+
+        if self.buffer is not None:
+            value = compiled.unpack_from(self.buffer, self.pos)
+            self.pos += compiled.size
+            return value
+
+        return compiled.unpack(self.handle.read(compiled.size))
+
     def read_ubyte(self, count=1):
         """
 
         :param count:
         :return:
         """
-        val = struct.unpack('{count}B'.format(count=count), self.handle.read(count))
+        if count == 1 and self.buffer is not None:
+            val = self.buffer[self.pos]
+            self.pos += 1
+            return val
+
+        val = self._unpack('B', count)
 
         if count == 1:
             return val[0]
@@ -69,7 +131,7 @@ class BinaryReader:
         :param count:
         :return:
         """
-        val = struct.unpack('{count}b'.format(count=count), self.handle.read(count))
+        val = self._unpack('b', count)
         if count == 1:
             return val[0]
         return val
@@ -80,8 +142,8 @@ class BinaryReader:
         :param count:
         :return:
         """
-        s = struct.unpack('{count}B'.format(count=count), self.handle.read(count))
-        self.handle.seek(-count, 1)
+        s = self._unpack('B', count)
+        self.rewind(count)
         if count == 1:
             return s[0]
 
@@ -93,8 +155,8 @@ class BinaryReader:
         :param count:
         :return:
         """
-        value = struct.unpack('{count}b'.format(count=count), self.handle.read(count))[0]
-        self.handle.seek(-count, 1)
+        value = self._unpack('b', count)[0]
+        self.rewind(count)
         return value
 
     def read_ushort(self, count=1):
@@ -103,7 +165,7 @@ class BinaryReader:
         :param count:
         :return:
         """
-        val = struct.unpack('{count}H'.format(count=count), self.handle.read(count * 2))
+        val = self._unpack('H', count)
         if count == 1:
             return val[0]
         return val
@@ -114,7 +176,7 @@ class BinaryReader:
         :param count:
         :return:
         """
-        val = struct.unpack('{count}h'.format(count=count), self.handle.read(count * 2))
+        val = self._unpack('h', count)
         if count == 1:
             return val[0]
         return val
@@ -125,8 +187,8 @@ class BinaryReader:
         :param count:
         :return:
         """
-        value = struct.unpack('{count}H'.format(count=count), self.handle.read(count * 2))[0]
-        self.handle.seek(-count * 2, 1)
+        value = self._unpack('H', count)[0]
+        self.rewind(count * 2)
         return value
 
     def peek_short(self, count=1):
@@ -135,8 +197,8 @@ class BinaryReader:
         :param count:
         :return:
         """
-        value = struct.unpack('{count}h'.format(count=count), self.handle.read(count * 2))[0]
-        self.handle.seek(-count * 2, 1)
+        value = self._unpack('h', count)[0]
+        self.rewind(count * 2)
         return value
 
     def read_uint(self, count=1):
@@ -145,7 +207,7 @@ class BinaryReader:
         :param count:
         :return:
         """
-        val = struct.unpack('{count}I'.format(count=count), self.handle.read(count * 4))
+        val = self._unpack('I', count)
         if count == 1:
             return val[0]
         return val
@@ -156,11 +218,25 @@ class BinaryReader:
         :param count:
         :return:
         """
-        val = struct.unpack('{count}i'.format(count=count), self.handle.read(count * 4))[0]
+        val = self._unpack('i', count)
         if count == 1:
             return val[0]
         return val
 
+    def read_bytes(self, count=-1):
+        """
+        Read raw bytes, up to the end of the file when count is negative
+        :param count:
+        :return:
+        """
+        if self.buffer is None:
+            return self.handle.read(count)
+
+        end = len(self.buffer) if count < 0 else self.pos + count
+        value = self.buffer[self.pos:end]
+        self.pos += len(value)
+        return value
+
     def read_string(self, length=0):
         """
 
@@ -168,15 +244,9 @@ class BinaryReader:
         :return:
         """
 
-        buff = struct.unpack('{length}s'.format(length=length), self.handle.read(length))[0]
-
-        string = ''
-        for c in buff:
-            if c == 0:
-                break
-            string += chr(c)
+        buff = self._unpack('s', length)[0]
 
-        return string
+        return buff.split(b'\x00', 1)[0].decode('latin-1')
 
     def peek_string(self, length=0):
         str = self.read_string(length)
@@ -189,6 +259,13 @@ class BinaryReader:
         :return:
         """
 
+        if self.buffer is not None:
+            end = self.buffer.find(b'\x00', self.pos)
+            if end >= 0:
+                string = self.buffer[self.pos:end].decode('latin-1')
+                self.pos = end + 1
+                return string
+
         string = ''
 
         while True:
@@ -206,7 +283,10 @@ class BinaryReader:
         :return:
         """
 
-        self.handle.seek(-offset, 1)
+        if self.buffer is not None:
+            self.pos -= offset
+        else:
+            self.handle.seek(-offset, 1)
 
     def seek(self, offset):
         """
@@ -215,22 +295,38 @@ class BinaryReader:
         :return:
         """
 
-        self.handle.seek(offset)
+        if self.buffer is not None:
+            self.pos = offset
+        else:
+            self.handle.seek(offset)
 
 
-import array
-
 class BinaryArrayData:
     """
+    Reads little endian values from data already in memory.
 
+    Objects supporting the buffer protocol (bytes, bytearray, memoryview, mmap, array...) are read in place
+    without being copied. Lists of ints are packed into bytes first.
     """
 
     def __init__(self, array_data):
-        self.data = array.array('B')
-        self.data.fromlist(array_data)
+        if isinstance(array_data, (list, tuple)):
+            array_data = bytes(array_data)
+
+        self.data = array_data
         self.pos = 0
         self.limit = len(self.data)
 
+    def __enter__(self):
+        """
+        Nothing to open, for code reading either from a BinaryReader or from data in memory
+        :return:
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
     @property
     def offset(self):
         """
@@ -239,18 +335,30 @@ class BinaryArrayData:
         """
         return self.pos
 
+    def _unpack(self, code, count):
+        """
+        Unpack count values of the given format character and move forward
+        :param code:
+        :param count:
+        :return: tuple
+        """
+        compiled = _structs.get((code, count)) or _get_struct(code, count)
+        value = compiled.unpack_from(self.data, self.pos)
+        self.pos += compiled.size
+        return value
+
     def read_ubyte(self, count=1):
         """
 
         :param count:
         :return:
         """
-        val = struct.unpack('{count}B'.format(count=count), self.data[self.pos:self.pos + count])
-        self.pos += count
-
         if count == 1:
-            return val[0]
-        return val
+            val = self.data[self.pos]
+            self.pos += 1
+            return val
+
+        return self._unpack('B', count)
 
     def read_byte(self, count=1):
         """
@@ -258,8 +366,7 @@ class BinaryArrayData:
         :param count:
         :return:
         """
-        val = struct.unpack('{count}b'.format(count=count), self.data[self.pos:self.pos + count])
-        self.pos += count
+        val = self._unpack('b', count)
 
         if count == 1:
             return val[0]
@@ -291,8 +398,7 @@ class BinaryArrayData:
         :param count:
         :return:
         """
-        val = struct.unpack('{count}H'.format(count=count), self.data[self.pos:self.pos + count * 2])
-        self.pos += 2 * count
+        val = self._unpack('H', count)
 
         if count == 1:
             return val[0]
@@ -304,8 +410,7 @@ class BinaryArrayData:
         :param count:
         :return:
         """
-        val = struct.unpack('{count}h'.format(count=count), self.data[self.pos:self.pos + count * 2])
-        self.pos += 2 * count
+        val = self._unpack('h', count)
 
         if count == 1:
             return val[0]
@@ -338,8 +443,7 @@ class BinaryArrayData:
         :param count:
         :return:
         """
-        value = struct.unpack('{count}I'.format(count=count), self.data[self.pos:self.pos + count * 4])
-        self.pos += 4 * count
+        value = self._unpack('I', count)
         return value[0] if count == 1 else value
 
     def read_int(self, count=1):
@@ -348,10 +452,20 @@ class BinaryArrayData:
         :param count:
         :return:
         """
-        value = struct.unpack('{count}i'.format(count=count), self.data[self.pos:self.pos + count * 4])
-        self.pos += 4 * count
+        value = self._unpack('i', count)
         return value[0] if count == 1 else value
 
+    def read_bytes(self, count=-1):
+        """
+        Read raw bytes, up to the end of the data when count is negative
+        :param count:
+        :return:
+        """
+        end = self.limit if count < 0 else min(self.pos + count, self.limit)
+        value = bytes(self.data[self.pos:end])
+        self.pos = end
+        return value
+
     def read_string(self, length=0):
         """
 
@@ -359,15 +473,9 @@ class BinaryArrayData:
         :return:
         """
 
-        buff = struct.unpack('{length}s'.format(length=length), self.data[self.pos:self.pos + length])
-        self.pos += length
-        string = ''
-        for c in buff:
-            if c == 0:
-                break
-            string += chr(c)
+        buff = self._unpack('s', length)[0]
 
-        return string
+        return buff.split(b'\x00', 1)[0].decode('latin-1')
 
     def peek_string(self, length=0):
         str = self.read_string(length)
@@ -405,3 +513,92 @@ class BinaryArrayData:
         :return:
         """
         self.pos = offset
+
+
+# Bytes kept behind the read position of a BinaryStreamData, for peeks and rewinds
+STREAM_HISTORY = 4096
+
+
+class BinaryStreamData(BinaryArrayData):
+    """
+    BinaryArrayData fed by an iterator of bytes chunks, such as the streaming Format80 decoder. Chunks are
+    pulled only when a read goes past the data received so far.
+
+    Data read more than history bytes ago is dropped, so memory stays bounded whatever the size of the stream.
+    Offsets are positions in the whole stream, seeking back to dropped data raises a ValueError.
+    """
+
+    def __init__(self, chunks, history=STREAM_HISTORY):
+        super().__init__(bytearray())
+        self.chunks = iter(chunks)
+        self.history = history
+
+        # stream position of data[0]
+        self.base = 0
+
+    @property
+    def offset(self):
+        return self.base + self.pos
+
+    def seek(self, offset):
+        if offset < self.base:
+            raise ValueError('offset 0x{offset:X} was dropped from the stream, the data starts at 0x{base:X}'.format(
+                offset=offset, base=self.base))
+
+        self.pos = offset - self.base
+
+    def _fill(self, count):
+        """
+        Pull chunks until count bytes are available from the current position
+        :param count: number of bytes, negative to pull everything
+        :return:
+        """
+        end = self.pos + count
+
+        while count < 0 or self.limit < end:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return
+
+            # drop what was read long ago before growing the data
+            if self.pos > 2 * self.history:
+                dropped = self.pos - self.history
+                del self.data[:dropped]
+                self.base += dropped
+                self.pos -= dropped
+                end -= dropped
+
+            self.data += chunk
+            self.limit = len(self.data)
+
+    def read_ubyte(self, count=1):
+        self._fill(count)
+        return super().read_ubyte(count)
+
+    def read_byte(self, count=1):
+        self._fill(count)
+        return super().read_byte(count)
+
+    def read_ushort(self, count=1):
+        self._fill(count * 2)
+        return super().read_ushort(count)
+
+    def read_short(self, count=1):
+        self._fill(count * 2)
+        return super().read_short(count)
+
+    def read_uint(self, count=1):
+        self._fill(count * 4)
+        return super().read_uint(count)
+
+    def read_int(self, count=1):
+        self._fill(count * 4)
+        return super().read_int(count)
+
+    def read_bytes(self, count=-1):
+        self._fill(count)
+        return super().read_bytes(count)
+
+    def read_string(self, length=0):
+        self._fill(length)
+        return super().read_string(length)
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+
+MANIFEST_FILENAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+
+class BuildCache:
+    """
+    Manifest of the files exported in the build directory.
+
+    Every export is recorded under a key (e.g. 'cps:MENU.CPS') with the version of the exporter, the hash of
+    each input file and the list of files it wrote. An export is up to date when the exporter version and all
+    the input hashes match and all its outputs still exist.
+
+    Input files are hashed at most once per run, and not at all when their size and modification time are
+    the ones recorded with the hash in the manifest.
+
+    Entries recorded since the last call to pop_updates() are kept apart so that worker processes can send
+    them back to the process owning the manifest, which merges them and saves it.
+    """
+
+    def __init__(self, build_dir, filename=MANIFEST_FILENAME):
+        self.filename = os.path.join(build_dir, filename)
+        self.entries = {}
+        self.files = {}
+        self.updates = {}
+        self._hashes = {}
+
+        self.load()
+
+    def load(self):
+        """
+        Read the manifest, a missing, unreadable or outdated manifest is an empty one
+        :return:
+        """
+        self.entries = {}
+        self.files = {}
+
+        try:
+            with open(self.filename, 'r') as handle:
+                manifest = json.load(handle)
+        except (OSError, ValueError):
+            return
+
+        if manifest.get('version') != MANIFEST_VERSION:
+            return
+
+        self.entries = manifest.get('entries', {})
+        self.files = manifest.get('files', {})
+
+    def save(self):
+        """
+        Write the manifest, through a temporary file so that an interrupted run never leaves it truncated
+        :return:
+        """
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'entries': self.entries,
+            'files': self.files,
+        }
+
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w') as handle:
+            json.dump(manifest, handle, indent=True, sort_keys=True)
+
+        os.replace(tmp_filename, self.filename)
+
+    def clear(self):
+        """
+        Forget every export, so that everything is exported again
+        :return:
+        """
+        self.entries = {}
+        self.updates = {}
+        self.save()
+
+    def hash_file(self, filename):
+        """
+        Hash of the content of filename, None if it does not exist
+        :param filename:
+        :return:
+        """
+        if filename in self._hashes:
+            return self._hashes[filename]
+
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+
+        known = self.files.get(filename)
+        if known is not None and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime_ns:
+            digest = known['hash']
+        else:
+            with open(filename, 'rb') as handle:
+                digest = hashlib.sha1(handle.read()).hexdigest()
+
+            self.files[filename] = {
+                'size': stat.st_size,
+                'mtime': stat.st_mtime_ns,
+                'hash': digest,
+            }
+
+        self._hashes[filename] = digest
+        return digest
+
+    def _hash_inputs(self, inputs):
+        return {filename: self.hash_file(filename) for filename in inputs if filename is not None}
+
+    def is_fresh(self, key, version, inputs=None):
+        """
+        Whether the export recorded under key was made by this version of the exporter, from the same inputs,
+        and all its outputs are still there
+        :param key:
+        :param version:
+        :param inputs: input filenames, those recorded with the export if None
+        :return:
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry['version'] != version:
+            return False
+
+        if inputs is None:
+            inputs = list(entry['inputs'])
+
+        if entry['inputs'] != self._hash_inputs(inputs):
+            return False
+
+        return all(os.path.exists(filename) for filename in entry['outputs'])
+
+    def get_result(self, key):
+        """
+        Data recorded along with the export under key
+        :param key:
+        :return:
+        """
+        return self.entries[key].get('result')
+
+    def record(self, key, version, inputs, outputs, result=None):
+        """
+        Record an export
+        :param key:
+        :param version:
+        :param inputs: input filenames
+        :param outputs: filenames written by the export
+        :param result: JSON serializable data needed to rebuild the return value of the exporter when it is
+                       skipped
+        :return:
+        """
+        entry = {
+            'version': version,
+            'inputs': self._hash_inputs(inputs),
+            'outputs': list(outputs),
+            'result': result,
+        }
+
+        self.entries[key] = entry
+        self.updates[key] = entry
+
+    def pop_updates(self):
+        """
+        Entries and file hashes recorded since the last call
+        :return:
+        """
+        updates, self.updates = self.updates, {}
+
+        files = {}
+        for entry in updates.values():
+            for filename in entry['inputs']:
+                if filename in self.files:
+                    files[filename] = self.files[filename]
+
+        return {'entries': updates, 'files': files}
+
+    def merge(self, updates):
+        """
+        Merge the entries recorded by another process
+        :param updates: as returned by pop_updates()
+        :return:
+        """
+        self.entries.update(updates['entries'])
+        self.files.update(updates['files'])
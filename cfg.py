@@ -0,0 +1,369 @@
+import bisect
+
+import tokens
+
+# kinds of edges
+FALL_THROUGH = 'fall through'
+JUMP = 'jump'
+BRANCH = 'branch'  # else branch of a conditional
+CALL = 'call'
+
+
+class BasicBlock:
+    """
+    Tokens of a script which always run in sequence: only the first one is the target of a jump and only the last
+    one transfers control elsewhere.
+    """
+
+    def __init__(self, index, start):
+        self.index = index
+        self.start = start
+        self.offsets = []
+        self.successors = []
+        self.predecessors = []
+
+    def __str__(self):
+        return 'block 0x{start:04X}-0x{end:04X}'.format(start=self.start, end=self.offsets[-1])
+
+
+class ControlFlowGraph:
+    """
+    Basic blocks of a decompiled level script and the edges between them, built from the Jump, End, Return, Call
+    tokens and the else branch of the Conditional tokens.
+
+    Calls are followed into the called code and also fall through to the next token, which is where the Return
+    of the called code comes back, so reachability includes everything a call may run.
+
+    Offsets are the ones of Script.tokens. Dominators and reachability are computed on first use and kept.
+    """
+
+    def __init__(self, script, entries=()):
+        """
+
+        :param script: decompiled Script
+        :param entries: offsets of the tokens the script is started from, usually the triggers offsets
+        """
+        self.script = script
+        self.blocks = []
+        self.edges = {}  # (source block index, target block index) -> kind
+        self.entries = []  # indices of the entry blocks
+        self.invalid_targets = []  # (token offset, target offset) when the target is not the offset of a token
+
+        self._starts = []
+        self._idom = None
+        self._reach = None
+
+        self._build(entries)
+
+    def _build(self, entries):
+        script_tokens = self.script.tokens
+        offsets = sorted(script_tokens)
+        if not offsets:
+            return
+
+        leaders = {offsets[0]}
+        leaders.update(entry for entry in entries if entry in script_tokens)
+
+        for i, offset in enumerate(offsets):
+            token = script_tokens[offset]
+            target = self._get_target(token)
+
+            if target is not None:
+                if target in script_tokens:
+                    leaders.add(target)
+                else:
+                    self.invalid_targets.append((offset, target))
+
+            ends_block = target is not None or isinstance(token, (tokens.End, tokens.Return))
+            if ends_block and i + 1 < len(offsets):
+                leaders.add(offsets[i + 1])
+
+        for offset in offsets:
+            if offset in leaders:
+                block = BasicBlock(len(self.blocks), offset)
+                self.blocks.append(block)
+                self._starts.append(offset)
+
+            self.blocks[-1].offsets.append(offset)
+
+        block_indices = {block.start: block.index for block in self.blocks}
+
+        for block in self.blocks:
+            token = script_tokens[block.offsets[-1]]
+            target = block_indices.get(self._get_target(token))
+
+            if isinstance(token, (tokens.End, tokens.Return)):
+                continue
+
+            if isinstance(token, tokens.Jump):
+                if target is not None:
+                    self._add_edge(block, target, JUMP)
+                continue
+
+            if target is not None:
+                self._add_edge(block, target, CALL if isinstance(token, tokens.Call) else BRANCH)
+
+            if block.index + 1 < len(self.blocks):
+                self._add_edge(block, block.index + 1, FALL_THROUGH)
+
+        self.entries = sorted({block_indices[entry] for entry in entries if entry in block_indices})
+        if not self.entries:
+            self.entries = [0]
+
+    @staticmethod
+    def _get_target(token):
+        if isinstance(token, tokens.Jump):
+            return token.addr
+
+        if isinstance(token, (tokens.Conditional, tokens.Call)):
+            return token.target
+
+        return None
+
+    def _add_edge(self, block, target_index, kind):
+        if (block.index, target_index) in self.edges:
+            return
+
+        self.edges[(block.index, target_index)] = kind
+        block.successors.append(target_index)
+        self.blocks[target_index].predecessors.append(block.index)
+
+    def block_at(self, offset):
+        """
+        Block holding the token at offset
+        :param offset:
+        :return: BasicBlock or None if there's no token at offset
+        """
+        if offset not in self.script.tokens:
+            return None
+
+        return self.blocks[bisect.bisect_right(self._starts, offset) - 1]
+
+    def _get_index(self, offset):
+        block = self.block_at(offset)
+        if block is None:
+            raise KeyError('no token at offset 0x{offset:04X}'.format(offset=offset))
+
+        return block.index
+
+    # region Reachability
+
+    def _compute_reachability(self):
+        """
+        Blocks reachable from every block, as bitsets of block indices. The strongly connected components are
+        found with Tarjan's algorithm, which yields them successors first, so the reachable set of a component
+        is its own blocks plus the sets of the components it leads to.
+        """
+        count = len(self.blocks)
+        index = [None] * count
+        low = [0] * count
+        on_stack = [False] * count
+        stack = []
+        component_of = [None] * count
+        component_reach = []
+        counter = 0
+
+        for root in range(count):
+            if index[root] is not None:
+                continue
+
+            work = [(root, 0)]
+            while work:
+                node, i = work.pop()
+                successors = self.blocks[node].successors
+
+                if i == 0:
+                    index[node] = low[node] = counter
+                    counter += 1
+                    stack.append(node)
+                    on_stack[node] = True
+                elif on_stack[successors[i - 1]]:
+                    # back from successors[i - 1]
+                    low[node] = min(low[node], low[successors[i - 1]])
+
+                descended = False
+                while i < len(successors):
+                    successor = successors[i]
+                    i += 1
+
+                    if index[successor] is None:
+                        work.append((node, i))
+                        work.append((successor, 0))
+                        descended = True
+                        break
+
+                    if on_stack[successor]:
+                        low[node] = min(low[node], index[successor])
+
+                if descended or low[node] != index[node]:
+                    continue
+
+                component = len(component_reach)
+                reach = 0
+                members = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component_of[member] = component
+                    reach |= 1 << member
+                    members.append(member)
+                    if member == node:
+                        break
+
+                for member in members:
+                    for successor in self.blocks[member].successors:
+                        if component_of[successor] != component:
+                            reach |= component_reach[component_of[successor]]
+
+                component_reach.append(reach)
+
+        self._reach = [component_reach[component_of[block]] for block in range(count)]
+
+    def _get_reach(self, block_index):
+        if self._reach is None:
+            self._compute_reachability()
+
+        return self._reach[block_index]
+
+    def can_reach(self, source, target):
+        """
+        Whether the token at offset target can run after the token at offset source
+        :param source:
+        :param target:
+        :return:
+        """
+        source_index = self._get_index(source)
+        target_index = self._get_index(target)
+
+        if source_index == target_index and source > target:
+            # earlier token of the same block, only reachable through a cycle
+            return any(self._get_reach(successor) >> source_index & 1
+                       for successor in self.blocks[source_index].successors)
+
+        return bool(self._get_reach(source_index) >> target_index & 1)
+
+    def reachable_blocks(self, offset):
+        """
+        Blocks which can run once the block holding offset started, itself included
+        :param offset:
+        :return: list of BasicBlock in offset order
+        """
+        reach = self._get_reach(self._get_index(offset))
+
+        return [block for block in self.blocks if reach >> block.index & 1]
+
+    def reachable_offsets(self, offset):
+        """
+        Offsets of the tokens which can run once the block holding offset started
+        :param offset:
+        :return: sorted list of offsets
+        """
+        return [token_offset for block in self.reachable_blocks(offset) for token_offset in block.offsets]
+
+    # endregion
+
+    # region Dominators
+
+    def _compute_dominators(self):
+        """
+        Immediate dominators from the entries, with the iterative algorithm of Cooper, Harvey and Kennedy. A
+        virtual root precedes all the entries, the entries themselves have no immediate dominator.
+        """
+        root = len(self.blocks)
+
+        # reverse postorder from the entries
+        postorder = []
+        visited = set(self.entries)
+        for entry in self.entries:
+            work = [(entry, 0)]
+            while work:
+                node, i = work.pop()
+                successors = self.blocks[node].successors
+                if i < len(successors):
+                    work.append((node, i + 1))
+                    if successors[i] not in visited:
+                        visited.add(successors[i])
+                        work.append((successors[i], 0))
+                else:
+                    postorder.append(node)
+
+        order = [root] + postorder[::-1]
+        number = {node: i for i, node in enumerate(order)}
+        entries = set(self.entries)
+
+        idom = {root: root}
+
+        def intersect(a, b):
+            while a != b:
+                while number[a] > number[b]:
+                    a = idom[a]
+                while number[b] > number[a]:
+                    b = idom[b]
+            return a
+
+        changed = True
+        while changed:
+            changed = False
+            for node in order[1:]:
+                predecessors = [p for p in self.blocks[node].predecessors if p in idom]
+                if node in entries:
+                    predecessors.append(root)
+
+                new_idom = predecessors[0]
+                for predecessor in predecessors[1:]:
+                    new_idom = intersect(predecessor, new_idom)
+
+                if idom.get(node) != new_idom:
+                    idom[node] = new_idom
+                    changed = True
+
+        del idom[root]
+        self._idom = {node: (None if parent == root else parent) for node, parent in idom.items()}
+
+    def immediate_dominator(self, offset):
+        """
+        Closest block which runs before the block holding offset on every path from the entries
+        :param offset:
+        :return: BasicBlock, None for the entry blocks and the blocks the entries can't reach
+        """
+        if self._idom is None:
+            self._compute_dominators()
+
+        parent = self._idom.get(self._get_index(offset))
+        return None if parent is None else self.blocks[parent]
+
+    def dominators(self, offset):
+        """
+        Blocks which run before the block holding offset on every path from the entries, itself included
+        :param offset:
+        :return: list of BasicBlock from the block holding offset up to its entry, empty if the block is not
+                 reachable from the entries
+        """
+        if self._idom is None:
+            self._compute_dominators()
+
+        node = self._get_index(offset)
+        if node not in self._idom:
+            return []
+
+        blocks = []
+        while node is not None:
+            blocks.append(self.blocks[node])
+            node = self._idom[node]
+
+        return blocks
+
+    def dominates(self, dominator, offset):
+        """
+        Whether the token at offset dominator runs before the token at offset on every path from the entries
+        :param dominator:
+        :param offset:
+        :return:
+        """
+        dominator_index = self._get_index(dominator)
+        if dominator_index == self._get_index(offset):
+            return dominator <= offset and bool(self.dominators(offset))
+
+        return any(block.index == dominator_index for block in self.dominators(offset))
+
+    # endregion
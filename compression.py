@@ -1,3 +1,6 @@
+import struct
+
+
 def decode_format80_image(reader):
     size = reader.read_ushort()
     format_type = reader.read_ushort()
@@ -7,18 +10,43 @@ def decode_format80_image(reader):
     if format_type != 0x4:
         raise TypeError("Expected format type 4 but got type %d" % format_type)
 
-    data = [0] * (uncompressed + palette_size + 1)  # (uncompressed + palette_size + 1)
-    data[0] = palette_size
+    data = [palette_size]
 
     if palette_size > 0:
-        data[1:palette_size + 1] = reader.read_ubyte(palette_size)
+        data.extend(reader.read_ubyte(palette_size))
 
-    img_data = _decode_data(reader, data[palette_size + 1:])
-    data[palette_size + 1:] = img_data
+    data.extend(_decode_reader(reader, uncompressed))
 
     return data
 
 
+def decode_format80_image_bytes(reader):
+    """
+    Same as decode_format80_image without building a list of ints.
+
+    :param reader:
+    :return: (palette, pixels) where palette holds the 6-bit color components of the inline palette (empty if
+             there's none) and pixels is a bytearray of palette indices
+    """
+    size = reader.read_ushort()
+    format_type = reader.read_ushort()
+    uncompressed = reader.read_uint()
+    palette_size = reader.read_ushort()
+
+    if format_type != 0x4:
+        raise TypeError("Expected format type 4 but got type %d" % format_type)
+
+    start = reader.offset
+    src = memoryview(reader.read_bytes())
+    palette = bytes(src[:palette_size])
+
+    pixels = bytearray(uncompressed)
+    consumed = decode_format80_buffer(src, pixels, palette_size)
+    reader.seek(start + consumed)
+
+    return palette, pixels
+
+
 def decode_format80(reader):
     """
     Output format:
@@ -27,6 +55,8 @@ def decode_format80(reader):
     If there's no inline palette definition then the number of palette colors is zero
     and the palette indices follow immediately.
 
+    The decoded data is returned as a bytearray of `uncompressed` bytes.
+
     :param reader:
     :return:
     """
@@ -38,69 +68,536 @@ def decode_format80(reader):
     if format_type != 0x4:
         raise TypeError("Expected format type 4 but got type %d" % format_type)
 
-    data = [0] * uncompressed
-    _decode_data(reader, data)
+    return _decode_reader(reader, uncompressed)
 
-    return data
 
+def decode_format80_buffer(src, dst, src_offset=0):
+    """
+    Decode a Format80 command stream held in memory.
+
+    :param src: compressed commands, any object supporting the buffer protocol (bytes, bytearray, mmap...)
+    :param dst: preallocated bytearray that receives the decoded data
+    :param src_offset: offset of the first command within src
+    :return: the offset within src right after the end code
+    """
+    size = len(dst)
+    src_offset = _decode_data(src, dst, src_offset)
 
-def _decode_data(reader, dst_data):
+    if len(dst) != size:
+        raise ValueError("Format80 data overflows the expected size of %d bytes" % size)
+
+    return src_offset
+
+
+def _decode_reader(reader, uncompressed):
+    """
+    Decode the commands following the header of a Format80 file and leave the reader
+    positioned right after the end code.
+
+    :param reader:
+    :param uncompressed:
+    :return:
+    """
+    start = reader.offset
+    src = reader.read_bytes()
+
+    dst = bytearray(uncompressed)
+    consumed = decode_format80_buffer(src, dst)
+    reader.seek(start + consumed)
+
+    return dst
+
+
+def _decode_data(src, dst, src_offset=0):
+    src_pos = src_offset
     dst_offset = 0
 
     while True:
-        code = reader.read_ubyte()
+        code = src[src_pos]
+        src_pos += 1
+
+        # 0b0#######
+        # command 0 (0cccpppp p): copy
+        if code & 0x80 == 0:
+            count = ((code & 0x70) >> 4) + 3
+            offset = dst_offset - (src[src_pos] + ((code & 0x0F) << 8))
+            src_pos += 1
 
-        # end code
-        if code == 0x80:
-            return dst_data
+            if 0 <= offset and offset + count <= dst_offset:
+                dst[dst_offset:dst_offset + count] = dst[offset:offset + count]
+            else:
+                _copy_overlapping(dst, offset, dst_offset, count)
+            dst_offset += count
 
         # 0b10######
-        elif code & 0xC0 == 0x80:
+        elif code & 0x40 == 0:
             count = code & 0x3F
 
+            # end code
             if count == 0:
-                return dst_data
+                return src_pos
 
-            for i in range(count):
-                dst_data[dst_offset] = reader.read_ubyte()
-                dst_offset += 1
+            dst[dst_offset:dst_offset + count] = src[src_pos:src_pos + count]
+            src_pos += count
+            dst_offset += count
 
         # 0b11######
-        elif code & 0xC0 == 0xC0:
+        else:
             count = code & 0x3F
 
             # Large copy
             if count < 0x3E:
                 # command 2 (11cccccc p p): copy
                 count += 3
-                offset = reader.read_ushort()
-                for i in range(offset, offset + count):
-                    dst_data[dst_offset] = dst_data[i]
-                    dst_offset += 1
+                offset = src[src_pos] | (src[src_pos + 1] << 8)
+                src_pos += 2
 
             # Very large copy
             elif count == 0x3E:
-                # pass
                 # command 3 (11111110 c c v): fill
-                count = reader.read_ushort()
-                value = reader.read_ubyte()
-                for i in range(count):
-                    dst_data[dst_offset] = value
-                    dst_offset += 1
+                count = src[src_pos] | (src[src_pos + 1] << 8)
+                dst[dst_offset:dst_offset + count] = bytes((src[src_pos + 2],)) * count
+                src_pos += 3
+                dst_offset += count
+                continue
+
             else:
                 # command 4 (copy 11111111 c c p p): copy
-                count = reader.read_ushort()
-                offset = reader.read_ushort()
-                for i in range(offset, offset + count):
-                    dst_data[dst_offset] = dst_data[i]
-                    dst_offset += 1
+                count = src[src_pos] | (src[src_pos + 1] << 8)
+                offset = src[src_pos + 2] | (src[src_pos + 3] << 8)
+                src_pos += 4
+
+            if offset + count <= dst_offset:
+                dst[dst_offset:dst_offset + count] = dst[offset:offset + count]
+            else:
+                _copy_overlapping(dst, offset, dst_offset, count)
+            dst_offset += count
+
+
+def _copy_overlapping(dst, offset, dst_offset, count):
+    """
+    Copy where the source range runs into the bytes being written. The original decoder copies
+    byte by byte, so the already emitted part of the range repeats itself.
+    """
+    period = dst_offset - offset
+
+    if 0 <= offset and 0 < period:
+        pattern = dst[offset:dst_offset]
+        dst[dst_offset:dst_offset + count] = (pattern * (count // period + 1))[:count]
+        return
+
+    for i in range(offset, offset + count):
+        dst[dst_offset] = dst[i]
+        dst_offset += 1
+
+
+# Size of the chunks produced by the streaming decoder
+FORMAT80_CHUNK_SIZE = 4096
+
+# Absolute copies read at most 0xFFFF bytes from at most offset 0xFFFF, relative copies reach 0xFFF bytes back
+_ABSOLUTE_REACH = 0xFFFF + 0xFFFF
+_RELATIVE_REACH = 0xFFF
+
+
+def iter_decode_format80(reader, chunk_size=FORMAT80_CHUNK_SIZE):
+    """
+    Streaming counterpart of decode_format80. The header and the compressed commands are read right away
+    so the reader can be closed before the data is consumed.
+
+    :param reader:
+    :param chunk_size:
+    :return: iterator over bytes chunks of chunk_size bytes (the last one may be shorter)
+    """
+    size = reader.read_ushort()
+    format_type = reader.read_ushort()
+    uncompressed = reader.read_uint()
+    palette_size = reader.read_ushort()
+
+    if format_type != 0x4:
+        raise TypeError("Expected format type 4 but got type %d" % format_type)
+
+    return iter_decode_format80_buffer(reader.read_bytes(), 0, chunk_size, uncompressed)
+
+
+def iter_decode_format80_buffer(src, src_offset=0, chunk_size=FORMAT80_CHUNK_SIZE, uncompressed=None):
+    """
+    Decode a Format80 command stream and yield the output in chunks as soon as they are complete.
+
+    Only the data copy commands can still reach is kept: the first 128KB of output, the target of the
+    absolute copies, and the last 4KB, the window of the relative copies. Memory is bounded by these 132KB
+    plus a chunk, so it only saves memory on outputs larger than 128KB: smaller ones are kept whole.
+
+    :param src: compressed commands, any object supporting the buffer protocol
+    :param src_offset: offset of the first command within src
+    :param chunk_size:
+    :param uncompressed: expected output size, shorter outputs are padded with zeros once the end code is reached
+    :return:
+    """
+    # decoded data, window[0] being at output position base
+    window = bytearray()
+    base = 0
+    # first _ABSOLUTE_REACH bytes of output, once the window moved past them
+    head = None
+    emitted = 0
+
+    src_pos = src_offset
+
+    while True:
+        code = src[src_pos]
+        src_pos += 1
+        dst_offset = base + len(window)
 
-        # 0b0#######
         # command 0 (0cccpppp p): copy
-        elif code & 0x80 == 0:
+        if code & 0x80 == 0:
             count = ((code & 0x70) >> 4) + 3
-            offset = reader.read_ubyte() + ((code & 0x0F) << 8)
-            offset = dst_offset - offset
-            for i in range(offset, offset + count):
-                dst_data[dst_offset] = dst_data[i]
-                dst_offset += 1
+            offset = dst_offset - (src[src_pos] + ((code & 0x0F) << 8))
+            src_pos += 1
+
+        # 0b10######
+        elif code & 0x40 == 0:
+            count = code & 0x3F
+
+            # end code
+            if count == 0:
+                break
+
+            window += src[src_pos:src_pos + count]
+            src_pos += count
+            offset = None
+
+        else:
+            count = code & 0x3F
+
+            if count < 0x3E:
+                # command 2 (11cccccc p p): copy
+                count += 3
+                offset = src[src_pos] | (src[src_pos + 1] << 8)
+                src_pos += 2
+
+            elif count == 0x3E:
+                # command 3 (11111110 c c v): fill
+                count = src[src_pos] | (src[src_pos + 1] << 8)
+                window += bytes((src[src_pos + 2],)) * count
+                src_pos += 3
+                offset = None
+
+            else:
+                # command 4 (copy 11111111 c c p p): copy
+                count = src[src_pos] | (src[src_pos + 1] << 8)
+                offset = src[src_pos + 2] | (src[src_pos + 3] << 8)
+                src_pos += 4
+
+        if offset is not None:
+            if base <= offset and offset + count <= dst_offset:
+                window += window[offset - base:offset - base + count]
+            elif head is not None and 0 <= offset and offset + count <= _ABSOLUTE_REACH:
+                window += head[offset:offset + count]
+            else:
+                _stream_copy(window, base, head, offset, count, uncompressed)
+
+        # flush complete chunks
+        while base + len(window) - emitted >= chunk_size:
+            yield bytes(window[emitted - base:emitted - base + chunk_size])
+            emitted += chunk_size
+
+        # slide the window, keeping what the copy commands can still reach
+        keep_from = min(emitted, base + len(window) - _RELATIVE_REACH)
+        if keep_from - base > max(chunk_size, _RELATIVE_REACH) and base + len(window) > _ABSOLUTE_REACH:
+            if head is None:
+                head = bytes(window[:_ABSOLUTE_REACH])
+            del window[:keep_from - base]
+            base = keep_from
+
+    if uncompressed is not None:
+        if base + len(window) > uncompressed:
+            raise ValueError("Format80 data overflows the expected size of %d bytes" % uncompressed)
+
+        # like the preallocated output of decode_format80, what the commands didn't write is zeros
+        window += bytes(uncompressed - base - len(window))
+
+    # the tail is cut in chunks as well
+    while emitted < base + len(window):
+        yield bytes(window[emitted - base:emitted - base + chunk_size])
+        emitted += chunk_size
+
+
+def _stream_copy(window, base, head, offset, count, uncompressed=None):
+    """
+    Slow path of the streaming decoder: byte by byte copy, for copies overlapping the bytes being
+    written or reaching outside the data decoded so far. Like decode_format80, which reads from its
+    preallocated output, negative offsets wrap around the expected size and bytes not decoded yet are zeros.
+    """
+    period = base + len(window) - offset
+
+    if base <= offset and 0 < period:
+        pattern = window[offset - base:]
+        window += (pattern * (count // period + 1))[:count]
+        return
+
+    for i in range(offset, offset + count):
+        dst_offset = base + len(window)
+
+        if uncompressed is not None:
+            if not -uncompressed <= i < uncompressed:
+                raise IndexError("Format80 copy from offset %d is outside of the %d bytes of output" % (
+                    i, uncompressed))
+            if i < 0:
+                i += uncompressed
+
+        if i < 0 or i >= dst_offset:
+            value = 0
+        elif i >= base:
+            value = window[i - base]
+        elif head is not None and i < len(head):
+            value = head[i]
+        else:
+            raise ValueError("Format80 copy from offset %d is outside of the decoding window" % i)
+
+        window.append(value)
+
+
+# Maximum number of candidates examined per position by the match finder
+ENCODER_CHAIN_DEPTH = 32
+
+_MIN_MATCH = 3
+_MAX_LITERALS = 0x3F
+_MAX_RELATIVE_COUNT = 10
+_MAX_RELATIVE_DISTANCE = 0xFFF
+_MAX_ABSOLUTE_COUNT = 0x3D + 3
+_MAX_LONG_COUNT = 0xFFFF
+_MAX_ABSOLUTE_OFFSET = 0xFFFF
+
+
+def encode_format80_image(data, palette=b''):
+    """
+    Build a complete Format80 file (CPS, VCN, INF...) around the compressed data. This is the inverse
+    of decode_format80_image.
+
+    :param data: uncompressed data
+    :param palette: optional inline palette, stored uncompressed right after the header
+    :return: bytes
+    """
+    payload = encode_format80(data)
+    header = struct.pack('<HHIH', 8 + len(palette) + len(payload), 0x4, len(data), len(palette))
+
+    return header + bytes(palette) + payload
+
+
+def encode_format80(data, chain_depth=ENCODER_CHAIN_DEPTH):
+    """
+    Compress data into a Format80 command stream, terminated by the end code.
+
+    Matches are searched with hash chains over 3 bytes sequences. Each position greedily takes the command
+    saving the most bytes among:
+        0cccpppp p          relative copy of 3 to 10 bytes up to 4095 bytes back
+        11cccccc p p        absolute copy of 3 to 64 bytes
+        11111111 c c p p    absolute copy of up to 65535 bytes
+        11111110 c c v      fill
+    and falls back to 10cccccc literal runs otherwise.
+
+    :param data: uncompressed data, any object supporting the buffer protocol
+    :param chain_depth: maximum number of candidates examined per position
+    :return: bytes
+    """
+    data = bytes(data)
+    size = len(data)
+    out = bytearray()
+
+    runs = _run_lengths(data)
+    head = {}
+    chain = [-1] * size
+
+    literals = 0
+    pos = 0
+
+    while pos < size:
+        best_gain = 0
+        best_count = 0
+        best_command = None
+
+        # fill
+        run = runs[pos]
+        if run > 4:
+            best_count = min(run, _MAX_LONG_COUNT)
+            best_gain = best_count - 4
+            best_command = bytes((0xFE, best_count & 0xFF, best_count >> 8, data[pos]))
+
+        # copies
+        key = data[pos:pos + _MIN_MATCH]
+        candidate = head.get(key, -1)
+        limit = min(size - pos, _MAX_LONG_COUNT)
+        depth = chain_depth
+
+        while candidate >= 0 and depth > 0:
+            depth -= 1
+            distance = pos - candidate
+
+            if distance > _MAX_RELATIVE_DISTANCE and candidate > _MAX_ABSOLUTE_OFFSET:
+                candidate = chain[candidate]
+                continue
+
+            count = _match_length(data, candidate, pos, limit)
+            if count < _MIN_MATCH:
+                candidate = chain[candidate]
+                continue
+
+            if distance <= _MAX_RELATIVE_DISTANCE and (count <= _MAX_RELATIVE_COUNT or candidate > _MAX_ABSOLUTE_OFFSET):
+                count = min(count, _MAX_RELATIVE_COUNT)
+                gain = count - 2
+            elif count <= _MAX_ABSOLUTE_COUNT:
+                gain = count - 3
+            else:
+                gain = count - 5
+
+            if gain > best_gain:
+                best_gain = gain
+                best_count = count
+                if distance <= _MAX_RELATIVE_DISTANCE and count <= _MAX_RELATIVE_COUNT:
+                    best_command = bytes((((count - 3) << 4) | (distance >> 8), distance & 0xFF))
+                elif count <= _MAX_ABSOLUTE_COUNT:
+                    best_command = bytes((0xC0 | (count - 3), candidate & 0xFF, candidate >> 8))
+                else:
+                    best_command = bytes((0xFF, count & 0xFF, count >> 8, candidate & 0xFF, candidate >> 8))
+
+                if count == limit:
+                    break
+
+            candidate = chain[candidate]
+
+        if best_command is None:
+            _insert(head, chain, data, pos)
+            literals += 1
+            pos += 1
+            continue
+
+        if literals:
+            _emit_literals(out, data, pos - literals, pos)
+            literals = 0
+
+        out += best_command
+        for i in range(pos, pos + best_count):
+            _insert(head, chain, data, i)
+        pos += best_count
+
+    if literals:
+        _emit_literals(out, data, pos - literals, pos)
+
+    # end code
+    out.append(0x80)
+
+    return bytes(out)
+
+
+def _insert(head, chain, data, pos):
+    key = data[pos:pos + _MIN_MATCH]
+    chain[pos] = head.get(key, -1)
+    head[key] = pos
+
+
+def _match_length(data, candidate, pos, limit):
+    """
+    Number of bytes at pos that repeat the bytes at candidate. The ranges may overlap, the decoder
+    replays the copy byte by byte.
+    """
+    count = 0
+    while count + 32 <= limit and data[candidate + count:candidate + count + 32] == data[pos + count:pos + count + 32]:
+        count += 32
+
+    while count < limit and data[candidate + count] == data[pos + count]:
+        count += 1
+
+    return count
+
+
+def _run_lengths(data):
+    """
+    For every position, the number of identical bytes starting there.
+    """
+    size = len(data)
+    runs = [1] * size
+
+    for i in range(size - 2, -1, -1):
+        if data[i] == data[i + 1]:
+            runs[i] = runs[i + 1] + 1
+
+    return runs
+
+
+def _emit_literals(out, data, start, end):
+    # command 1 (10cccccc): literal bytes
+    while start < end:
+        count = min(end - start, _MAX_LITERALS)
+        out.append(0x80 | count)
+        out += data[start:start + count]
+        start += count
+
+
+def _pack_files(args):
+    import os
+    import time
+
+    from binary_reader import BinaryReader
+
+    os.makedirs(args.output, exist_ok=True)
+    mismatches = 0
+
+    for filename in args.files:
+        basename = os.path.basename(filename)
+
+        if args.repack:
+            with BinaryReader(filename) as reader:
+                decoded = decode_format80_image(reader)
+            palette = bytes(decoded[1:decoded[0] + 1])
+            data = bytes(decoded[decoded[0] + 1:])
+            output_filename = os.path.join(args.output, basename)
+        else:
+            with open(filename, 'rb') as handle:
+                data = handle.read()
+            palette = b''
+            if args.palette:
+                with open(args.palette, 'rb') as handle:
+                    palette = handle.read()
+            output_filename = os.path.join(args.output, os.path.splitext(basename)[0] + '.CPS')
+
+        start = time.perf_counter()
+        packed = encode_format80_image(data, palette)
+        encode_time = time.perf_counter() - start
+
+        with open(output_filename, 'wb') as handle:
+            handle.write(packed)
+
+        if not args.verify:
+            print('{name}: {size} -> {packed} bytes'.format(name=basename, size=len(data), packed=len(packed)))
+            continue
+
+        start = time.perf_counter()
+        decoded = bytearray(len(data))
+        decode_format80_buffer(packed, decoded, 10 + len(palette))
+        decode_time = time.perf_counter() - start
+
+        ok = decoded == data
+        if not ok:
+            mismatches += 1
+
+        print('{name}: {size} -> {packed} bytes ({ratio:.1%}), encode {enc:.2f} MB/s, decode {dec:.2f} MB/s, {status}'.format(
+            name=basename, size=len(data), packed=len(packed), ratio=len(packed) / max(len(data), 1),
+            enc=len(data) / 1e6 / max(encode_time, 1e-9), dec=len(data) / 1e6 / max(decode_time, 1e-9),
+            status='OK' if ok else 'MISMATCH'))
+
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Compress files to the Format80 (CPS) container')
+    parser.add_argument('files', nargs='+', help='files to compress')
+    parser.add_argument('-o', '--output', default='build/', help='output directory')
+    parser.add_argument('--repack', action='store_true',
+                        help='inputs are Format80 files (CPS, VCN, INF...) to decode and compress again')
+    parser.add_argument('--palette', help='raw 768 bytes palette to store inline, ignored with --repack')
+    parser.add_argument('--verify', action='store_true',
+                        help='decode the output and report compression ratio and throughput')
+
+    sys.exit(_pack_files(parser.parse_args()))
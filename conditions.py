@@ -1,13 +1,60 @@
+import operator
 
 from entities import *
 from flags import races, classes, directions
 
+# condition opcode -> decoder(reader, opcode) returning the condition token. The opcodes missing from the table
+# are values pushed on the stack, see ConditionalPushValue
+CONDITION_DECODERS = {}
 
+
+def register_condition_decoder(opcodes, decoder):
+    """
+    Decode the given condition opcodes with decoder(reader, opcode), replacing their current decoder if any
+
+    :param opcodes:
+    :param decoder:
+    :return:
+    """
+    for opcode in opcodes:
+        CONDITION_DECODERS[opcode] = decoder
+
+
+def register_condition(*opcodes):
+    """
+    Class decorator registering the condition token class decoding the given opcodes with token_class(reader)
+
+    :param opcodes:
+    :return:
+    """
+    def register(token_class):
+        register_condition_decoder(opcodes, lambda reader, opcode: token_class(reader))
+        return token_class
+
+    return register
+
+
+# condition operator opcode -> function(left, right)
+OPERATORS = {
+    0xff: operator.eq,
+    0xfe: operator.ne,
+    0xfd: operator.lt,
+    0xfc: operator.le,
+    0xfb: operator.gt,
+    0xfa: operator.ge,
+    0xf9: lambda left, right: bool(left) and bool(right),
+    0xf8: lambda left, right: bool(left) or bool(right),
+}
+
+
+@register_condition(0xd7)
 class ConditionalD7:
     """
 
     """
 
+    __slots__ = ('value',)
+
     def __init__(self, reader):
         """
 
@@ -29,6 +76,10 @@ class ConditionalD7:
 
         self.value = reader.read_ubyte()
 
+    def compile(self):
+        value = self.value
+        return lambda state: state.get_unknown(0xD7, value)
+
     def run(self):
 
         return "condition 0xD7(0x{value:02X})".format(
@@ -36,11 +87,14 @@ class ConditionalD7:
         )
 
 
+@register_condition(0xdf)
 class ConditionalDF:
     """
 
     """
 
+    __slots__ = ('value',)
+
     def __init__(self, reader):
         """
 
@@ -62,16 +116,22 @@ class ConditionalDF:
 
         # self.value = reader.read_ubyte()
 
+    def compile(self):
+        return lambda state: state.get_unknown(0xDF)
+
     def run(self):
 
         return "condition 0xDF()".format(value=self.value)
 
 
+@register_condition(0xdb)
 class ConditionalThrowDice:
     """
 
     """
 
+    __slots__ = ('dice',)
+
     def __init__(self, reader):
         """
 
@@ -93,16 +153,23 @@ class ConditionalThrowDice:
 
         self.dice = Dice(reader)
 
+    def compile(self):
+        dice = self.dice
+        return lambda state: state.roll(dice)
+
     def run(self):
 
         return "throw dice {dice}".format(dice=self.dice)
 
 
+@register_condition(0xe4)
 class ConditionalMenuChoice:
     """
 
     """
 
+    __slots__ = ('type', 'value')
+
     def __init__(self, reader):
         """
 
@@ -126,16 +193,26 @@ class ConditionalMenuChoice:
         self.type = reader.read_ubyte()
         self.value = reader.read_ushort()
 
+    def compile(self):
+        """
+        :return: functions(state) returning the two values pushed on the stack
+        """
+        value = self.value
+        return (lambda state: state.menu_choice), (lambda state: value)
+
     def run(self):
 
         return "push menu choice, Push 0x{value:04X}".format(value=self.value)
 
 
+@register_condition(0xd2)
 class ConditionalimmediateShort:
     """
 
     """
 
+    __slots__ = ('value',)
+
     def __init__(self, reader):
         """
 
@@ -157,6 +234,10 @@ class ConditionalimmediateShort:
 
         self.value = reader.read_ushort()
 
+    def compile(self):
+        value = self.value
+        return lambda state: value
+
     def run(self):
 
         return "value 0x{value:04X}".format(value=self.value)
@@ -167,6 +248,8 @@ class ConditionalOperator:
 
     """
 
+    __slots__ = ('operator', 'text')
+
     def __init__(self, value=None):
         """
 
@@ -195,16 +278,28 @@ class ConditionalOperator:
         elif self.operator == 0xf8: self.text = " OR "
         else: self.text = " [??] "
 
+    def compile(self, left, right):
+        """
+        :param left: function(state) returning the first operand
+        :param right: function(state) returning the second operand
+        :return: function(state) returning the result, both operands are always evaluated
+        """
+        apply = OPERATORS[self.operator]
+        return lambda state: int(apply(left(state), right(state)))
+
     def run(self):
 
         return "{value}".format(value=self.text)
 
 
+@register_condition(0xdc)
 class ConditionalContainClass:
     """
 
     """
 
+    __slots__ = ('id',)
+
     def __init__(self, reader):
         """
 
@@ -226,17 +321,24 @@ class ConditionalContainClass:
 
         self.id = reader.read_byte()
 
+    def compile(self):
+        class_ = self.id
+        return lambda state: state.has_class(class_)
+
     def run(self):
 
         return "check if character with class {name} is present"\
             .format(name=classes[self.id])
 
 
+@register_condition(0xce)
 class ConditionalContainAlignment:
     """
 
     """
 
+    __slots__ = ('id',)
+
     def __init__(self, reader):
         """
 
@@ -258,16 +360,23 @@ class ConditionalContainAlignment:
 
         self.id = reader.read_ubyte()
 
+    def compile(self):
+        alignment = self.id
+        return lambda state: state.has_alignment(alignment)
+
     def run(self):
 
         return "need alignment {id}".format(id=self.id)
 
 
+@register_condition(0xdd)
 class ConditionalContainRace:
     """
 
     """
 
+    __slots__ = ('id',)
+
     def __init__(self, reader):
         """
 
@@ -289,16 +398,23 @@ class ConditionalContainRace:
 
         self.id = reader.read_ubyte()
 
+    def compile(self):
+        race = self.id
+        return lambda state: state.has_race(race)
+
     def run(self):
 
         return "check if character with race {race} is present".format(race=races[self.id])
 
 
+@register_condition(0xe0)
 class ConditionalGetTriggerFlag:
     """
 
     """
 
+    __slots__ = ()
+
     def __init__(self, reader):
         """
 
@@ -316,16 +432,22 @@ class ConditionalGetTriggerFlag:
         if not reader:
             return
 
+    def compile(self):
+        return lambda state: state.trigger_flags
+
     def run(self):
 
         return "get trigger flag"
 
 
+@register_condition(0xef)
 class ConditionalGetLevelFlag:
     """
 
     """
 
+    __slots__ = ('flag',)
+
     def __init__(self, reader):
         """
 
@@ -348,6 +470,10 @@ class ConditionalGetLevelFlag:
 
         self.flag = reader.read_ubyte()
 
+    def compile(self):
+        flag = self.flag
+        return lambda state: state.get_level_flag(flag)
+
     def run(self):
 
         return "get level flag {flag}".format(flag=self.flag)
@@ -358,6 +484,8 @@ class ConditionalSetLevelFlag:
 
     """
 
+    __slots__ = ('flag',)
+
     def __init__(self, reader):
         """
 
@@ -385,11 +513,14 @@ class ConditionalSetLevelFlag:
         return "set level flag {flag}".format(flag=self.flag)
 
 
+@register_condition(0xf0)
 class ConditionalGetGlobalFlag:
     """
 
     """
 
+    __slots__ = ('flag',)
+
     def __init__(self, reader):
         """
 
@@ -412,6 +543,10 @@ class ConditionalGetGlobalFlag:
 
         self.flag = reader.read_ubyte()
 
+    def compile(self):
+        flag = self.flag
+        return lambda state: state.get_global_flag(flag)
+
     def run(self):
 
         return "get global flag {flag}".format(flag=self.flag)
@@ -422,6 +557,8 @@ class ConditionalSetGlobalFlag:
 
     """
 
+    __slots__ = ('flag',)
+
     def __init__(self, reader):
         """
 
@@ -449,11 +586,14 @@ class ConditionalSetGlobalFlag:
         return "set Global flag {flag}".format(flag=self.flag)
 
 
+@register_condition(0xe9)
 class ConditionalGetWallSide:
     """
 
     """
 
+    __slots__ = ('side', 'location')
+
     def __init__(self, reader):
         """
 
@@ -478,16 +618,23 @@ class ConditionalGetWallSide:
         self.side = reader.read_ubyte()
         self.location = Location(reader)
 
+    def compile(self):
+        side, location = self.side, self.location
+        return lambda state: state.get_wall(location, side)
+
     def run(self):
 
         return "wall side {side} at {location}".format(side=directions[self.side], location=self.location)
 
 
+@register_condition(0xe7)
 class ConditionalGetPointerItem:
     """
 
     """
 
+    __slots__ = ('action', 'id')
+
     def __init__(self, reader):
         """
 
@@ -515,6 +662,10 @@ class ConditionalGetPointerItem:
         elif self.action == 0xCF:
             self.id = reader.read_ubyte()
 
+    def compile(self):
+        action, name_id = self.action, self.id
+        return lambda state: state.get_hand_item(action, name_id)
+
     def run(self):
 
         if self.action == 0xF5:
@@ -529,11 +680,14 @@ class ConditionalGetPointerItem:
             return "hand item identified name id == #{value}".format(value=self.id)
 
 
+@register_condition(0xf7)
 class ConditionalGetWallIndex:
     """
 
     """
 
+    __slots__ = ('location',)
+
     def __init__(self, reader):
         """
 
@@ -556,16 +710,23 @@ class ConditionalGetWallIndex:
 
         self.location = Location(reader)
 
+    def compile(self):
+        location = self.location
+        return lambda state: state.get_wall(location)
+
     def run(self):
 
         return "wall index at {location}".format(location=self.location)
 
 
+@register_condition(0xed)
 class ConditionalGetPartyDirection:
     """
 
     """
 
+    __slots__ = ()
+
     def __init__(self, reader):
         """
 
@@ -584,16 +745,22 @@ class ConditionalGetPartyDirection:
         if not reader:
             return
 
+    def compile(self):
+        return lambda state: state.party_direction
+
     def run(self):
 
         return "party direction"
 
 
+@register_condition(0xf3)
 class ConditionalMonsterCount:
     """
 
     """
 
+    __slots__ = ('location',)
+
     def __init__(self, reader):
         """
 
@@ -615,6 +782,10 @@ class ConditionalMonsterCount:
             return
         self.location = Location(reader)
 
+    def compile(self):
+        location = self.location
+        return lambda state: state.count_monsters(location)
+
     def run(self):
 
         return "monster count at {location}".format(location=self.location)
@@ -625,12 +796,17 @@ class ConditionalPushTrue:
 
     """
 
+    __slots__ = ()
+
     def __init__(self):
         """
 
         :param reader:
         """
 
+    def compile(self):
+        return lambda state: 1
+
     def run(self):
 
         return "push True"
@@ -641,12 +817,17 @@ class ConditionalPushFalse:
 
     """
 
+    __slots__ = ()
+
     def __init__(self):
         """
 
         :param reader:
         """
 
+    def compile(self):
+        return lambda state: 0
+
     def run(self):
 
         return "push False"
@@ -657,6 +838,8 @@ class ConditionalPushValue:
     BOGUS
     """
 
+    __slots__ = ('value',)
+
     def __init__(self, reader=None, value=None):
         """
 
@@ -678,6 +861,10 @@ class ConditionalPushValue:
 
         # self.value = reader.read_ushort()
 
+    def compile(self):
+        value = self.value
+        return lambda state: value
+
     def run(self):
 
         # if self.value <= 128:
@@ -686,11 +873,14 @@ class ConditionalPushValue:
         #     return "####0x{value:02X} ({value})".format(value=self.value)
 
 
+@register_condition(0xf5)
 class ConditionalItemCount:
     """
 
     """
 
+    __slots__ = ('type', 'location')
+
     def __init__(self, reader):
         """
 
@@ -715,6 +905,11 @@ class ConditionalItemCount:
         self.type = reader.read_ushort()
         self.location = Location(reader)
 
+    def compile(self):
+        location = self.location
+        item_type = None if self.type == 0xFF00 else self.type
+        return lambda state: state.count_items(location, item_type)
+
     def run(self):
 
         if self.type == 0xFF00:
@@ -727,11 +922,14 @@ class ConditionalItemCount:
             )
 
 
+@register_condition(0xf1)
 class ConditionalGetParty:
     """
 
     """
 
+    __slots__ = ('code', 'type', 'flags', 'location')
+
     def __init__(self, reader):
         """
 
@@ -763,6 +961,15 @@ class ConditionalGetParty:
         else:   # Party position
             self.location = Location(reader)
 
+    def compile(self):
+        if self.code == 0xF5:
+            # the meaning of the flags is not known, items are counted whatever they are
+            item_type = self.type
+            return lambda state: state.count_party_items(item_type)
+
+        location = self.location
+        return lambda state: state.is_party_at(location)
+
     def run(self):
 
         if self.code == 0xF5:
@@ -773,11 +980,14 @@ class ConditionalGetParty:
             return "party is at location {location}".format(location=self.location)
 
 
+@register_condition(0xda)
 class ConditionalPartyVisible:
     """
 
     """
 
+    __slots__ = ('location',)
+
     def __init__(self, reader):
         """
 
@@ -798,6 +1008,9 @@ class ConditionalPartyVisible:
         if not reader:
             return
 
+    def compile(self):
+        return lambda state: int(state.party_visible)
+
     def run(self):
 
         return "is party visible"
@@ -808,6 +1021,8 @@ class ConditionalUnknown:
 
     """
 
+    __slots__ = ()
+
     def __init__(self, reader):
         """
 
@@ -831,15 +1046,6 @@ class ConditionalUnknown:
         return "Unknown conditional"
 
 
-
-
-
-
-
-
-
-
-
-
-
-
+register_condition_decoder(range(0xf8, 0x100), lambda reader, opcode: ConditionalOperator(opcode))
+register_condition_decoder([0x01], lambda reader, opcode: ConditionalPushTrue())
+register_condition_decoder([0x00], lambda reader, opcode: ConditionalPushFalse())
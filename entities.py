@@ -52,6 +52,8 @@ class Dice:
 
     """
 
+    __slots__ = ('rolls', 'sides', 'base')
+
     def __init__(self, reader=None):
         self.rolls = 0
         self.sides = 0
@@ -72,6 +74,21 @@ class Dice:
         self.sides = reader.read_ubyte()
         self.base = reader.read_ubyte()
 
+    @staticmethod
+    def from_values(rolls, sides, base):
+        """
+
+        :param rolls:
+        :param sides:
+        :param base:
+        :return:
+        """
+        dice = Dice()
+        dice.rolls = rolls
+        dice.sides = sides
+        dice.base = base
+        return dice
+
     def export(self):
         return {
             'rolls': self.rolls,
@@ -87,6 +104,8 @@ class Location:
 
     """
 
+    __slots__ = ('x', 'y', 'value', 'h', 'l')
+
     def __init__(self, reader=None):
         """
 
@@ -104,13 +123,34 @@ class Location:
         if not reader:
             return
 
-        self.h = reader.read_byte()
-        self.l = reader.read_byte()
+        self.assign(reader.read_byte(), reader.read_byte())
+
+    def assign(self, h, l):
+        """
+        Set the location from its two signed bytes
+        :param h:
+        :param l:
+        :return:
+        """
+        self.h = h
+        self.l = l
 
         self.value = (self.l << 8) + self.h
         self.x = self.value & 0x1f
         self.y = (self.value >> 5) & 0x1f
 
+    @staticmethod
+    def from_values(h, l):
+        """
+
+        :param h:
+        :param l:
+        :return:
+        """
+        location = Location()
+        location.assign(h, l)
+        return location
+
     def is_valid(self):
         return self.h < 0x1f or self.l < 0x1f
 
@@ -1,19 +1,49 @@
 #!/usr/bin/env python3
 
+import argparse
 import os
-import struct
+import re
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
+import gfx
+import records
 import tokens
 from assets import *
+from binary_reader import BinaryArrayData, BinaryStreamData
+from build_cache import BuildCache
+from cfg import ControlFlowGraph
+from compression import decode_format80, iter_decode_format80
 from entities import *
 from flags import *
+from vm import Program
+from xref import CrossReferenceIndex, XREF_FILENAME, level_references
 
 DATA_DIR = "data/"
 BUILD_DIR = "build/"
 
+INF_JSON_FILENAME = 'inf.json'
+
+# bump when the exported levels or their cross references change, so that the levels exported by the previous
+# version are decoded again
+LEVEL_EXPORT_VERSION = 2
+
+# its build cache is opened by the extraction entry points, see open_build_cache()
 assets_manager = AssetsManager()
 
 
+def open_build_cache():
+    """
+    Build cache of assets_manager, read from build/ the first time, in the main process and in each worker
+    :return:
+    """
+    if assets_manager.cache is None:
+        assets_manager.cache = BuildCache(BUILD_DIR)
+
+    return assets_manager.cache
+
+
 class Monster:
     """
     flags:
@@ -77,17 +107,25 @@ class Monster:
         if not reader:
             return
 
-        self.index = reader.read_byte()
-        self.timer_id = reader.read_ubyte()
-        self.location = Location(reader)
-        self.sub_position = reader.read_ubyte()
-        self.direction = reader.read_ubyte()
-        self.monster_type = reader.read_ubyte()
-        self.picture_index = reader.read_ubyte()
-        self.phase = reader.read_ubyte()
-        self.pause = reader.read_ubyte()
-        self.weapon = reader.read_ushort()
-        self.pocket_item = reader.read_ushort()
+        self.decode_record(records.MONSTER.read(reader)[0])
+
+    def decode_record(self, record):
+        """
+        Fill the monster from a records.MONSTER record
+        :param record:
+        :return:
+        """
+        self.index = record['index']
+        self.timer_id = record['timer_id']
+        self.location = Location.from_values(*record['location'])
+        self.sub_position = record['sub_position']
+        self.direction = record['direction']
+        self.monster_type = record['monster_type']
+        self.picture_index = record['picture_index']
+        self.phase = record['phase']
+        self.pause = record['pause']
+        self.weapon = record['weapon']
+        self.pocket_item = record['pocket_item']
 
     def __str__(self):
         """
@@ -247,9 +285,9 @@ class DoorInfo:
         self.buttonRectangles = [Rectangle() for i in range(2)]  # rectangles in door?.cps size [2]
         self.buttonPositions = [Point() for i in range(2)]  # x y position where to place door button size [2,2]
 
-    def decode(self):
+    def decode(self, palette_name=None):
         if self.gfxFile is not None:
-            assets_manager.export_cps_image(self.gfxFile)
+            assets_manager.export_cps_image(self.gfxFile, palette_name)
 
         return {
             "command": self.command,
@@ -338,8 +376,8 @@ class MonsterGfx:
     def __str__(self):
         return self.label
 
-    def export(self):
-        assets_manager.export_cps_image(self.label)
+    def export(self, palette_name=None):
+        assets_manager.export_cps_image(self.label, palette_name)
         dcr = assets_manager.load_dcr(self.label)
         return {
             "used": self.used,
@@ -443,20 +481,20 @@ class Level:
     def decode(self):
         dec_asset = None
         if self.decorations_assets_ref is not None:
-            dec_asset = assets_manager.export_dec_file(self.decorations_assets_ref)
+            dec_asset = assets_manager.export_dec_file(self.decorations_assets_ref, self.paletteName)
 
         assets_manager.export_maze(self.maze_name)
 
-        assets_manager.export_vmp(self.vmpVcnName)
+        assets_manager.export_vmp(self.vmpVcnName, self.paletteName)
 
         return {
             "mazeName": self.maze_name,
             "vmpVncName": self.vmpVcnName,
             "palette": self.paletteName,
             "sound": self.soundName,
-            "doors": [door.decode() for door in self.doors],
+            "doors": [door.decode(self.paletteName) for door in self.doors],
             "monsters": {
-                "gfx": [gfx.export() for gfx in self.monsterGfx],
+                "gfx": [gfx.export(self.paletteName) for gfx in self.monsterGfx],
                 "types": [monster_type.decode() for monster_type in self.monsterTypes],
             },
             "decorations": {
@@ -497,71 +535,11 @@ class Script:
             # if debug:
             #     print("[0x{:04X}]: ".format(reader.offset - start), end='')
             offset = reader.offset - start
-            token = None
             opcode = reader.read_ubyte()
-            if opcode == 0xff:
-                token = tokens.SetWall(reader)
-            elif opcode == 0xfe:
-                token = tokens.ChangeWall(reader)
-            elif opcode == 0xfd:
-                token = tokens.OpenDoor(reader)
-            elif opcode == 0xfc:
-                token = tokens.CloseDoor(reader)
-            elif opcode == 0xfb:
-                token = tokens.CreateMonster(reader)
-            elif opcode == 0xfa:
-                token = tokens.Teleport(reader)
-            elif opcode == 0xf9:
-                token = tokens.StealSmallItem(reader)
-            elif opcode == 0xf8:
-                token = tokens.Message(reader)
-            elif opcode == 0xf7:
-                token = tokens.SetFlag(reader)
-            elif opcode == 0xf6:
-                token = tokens.Sound(reader)
-            elif opcode == 0xf5:
-                token = tokens.ClearFlag(reader)
-            elif opcode == 0xf4:
-                token = tokens.Heal(reader)
-            elif opcode == 0xf3:
-                token = tokens.Damage(reader)
-            elif opcode == 0xf2:
-                token = tokens.Jump(reader)
-            elif opcode == 0xf1:
-                token = tokens.End(reader)
-            elif opcode == 0xf0:
-                token = tokens.Return(reader)
-            elif opcode == 0xef:
-                token = tokens.Call(reader)
-            elif opcode == 0xee:
-                token = tokens.Conditional(reader)
-            elif opcode == 0xed:
-                token = tokens.ConsumeItem(reader)
-            elif opcode == 0xec:
-                token = tokens.ChangeLevel(reader)
-            elif opcode == 0xeb:
-                token = tokens.GiveXP(reader)
-            elif opcode == 0xea:
-                token = tokens.NewItem(reader)
-            elif opcode == 0xe9:
-                token = tokens.Launcher(reader)
-            elif opcode == 0xe8:
-                token = tokens.Turn(reader)
-            elif opcode == 0xe7:
-                token = tokens.IdentifyAllItems(reader)
-            elif opcode == 0xe6:
-                token = tokens.Sequence(reader)
-            elif opcode == 0xe5:
-                token = tokens.Wait(reader)
-            elif opcode == 0xe4:
-                token = tokens.UpdateScreen(reader)
-            elif opcode == 0xe3:
-                token = tokens.Dialog(reader)
-            elif opcode == 0xe2:
-                token = tokens.SpecialEvent(reader)
-
-            if token:
-                self.tokens[offset] = token
+
+            token_class = tokens.OPCODES.get(opcode)
+            if token_class is not None:
+                self.tokens[offset] = token_class(reader)
             else:
                 print("###########[ERROR] unknown opcode: 0x{opcode:02X}".format(opcode=opcode))
 
@@ -589,11 +567,14 @@ class Inf:
         self.triggers = []
         self.messages = []
         self.script = None
+        self.cfg = None
+        self.program = None
 
-    def process(self, filename):
+    def process(self, filename, dump_uncompressed=False):
         """
 
         :param filename:
+        :param dump_uncompressed: debug flag, also write the decompressed INF to <build dir>/<name>.uncps
         :return:
         """
 
@@ -662,17 +643,8 @@ class Inf:
         #     0x45 - cave-in or stone portal
 
         inf_filename = filename + '.INF'
-        uncps_filename = filename + '.uncps'
 
-        with BinaryReader(inf_filename) as reader:
-
-            data = decode_format80(reader)
-
-            with open(uncps_filename, "wb") as handle:
-                s = struct.pack('{count}B'.format(count=len(data)), *data)
-                handle.write(s)
-
-        with BinaryReader(uncps_filename) as reader:
+        with self._open_inf(inf_filename, dump_uncompressed) as reader:
 
             # hunk 1
             self.hunks[0] = reader.read_ushort()
@@ -687,12 +659,10 @@ class Inf:
                         header.maze_name = reader.read_string(13)
                         header.vmpVcnName = reader.read_string(13)
                         header.paletteName = header.vmpVcnName.upper() + '.PAL'
-                        assets_manager.set_palette(header.paletteName)
 
                     b = reader.read_ubyte()
                     if b != 0xFF:
                         header.paletteName = reader.read_string(13)
-                        assets_manager.set_palette(header.paletteName)
 
                     header.soundName = reader.read_string(13)
 
@@ -823,9 +793,9 @@ class Inf:
                     self.timers.append(reader.read_ubyte())
 
                 # Descriptions
-                for i in range(30):
+                for record in records.MONSTER.read(reader, 30):
                     monster = Monster()
-                    monster.decode(reader)
+                    monster.decode_record(record)
 
                     self.monsters.append(monster)
 
@@ -848,6 +818,51 @@ class Inf:
 
             # endregion
 
+    @staticmethod
+    def _open_inf(inf_filename, dump_uncompressed=False):
+        """
+        Reader over the decompressed INF
+        :param inf_filename:
+        :param dump_uncompressed: also write the decompressed INF to <build dir>/<name>.uncps
+        :return: BinaryStreamData, or BinaryArrayData when the whole file is decompressed for the dump
+        """
+        with BinaryReader(inf_filename) as reader:
+
+            if dump_uncompressed:
+                data = decode_format80(reader)
+
+                os.makedirs(BUILD_DIR, exist_ok=True)
+                uncps_filename = os.path.join(BUILD_DIR, os.path.splitext(os.path.basename(inf_filename))[0] + '.uncps')
+                with open(uncps_filename, "wb") as handle:
+                    handle.write(data)
+
+                return BinaryArrayData(data)
+
+            # the headers are parsed while the rest of the file is still being decompressed
+            return BinaryStreamData(iter_decode_format80(reader))
+
+    def get_cfg(self):
+        """
+        Control flow graph of the script, entered from the triggers. Built on first use.
+
+        :return: ControlFlowGraph
+        """
+        if self.cfg is None:
+            self.cfg = ControlFlowGraph(self.script, [trigger.offset for trigger in self.triggers])
+
+        return self.cfg
+
+    def get_program(self):
+        """
+        Script compiled for the vm.Interpreter. Built on first use.
+
+        :return: vm.Program
+        """
+        if self.program is None:
+            self.program = Program(self.script)
+
+        return self.program
+
     def export(self, assets):
         return {
             "name": self.name,
@@ -861,34 +876,264 @@ class Inf:
         }
 
 
-def decode_inf():
-    # .INF
-    files = [
-        'LEVEL1',
-        # 'LEVEL2',
-        # 'LEVEL3',
-        # 'LEVEL4',
-        # 'LEVEL5',
-        # 'LEVEL6',
-        # 'LEVEL7',
-        # 'LEVEL8',
-        # 'LEVEL9',
-        # 'LEVEL10',
-        # 'LEVEL11',
-        # 'LEVEL12',
-        # 'LEVEL13',
-        # 'LEVEL14',
-        # 'LEVEL15',
-        # 'LEVEL16',
-    ]
-    infs = {}
-
-    for file in files:
-        inf = Inf(file)
-        inf.process('data/{file}'.format(file=file))
-        infs[file] = inf
-
-    return infs
+LEVEL_FILENAME = re.compile(r'^(LEVEL(\d+))\.INF$')
+
+
+def find_levels(data_dir=DATA_DIR):
+    """
+    Names of the LEVELn.INF files in data_dir, sorted by level number
+
+    :param data_dir:
+    :return:
+    """
+    levels = []
+
+    for filename in os.listdir(data_dir):
+        match = LEVEL_FILENAME.match(filename)
+        if match:
+            levels.append((int(match.group(2)), match.group(1)))
+
+    return [name for _, name in sorted(levels)]
+
+
+def extract_level(name, dump_uncompressed=False):
+    """
+    Decode a level and export everything it references (maze, VMP/VCN, decorations, doors and monsters
+    graphics). This is the unit of work of decode_levels, run in a worker process.
+
+    The exports are recorded in the build cache along with the level, so that a level whose inputs didn't change
+    is not decoded again, see load_fresh_levels().
+
+    :param name: level name, e.g. LEVEL1
+    :param dump_uncompressed:
+    :return: the exported level, the exports of the assets it shares with other levels, left to the caller,
+             the build cache entries recorded while exporting it and the cross references of its script
+    """
+    open_build_cache()
+
+    filename = os.path.join(DATA_DIR, name)
+
+    inf = Inf(name)
+    inf.process(filename, dump_uncompressed)
+
+    assets_manager.defer_shared_exports()
+    try:
+        level = inf.export(assets)
+    finally:
+        shared_exports = assets_manager.pop_deferred_exports()
+
+    # the exported level depends on the INF and the DCR files of its monsters, the other files it references
+    # have exports of their own
+    inputs = [filename + '.INF']
+    inputs += [assets_manager.get_dcr_filename(gfx.label) for header in inf.headers for gfx in header.monsterGfx]
+    exports = [('export_maze', (header.maze_name,)) for header in inf.headers] + shared_exports
+
+    assets_manager.cache.record('level:' + name, LEVEL_EXPORT_VERSION, inputs,
+                                [os.path.join(BUILD_DIR, INF_JSON_FILENAME), os.path.join(BUILD_DIR, XREF_FILENAME)],
+                                exports)
+
+    return level, shared_exports, assets_manager.cache.pop_updates(), level_references(inf)
+
+
+def load_fresh_levels(names):
+    """
+    Levels exported by the previous run whose inputs didn't change, read back from inf.json and the cross
+    references index
+
+    :param names: names of all the levels
+    :return: level name -> (exported level, exports to check, cross references of its script)
+    """
+    cache = assets_manager.cache
+    fresh = {name for name in names if cache.is_fresh('level:' + name, LEVEL_EXPORT_VERSION)}
+    if not fresh:
+        return {}
+
+    try:
+        with open(os.path.join(BUILD_DIR, INF_JSON_FILENAME), 'r') as handle:
+            exported = json.load(handle)
+        xref_index = CrossReferenceIndex.load(os.path.join(BUILD_DIR, XREF_FILENAME))
+    except (OSError, ValueError):
+        return {}
+
+    # levels were added or removed, everything is decoded again
+    if [level['name'] for level in exported] != names:
+        return {}
+
+    levels = {}
+    for level in exported:
+        name = level['name']
+        if name not in fresh:
+            continue
+
+        # JSON keys are strings, they were the message ids
+        level['messages'] = {int(key): message for key, message in level['messages'].items()}
+
+        levels[name] = (level, cache.get_result('level:' + name), xref_index.get_level(name))
+
+    return levels
+
+
+def decode_levels(names=None, jobs=None, dump_uncompressed=False, xref_index=None):
+    """
+    Extract levels on a process pool.
+
+    Each worker process has its own AssetsManager and exports what belongs to its level only (e.g. the maze).
+    The assets levels share, such as doors and monsters images, are exported afterwards, see
+    export_shared_assets(), so each one is written once, with the palette of the first level using it.
+
+    Levels whose inputs didn't change since the previous run are not decoded, see load_fresh_levels().
+
+    :param names: level names, all the levels found in the data directory by default
+    :param jobs: number of worker processes, the number of cores by default
+    :param dump_uncompressed: also decode again the levels up to date, to dump them
+    :param xref_index: CrossReferenceIndex the references of the level scripts are added to
+    :return: the exported levels, in the order of names, and the names of the levels decoded again
+    """
+    if names is None:
+        names = find_levels()
+
+    fresh = {} if dump_uncompressed else load_fresh_levels(names)
+    decoded = [name for name in names if name not in fresh]
+
+    if jobs == 1 or len(decoded) <= 1:
+        results = dict(zip(decoded, [extract_level(name, dump_uncompressed) for name in decoded]))
+        return _merge_levels(names, fresh, results, xref_index, None), decoded
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = dict(zip(decoded, executor.map(extract_level, decoded, repeat(dump_uncompressed))))
+        return _merge_levels(names, fresh, results, xref_index, executor), decoded
+
+
+def _merge_levels(names, fresh, results, xref_index, executor):
+    levels = []
+    shared_exports = []
+
+    for name in names:
+        if name in fresh:
+            # the exports of the level are checked again, they are skipped when their outputs are up to date
+            level, level_shared_exports, references = fresh[name]
+        else:
+            level, level_shared_exports, cache_updates, references = results[name]
+            assets_manager.cache.merge(cache_updates)
+
+        shared_exports += level_shared_exports
+        if xref_index is not None:
+            xref_index.merge(references)
+        levels.append(level)
+
+    export_shared_assets(shared_exports, executor)
+
+    return levels
+
+
+def export_vmp(vmp_name, palette_name):
+    """
+    Export a VMP and its VCN tileset, the unit of work of export_shared_assets
+
+    :param vmp_name:
+    :param palette_name:
+    :return: the build cache entries recorded while exporting it
+    """
+    cache = open_build_cache()
+    assets_manager.export_vmp(vmp_name, palette_name)
+
+    return cache.pop_updates()
+
+
+def export_shared_assets(shared_exports, executor=None):
+    """
+    Run the exports the levels deferred, or recorded with the levels up to date, in order: the first request of
+    an asset exports it.
+
+    VMPs, the slowest of them, are exported on the executor, one task per VMP, while this process exports the
+    images and the decorations.
+
+    :param shared_exports: as recorded by AssetsManager.defer_shared_exports()
+    :param executor: None to export everything in this process
+    :return:
+    """
+    vmps = OrderedDict()
+    exports = []
+
+    for method, args in shared_exports:
+        if method == 'export_vmp':
+            vmps.setdefault(args[0], args)
+        else:
+            exports.append((method, args))
+
+    if executor is None:
+        assets_manager.run_exports(exports)
+        vmp_updates = [export_vmp(*args) for args in vmps.values()]
+    else:
+        futures = [executor.submit(export_vmp, *args) for args in vmps.values()]
+        assets_manager.run_exports(exports)
+        vmp_updates = [future.result() for future in futures]
+
+    for cache_updates in vmp_updates:
+        assets_manager.cache.merge(cache_updates)
+
+
+def find_data_file(name, extension):
+    """
+    name if it is an existing path, otherwise the game file called name in the data directory
+
+    :param name: path or name of the game file, with or without extension
+    :param extension:
+    :return:
+    """
+    if os.path.exists(name):
+        return name
+
+    filename = name.upper()
+    if not filename.endswith(extension):
+        filename += extension
+
+    return os.path.join(DATA_DIR, filename)
+
+
+def convert_cps(cps_filename, palette_filename, output_dir=BUILD_DIR):
+    """
+    Convert a CPS file to a PNG. The palette is loaded by the task itself and does not depend on the state
+    of the AssetsManager, so this can run in any worker process.
+
+    :param cps_filename:
+    :param palette_filename: None for the inline palette of the CPS file
+    :param output_dir:
+    :return: index entry of the image
+    """
+    palette = gfx.load_palette(palette_filename) if palette_filename else None
+    img = gfx.load_cps(cps_filename, palette)
+
+    image_filename = os.path.join(output_dir, os.path.basename(cps_filename).lower() + '.png')
+    img.convert('RGB').save(image_filename)
+
+    return {
+        "cps": cps_filename,
+        "palette": palette_filename,
+        "image": image_filename,
+        "width": img.width,
+        "height": img.height,
+    }
+
+
+def convert_cps_files(conversions, output_dir=BUILD_DIR, jobs=None):
+    """
+    Convert CPS files to PNGs on a process pool.
+
+    :param conversions: list of (CPS filename, palette filename or None)
+    :param output_dir:
+    :param jobs: number of worker processes, the number of cores by default
+    :return: the index entries of the images, in the order of conversions
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    if jobs == 1 or len(conversions) <= 1:
+        return [convert_cps(cps_filename, palette_filename, output_dir)
+                for cps_filename, palette_filename in conversions]
+
+    cps_filenames, palette_filenames = zip(*conversions)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(convert_cps, cps_filenames, palette_filenames, repeat(output_dir)))
 
 
 def dump(name, data):
@@ -915,30 +1160,94 @@ assets = {
 }
 
 if __name__ == '__main__':
-    assets_manager.export_texts()
-
-    assets_manager.export_item_types()
-    assets_manager.export_items()
-
-    # INF
-    assets['inf'] = decode_inf()
-    dump('inf.json', [inf.export(assets) for inf in assets['inf'].values()])
-
-    cps_files = [
-        'CHOICE.CPS',
-        'INVENT.CPS',
-        'ITEMICN.CPS',
-        'ITEML1.CPS',
-        'ITEMS1.CPS',
-        'MAP.CPS',
-        'MENU.CPS',
-        'WESTWOOD.CPS',
-        'INTRO.CPS',
-        'AZURE1.CPS',
-        'AZURE2.CPS',
-        'BEHOLDER.CPS',
-
-    ]
-
-    for f in cps_files:
-        assets_manager.export_cps_image(f)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Extract the game data from data/ into build/')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes, the number of cores by default')
+    parser.add_argument('--dump-uncompressed', action='store_true',
+                        help='write the decompressed LEVELn.INF files to build/ for debugging')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='export everything again, even the files that are up to date')
+
+    subparsers = parser.add_subparsers(dest='command')
+
+    cps_parser = subparsers.add_parser('cps', help='convert CPS images to PNG')
+    cps_parser.add_argument('files', nargs='+', metavar='FILE[=PALETTE]',
+                            help='CPS file, a path or the name of a file in data/, optionally with its palette')
+    cps_parser.add_argument('-p', '--palette', default=None,
+                            help='palette of the files given without one, their inline palette by default')
+    cps_parser.add_argument('-o', '--output', default=BUILD_DIR, help='output directory, build/ by default')
+    cps_parser.add_argument('--index', default='cps.json',
+                            help='JSON index of the converted images, written in the output directory')
+    cps_parser.add_argument('-j', '--jobs', type=int, default=argparse.SUPPRESS,
+                            help='number of worker processes, the number of cores by default')
+    args = parser.parse_args()
+
+    if args.command == 'cps':
+        conversions = []
+        for file in args.files:
+            cps_name, _, palette_name = file.partition('=')
+            palette_name = palette_name or args.palette
+
+            cps_filename = find_data_file(cps_name, CPS_EXTENSION)
+            palette_filename = find_data_file(palette_name, PAL_EXTENSION) if palette_name else None
+
+            # before any conversion starts, rather than a traceback from a worker
+            for filename in (cps_filename, palette_filename):
+                if filename is not None and not os.path.isfile(filename):
+                    parser.error('{file} not found'.format(file=filename))
+
+            conversions.append((cps_filename, palette_filename))
+
+        index = convert_cps_files(conversions, args.output, args.jobs)
+
+        with open(os.path.join(args.output, args.index), 'w') as handle:
+            json.dump(index, handle, indent=True, sort_keys=False)
+
+    else:
+        cache = open_build_cache()
+        if args.force:
+            cache.clear()
+
+        assets_manager.export_texts()
+
+        assets_manager.export_item_types()
+        assets_manager.export_items()
+
+        # INF
+        xref_index = CrossReferenceIndex()
+        levels, decoded = decode_levels(jobs=args.jobs, dump_uncompressed=args.dump_uncompressed,
+                                        xref_index=xref_index)
+
+        # both only change along with the levels
+        if decoded:
+            dump(INF_JSON_FILENAME, levels)
+            xref_index.save(os.path.join(BUILD_DIR, XREF_FILENAME))
+
+        # screens without an inline palette use the last palette the level headers set
+        palette_name = None
+        for level in reversed(levels):
+            palettes = [header['palette'] for header in level['headers'] if header['palette']]
+            if palettes:
+                palette_name = palettes[-1]
+                break
+
+        cps_files = [
+            'CHOICE.CPS',
+            'INVENT.CPS',
+            'ITEMICN.CPS',
+            'ITEML1.CPS',
+            'ITEMS1.CPS',
+            'MAP.CPS',
+            'MENU.CPS',
+            'WESTWOOD.CPS',
+            'INTRO.CPS',
+            'AZURE1.CPS',
+            'AZURE2.CPS',
+            'BEHOLDER.CPS',
+
+        ]
+
+        for f in cps_files:
+            assets_manager.export_cps_image(f, palette_name)
+
+        cache.save()
@@ -1,35 +1,37 @@
+import os.path
+from collections import OrderedDict
+
 from PIL import Image
 
 from binary_reader import BinaryReader
-from compression import decode_format80, decode_format80_image
+from compression import decode_format80, decode_format80_image_bytes
 
+# 6-bit to 8-bit color component, to convert palettes with bytes.translate
+PALETTE_COLORS_TABLE = bytes((col6 & 0x3f) << 2 for col6 in range(256))
 
-def load_cps(cps_filename, palette=None):
-    with BinaryReader(cps_filename) as reader:
-        cps_data = decode_format80_image(reader)
+PAL_EXTENSION = '.PAL'
 
-        palette_size = cps_data[0]
-        cps_data = cps_data[1:]
-        if palette_size > 0:
-            if palette is not None:
-                print('overriding palette for file %s' % cps_filename)
 
-            palette = []
-            for i in range(palette_size):
-                palette.append(cps_data[i] << 2)
-
-            cps_data = cps_data[palette_size:]
+def load_cps(cps_filename, palette=None):
+    with BinaryReader(cps_filename) as reader:
+        cps_palette, cps_data = decode_format80_image_bytes(reader)
 
+    if cps_palette:
         if palette is not None:
-            img = Image.new('P', (320, 200))
-            img.putpalette(palette)
-        else:
-            img = Image.new('RGB', (320, 200))
+            print('overriding palette for file %s' % cps_filename)
 
-        img.putdata(cps_data)
+        palette = cps_palette.translate(PALETTE_COLORS_TABLE)
 
+    if palette is None:
+        img = Image.new('RGB', (320, 200))
+        img.putdata(cps_data)
         return img
 
+    img = Image.frombytes('P', (320, 200), cps_data)
+    img.putpalette(palette)
+
+    return img
+
 
 def load_palette(pal_filename):
     """
@@ -42,12 +44,86 @@ def load_palette(pal_filename):
 
     """
 
-    pal_data = []
-
     with open(pal_filename, 'rb') as fpal:
         pal_data_6 = fpal.read()
-        for col6 in pal_data_6:
-            # col = (col6 * 255) / 63
-            pal_data.append((col6 & 0x3f) << 2)
 
-    return pal_data
+    # col = (col6 * 255) / 63
+    return pal_data_6.translate(PALETTE_COLORS_TABLE)
+
+
+class PaletteRegistry:
+    """
+    Palettes of the data directory by name, each file is read and converted to 8-bit colors once.
+
+    The 16 colors sub-palettes picked from a palette (the bg and walls palettes of the VCN files) are kept as
+    well. Both are evicted least recently used first once there are more than capacity of them.
+    """
+
+    def __init__(self, data_dir='data/', capacity=8):
+        self.data_dir = data_dir
+        self.capacity = capacity
+        self._palettes = OrderedDict()
+        self._sub_palettes = OrderedDict()
+
+    def get_filename(self, palette_name):
+        """
+        Path of a palette file from its name, with or without extension
+        :param palette_name:
+        :return:
+        """
+        filename = os.path.join(self.data_dir, palette_name.upper())
+        if not filename.endswith(PAL_EXTENSION):
+            filename += PAL_EXTENSION
+
+        return filename
+
+    def get(self, palette_name):
+        """
+        :param palette_name:
+        :return: 768 bytes, or None if palette_name is None
+        """
+        if palette_name is None:
+            return None
+
+        filename = self.get_filename(palette_name)
+
+        palette = self._lookup(self._palettes, filename)
+        if palette is None:
+            palette = load_palette(filename)
+            self._remember(self._palettes, filename, palette)
+
+        return palette
+
+    def get_sub_palette(self, palette_name, indices):
+        """
+        Colors of the palette at the given indices
+        :param palette_name:
+        :param indices:
+        :return: list of 3 components per index
+        """
+        key = (self.get_filename(palette_name), bytes(indices))
+
+        sub_palette = self._lookup(self._sub_palettes, key)
+        if sub_palette is None:
+            palette = self.get(palette_name)
+
+            sub_palette = []
+            for index in indices:
+                sub_palette.extend(palette[3 * index:3 * index + 3])
+
+            self._remember(self._sub_palettes, key, sub_palette)
+
+        return sub_palette
+
+    @staticmethod
+    def _lookup(cache, key):
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+
+        return value
+
+    def _remember(self, cache, key, value):
+        cache[key] = value
+        if len(cache) > self.capacity:
+            cache.popitem(last=False)
@@ -0,0 +1,299 @@
+import mmap
+import struct
+
+try:
+    import numpy
+except ImportError:
+    # the queries fall back to scanning the walls bytes
+    numpy = None
+
+# sides of a block, in the order of the MAZ file and of flags.directions
+NORTH = 0
+EAST = 1
+SOUTH = 2
+WEST = 3
+
+SIDES = 'nesw'
+
+# (dx, dy) of the block next to a side
+SIDE_OFFSETS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+
+# flag of the wall mappings of the doors, WF_ISDOOR
+WALL_FLAG_DOOR = 0x08
+
+MAZ_HEADER = struct.Struct('<HHH')  # width, height, faces
+MAZ_HEADER_SIZE = MAZ_HEADER.size
+
+# the binary export, a copy of the MAZ file, next to the JSON one
+BINARY_EXTENSION = '.bin'
+
+# width and height of the levels, the locations of the scripts are 5 bits coordinates
+MAZE_SIZE = 32
+
+
+def door_wall_types(wall_mappings):
+    """
+    Wall values of the doors of a level
+    :param wall_mappings: header['decorations']['wallMappings'] of a level exported in inf.json
+    :return: frozenset of wall mapping indices
+    """
+    return frozenset(mapping['wall_mapping_index'] for mapping in wall_mappings
+                     if mapping['flags'] & WALL_FLAG_DOOR)
+
+
+class Maze:
+    """
+    Walls of a level, as read from its MAZ file: one byte per side of each block, blocks row by row, sides in the
+    N, E, S, W order. The bytes are kept as they are in a bytearray, or a view of the mapped file, seen as a
+    (height, width, 4) array.
+
+    Wall values are the indices of the wall mappings of the level header, 0 is an empty side.
+    """
+
+    def __init__(self, name, width=0, height=0, faces=4, walls=None):
+        """
+
+        :param name:
+        :param width:
+        :param height:
+        :param faces: bytes per block, always 4
+        :param walls: width * height * 4 bytes, empty sides if None. Copied unless a bytearray or memoryview
+        """
+        self.name = name
+        self.width = width
+        self.height = height
+        self.faces = faces
+
+        if walls is None:
+            walls = bytearray(width * height * 4)
+        elif not isinstance(walls, (bytearray, memoryview)):
+            walls = bytearray(walls)
+
+        self.walls = walls
+
+        # mmap the walls are a view of, see open()
+        self.mapping = None
+
+        if len(self.walls) != width * height * 4:
+            raise ValueError('{name}: expected {size} bytes of walls but got {length}'.format(
+                name=name, size=width * height * 4, length=len(self.walls)))
+
+    @staticmethod
+    def from_maz(name, data):
+        """
+        :param name:
+        :param data: content of a MAZ file, header included
+        :return:
+        """
+        width, height, faces = MAZ_HEADER.unpack_from(data)
+
+        return Maze(name, width, height, faces, data[MAZ_HEADER_SIZE:MAZ_HEADER_SIZE + width * height * 4])
+
+    @staticmethod
+    def load(name, filename):
+        """
+        Read a MAZ file
+        :param name:
+        :param filename:
+        :return:
+        """
+        with open(filename, 'rb') as handle:
+            return Maze.from_maz(name, handle.read())
+
+    @staticmethod
+    def open(name, filename):
+        """
+        Map a MAZ file, or its binary export, in memory. The walls are read in place, changing them doesn't change
+        the file. Close the maze to release the mapping.
+        :param name:
+        :param filename:
+        :return:
+        """
+        with open(filename, 'rb') as handle:
+            buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        width, height, faces = MAZ_HEADER.unpack_from(buffer)
+
+        walls = memoryview(buffer)[MAZ_HEADER_SIZE:MAZ_HEADER_SIZE + width * height * 4]
+
+        maze = Maze(name, width, height, faces, walls)
+        maze.mapping = buffer
+
+        return maze
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def close(self):
+        """
+        Release the mapping of a maze returned by open(), the walls can't be read afterwards. Nothing to do for the
+        other mazes.
+        :return:
+        """
+        if self.mapping is None:
+            return
+
+        # the view first, a mapping can't be closed while views of it exist
+        self.walls.release()
+        self.mapping.close()
+        self.mapping = None
+
+    @staticmethod
+    def from_export(data):
+        """
+        Maze from the dict returned by export()
+        :param data:
+        :return:
+        """
+        maze = Maze(data['name'], data['width'], data['height'], data['faces'])
+        for column in data['walls']:
+            for cell in column:
+                offset = maze._offset(cell['x'], cell['y'])
+                maze.walls[offset:offset + 4] = bytes(cell[side] for side in SIDES)
+
+        return maze
+
+    def _offset(self, x, y):
+        return (y * self.width + x) * 4
+
+    def contains(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def get_wall(self, x, y, side=None):
+        """
+        :param x:
+        :param y:
+        :param side: NORTH, EAST, SOUTH or WEST, None for all of them
+        :return: the wall of the side, or the (n, e, s, w) walls
+        """
+        offset = (y * self.width + x) * 4
+        if side is None:
+            return tuple(self.walls[offset:offset + 4])
+
+        return self.walls[offset + side]
+
+    def set_wall(self, x, y, side, wall):
+        self.walls[(y * self.width + x) * 4 + side] = wall
+
+    def get_width(self):
+        return self.width
+
+    def get_height(self):
+        return self.height
+
+    def neighbour(self, x, y, side):
+        """
+        Block next to a side of a block
+        :param x:
+        :param y:
+        :param side:
+        :return: (x, y), None at the edges of the maze
+        """
+        dx, dy = SIDE_OFFSETS[side]
+        x += dx
+        y += dy
+
+        return (x, y) if self.contains(x, y) else None
+
+    def neighbours(self, x, y):
+        """
+        :param x:
+        :param y:
+        :return: list of (side, (x, y)) of the blocks around a block
+        """
+        blocks = []
+        for side in range(4):
+            block = self.neighbour(x, y, side)
+            if block is not None:
+                blocks.append((side, block))
+
+        return blocks
+
+    def as_array(self):
+        """
+        :return: (height, width, 4) uint8 numpy array sharing the walls bytes
+        """
+        return numpy.frombuffer(self.walls, dtype=numpy.uint8).reshape(self.height, self.width, 4)
+
+    def find_walls(self, wall_type):
+        """
+        Sides having a given wall
+        :param wall_type:
+        :return: list of (x, y, side), blocks row by row
+        """
+        if numpy is not None:
+            return [(x, y, side) for y, x, side in numpy.argwhere(self.as_array() == wall_type).tolist()]
+
+        # memoryviews can't be searched
+        walls = bytes(self.walls)
+
+        found = []
+        offset = walls.find(wall_type)
+        while offset != -1:
+            block, side = divmod(offset, 4)
+            found.append((block % self.width, block // self.width, side))
+            offset = walls.find(wall_type, offset + 1)
+
+        return found
+
+    def find_cells(self, wall_types):
+        """
+        Blocks having at least one side with one of the given walls
+        :param wall_types: collection of wall values
+        :return: list of (x, y), row by row
+        """
+        if numpy is not None:
+            found = numpy.isin(self.as_array(), list(wall_types)).any(axis=2)
+            return [(x, y) for y, x in numpy.argwhere(found).tolist()]
+
+        wall_types = set(wall_types)
+        walls = self.walls
+        return [(block % self.width, block // self.width)
+                for block in range(self.width * self.height)
+                if any(walls[offset] in wall_types for offset in range(block * 4, block * 4 + 4))]
+
+    def door_cells(self, door_types):
+        """
+        Blocks with a door on at least one side
+        :param door_types: wall values of the doors, see door_wall_types()
+        :return: list of (x, y), row by row
+        """
+        return self.find_cells(door_types)
+
+    def to_maz(self):
+        """
+        :return: content of the MAZ file of the maze
+        """
+        return MAZ_HEADER.pack(self.width, self.height, self.faces) + bytes(self.walls)
+
+    def export(self):
+        """
+        Walls as walls[x][y] dicts, the layout of the exported JSON
+        :return:
+        """
+        walls = []
+        for x in range(self.width):
+            column = []
+            for y in range(self.height):
+                n, e, s, w = self.get_wall(x, y)
+                column.append({
+                    'x': x,
+                    'y': y,
+                    'n': n,
+                    's': s,
+                    'w': w,
+                    'e': e,
+                })
+            walls.append(column)
+
+        return {
+            'name': self.name,
+            'width': self.width,
+            'height': self.height,
+            'faces': self.faces,
+            'walls': walls,
+        }
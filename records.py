@@ -0,0 +1,237 @@
+import struct
+
+
+class RecordLayout:
+    """
+    Fixed-size little endian record, declared once as a list of fields and compiled to a single struct.
+
+    Each field is a tuple (name, code) or (name, code, count) where code is a struct format character.
+    A count greater than one makes the field a tuple of count values, except for 's' where it is the size
+    of a bytes value and for 'z' which is a NUL terminated string stored in count bytes. Fields named None
+    are padding and are skipped.
+    """
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+
+        fmt = '<'
+        # (name, first value index, last value index or None for a scalar, is a string)
+        self._plan = []
+        index = 0
+
+        for field in fields:
+            field_name, code = field[0], field[1]
+            count = field[2] if len(field) > 2 else 1
+
+            if field_name is None:
+                fmt += '{count}x'.format(count=count)
+                continue
+
+            if code in 'sz':
+                fmt += '{count}s'.format(count=count)
+                self._plan.append((field_name, index, None, code == 'z'))
+                index += 1
+            elif count == 1:
+                fmt += code
+                self._plan.append((field_name, index, None, False))
+                index += 1
+            else:
+                fmt += '{count}{code}'.format(count=count, code=code)
+                self._plan.append((field_name, index, index + count, False))
+                index += count
+
+        self.names = tuple(field[0] for field in self._plan)
+        self.struct = struct.Struct(fmt)
+        self.size = self.struct.size
+
+        # records made of scalars only map one to one with the unpacked values
+        self._flat = all(stop is None and not is_string for _, _, stop, is_string in self._plan)
+
+    def _make(self, values):
+        if self._flat:
+            return dict(zip(self.names, values))
+
+        record = {}
+        for name, start, stop, is_string in self._plan:
+            if stop is not None:
+                record[name] = values[start:stop]
+            elif is_string:
+                record[name] = values[start].split(b'\x00', 1)[0].decode('latin-1')
+            else:
+                record[name] = values[start]
+
+        return record
+
+    def unpack(self, buffer, offset=0):
+        """
+        Decode the record at offset in buffer
+        :param buffer:
+        :param offset:
+        :return: dict
+        """
+        return self._make(self.struct.unpack_from(buffer, offset))
+
+    def iter_unpack(self, buffer):
+        """
+        Decode consecutive records filling buffer
+        :param buffer:
+        :return: iterator over dicts
+        """
+        make = self._make
+        return (make(values) for values in self.struct.iter_unpack(buffer))
+
+    def pack(self, record):
+        """
+        Encode a record, the inverse of unpack
+        :param record: dict with a value for every field
+        :return: bytes
+        """
+        values = []
+        for name, start, stop, is_string in self._plan:
+            value = record[name]
+            if stop is not None:
+                values.extend(value)
+            elif is_string:
+                values.append(value.encode('latin-1'))
+            else:
+                values.append(value)
+
+        return self.struct.pack(*values)
+
+    def read(self, reader, count=1):
+        """
+        Read count consecutive records from a BinaryReader or BinaryArrayData in a single pass
+        :param reader:
+        :param count:
+        :return: list of dicts
+        """
+        data = reader.read_bytes(count * self.size)
+
+        if len(data) != count * self.size:
+            raise struct.error('{name}: expected {count} records of {size} bytes but got {length} bytes'.format(
+                name=self.name, count=count, size=self.size, length=len(data)))
+
+        return list(self.iter_unpack(data))
+
+
+# ITEM.DAT, one record per item
+ITEM = RecordLayout('item', [
+    ('unidentified_name', 'B'),
+    ('identified_name', 'B'),
+    ('flags', 'B'),
+    ('picture', 'B'),
+    ('type', 'B'),
+
+    # Where the item lies at position
+    # In Maze:
+    #      0..3-> Bottom
+    #      4..7-> Wall (N,E,S,W)
+    # For EotB I: 0..3-> Floor NW,NE,SW,SE
+    #                8-> Compartment
+    # If in inventory:
+    #      0..26-> Position in Inventory
+    ('sub_position', 'B'),
+
+    # Position in maze x + y * 32, consumed if <= 0
+    ('coordinate', 'H'),
+    ('next', 'H'),
+    ('previous', 'H'),
+
+    # Level, where the item lies, 0 <= no level
+    ('level', 'B'),
+
+    # The value of item, -1 if consumed
+    ('value', 'b'),
+])
+
+# ITEM.DAT, item names following the items
+ITEM_NAME = RecordLayout('item name', [
+    ('name', 'z', 35),
+])
+
+# ITEMTYPE.DAT
+ITEM_TYPE = RecordLayout('item type', [
+    # At which position in inventory it is allowed to be put. See InventoryUsage
+    ('slots', 'H'),
+    ('flags', 'H'),
+    ('armor_class', 'b'),  # Adds to armor class
+    ('allowed_classes', 'B'),  # Allowed for this profession. See ClassUsage
+    ('allowed_hands', 'B'),  # Allowed for this hand
+    ('damage_vs_small', 'B', 3),  # rolls, sides, base
+    ('damage_vs_big', 'B', 3),
+    ('unknown', 'B'),
+    ('usage', 'H'),
+])
+
+# .DCR, six sides per record
+DCR_SIDE = RecordLayout('dcr side', [
+    ('cps_x', 'B'),  # in 8 pixels blocks
+    ('cps_y', 'B'),
+    ('width', 'B'),  # in 8 pixels blocks
+    ('height', 'B'),
+    ('screen_x', 'B'),
+    ('screen_y', 'B'),
+])
+
+# LEVELn.INF, monster descriptions
+MONSTER = RecordLayout('monster', [
+    ('index', 'b'),
+    ('timer_id', 'B'),
+    ('location', 'b', 2),
+    ('sub_position', 'B'),
+    ('direction', 'B'),
+    ('monster_type', 'B'),
+    ('picture_index', 'B'),
+    ('phase', 'B'),
+    ('pause', 'B'),
+    ('weapon', 'H'),
+    ('pocket_item', 'H'),
+])
+
+# Savegame, one record per champion
+CHAMPION = RecordLayout('champion', [
+    ('id', 'B'),
+    ('flags', 'B'),
+    ('name', 'z', 11),
+    ('strength', 'b', 2),  # current, max
+    ('strength_extra', 'b', 2),  # current, max
+    ('intelligence', 'b', 2),
+    ('wisdom', 'b', 2),
+    ('dexterity', 'b', 2),
+    ('constitution', 'b', 2),
+    ('charisma', 'b', 2),
+    ('hitpoint', 'h', 2),
+    ('armorclass', 'b'),
+    ('disabled_slots', 'b'),
+    ('race', 'b'),
+    ('class_', 'b'),
+    ('alignment', 'b'),
+    ('portrait', 'b'),
+    ('food', 'b'),
+    ('level', 'b', 3),
+    ('experience', 'I', 3),
+    ('pad_01', 'B', 4),
+    ('mage_spells', 'b', 80),
+    ('cleric_spells', 'b', 80),
+    ('mage_spells_available_flags', 'H'),
+    ('pad_02', 'H'),
+    ('hand_left', 'H'),
+    ('hand_right', 'H'),
+    ('backpack', 'H', 14),
+    ('quiver', 'H'),
+    ('armor', 'H'),
+    ('wrists', 'H'),
+    ('helmet', 'H'),
+    ('necklace', 'H'),
+    ('boots', 'H'),
+    ('belt', 'H', 3),
+    ('rings', 'H', 2),
+    ('timers', 'I', 10),
+    ('events', 'B', 10),
+    ('effects_remainder', 'B', 4),
+    ('effect_flags', 'I'),
+    ('damage_taken', 'b'),
+    ('slot_status', 'b', 5),
+    ('pad_03', 'B', 6),
+])
@@ -8,6 +8,7 @@ from PIL import Image, ImageDraw
 import tokens
 from enum import Enum, IntFlag
 from location import Location
+from records import CHAMPION
 
 # TODO: Not sure about this one...
 directions = ['north', 'east', 'south', 'west']
@@ -312,6 +313,14 @@ class BinaryReader:
             return val[0]
         return val
 
+    def read_bytes(self, count=-1):
+        """
+        Read raw bytes, up to the end of the file when count is negative
+        :param count:
+        :return:
+        """
+        return self.handle.read(count)
+
     def read_string(self, length=0):
         """
 
@@ -1427,67 +1436,22 @@ class Savegame:
             self.name = reader.read_string(20)
 
             # Champions
-            for i in range(6):
+            for record in CHAMPION.read(reader, 6):
                 champion = Champion()
-                champion.id = reader.read_ubyte()
-                champion.flags = reader.read_ubyte()
-                champion.name = reader.read_string(11)
+                champion.__dict__.update(record)
+
                 champion.strength = {
-                    "current": reader.read_byte(),
-                    "max": reader.read_byte()
+                    "current": record['strength'][0],
+                    "max": record['strength'][1]
                 }
                 champion.strength_extra = {
-                    "current": reader.read_byte(),
-                    "max": reader.read_byte()
+                    "current": record['strength_extra'][0],
+                    "max": record['strength_extra'][1]
                 }
 
-                champion.intelligence = reader.read_byte(2)
-                champion.wisdom = reader.read_byte(2)
-                champion.dexterity = reader.read_byte(2)
-                champion.constitution = reader.read_byte(2)
-                champion.charisma = reader.read_byte(2)
-                champion.hitpoint = reader.read_short(2)
-                champion.armorclass = reader.read_byte(1)
-                champion.disabled_slots = reader.read_byte()
-
-                champion.race = races[reader.read_byte()]
-                champion.class_ = classes[reader.read_byte()]
-                champion.alignment = alignments[reader.read_byte()]
-                champion.portrait = reader.read_byte()
-                champion.food = reader.read_byte()
-                champion.level = reader.read_byte(3)
-
-                champion.experience = reader.read_uint(3)
-
-                champion.pad_01 = reader.read_ubyte(4)
-
-                champion.mage_spells = reader.read_byte(80)
-                champion.cleric_spells = reader.read_byte(80)
-                champion.mage_spells_available_flags = reader.read_ushort()
-
-                champion.pad_02 = reader.read_ushort(1)
-
-                champion.hand_left = reader.read_ushort()
-                champion.hand_right = reader.read_ushort()
-                champion.backpack = reader.read_ushort(14)
-                champion.quiver = reader.read_ushort()
-                champion.armor = reader.read_ushort()
-                champion.wrists = reader.read_ushort()
-                champion.helmet = reader.read_ushort()
-                champion.necklace = reader.read_ushort()
-                champion.boots = reader.read_ushort()
-                champion.belt = reader.read_ushort(3)
-                champion.rings = reader.read_ushort(2)
-
-                champion.timers = reader.read_uint(10)
-                champion.events = reader.read_ubyte(10)
-                champion.effects_remainder = reader.read_ubyte(4)
-                champion.effect_flags = reader.read_uint()
-
-                champion.damage_taken = reader.read_byte()
-                champion.slot_status = reader.read_byte(5)
-
-                champion.pad_03 = reader.read_ubyte(6)
+                champion.race = races[record['race']]
+                champion.class_ = classes[record['class_']]
+                champion.alignment = alignments[record['alignment']]
 
                 self.champions.append(champion)
 
@@ -0,0 +1,215 @@
+import random
+
+from maze import Maze, MAZE_SIZE
+
+
+class GameState:
+    """
+    The part of the game the level scripts read and change: flags, maze walls, items and monsters on the maze,
+    the party and its position.
+
+    Walls are those of a maze.Maze, empty ones by default. Blocks are keyed by (x, y) and the sides of a block are
+    in the order of flags.directions: north, east, south, west. Items and monsters missing from the dicts are
+    none.
+    """
+
+    def __init__(self, seed=None, maze=None):
+        self.level_flags = 0
+        self.global_flags = 0
+
+        # flags of the trigger running the script
+        self.trigger_flags = 0
+
+        # walls of the level
+        self.maze = maze if maze is not None else Maze(None, MAZE_SIZE, MAZE_SIZE)
+
+        # (x, y) of the open doors
+        self.open_doors = set()
+
+        # (x, y) -> list of the indices (in ITEM.DAT) of the items lying on the block
+        self.items = {}
+
+        # item index -> item type
+        self.item_types = {}
+
+        # (x, y) -> number of monsters on the block
+        self.monsters = {}
+
+        # monster id -> flags
+        self.monster_flags = {}
+
+        self.level = None
+
+        self.party_position = (0, 0)
+        self.party_direction = 0
+        self.party_visible = True
+
+        # item type -> number of items of the party
+        self.party_items = {}
+        self.party_races = set()
+        self.party_classes = set()
+        self.party_alignments = set()
+
+        # item held by the mouse pointer, a record of records.ITEM and its index in ITEM.DAT
+        self.hand_item = None
+        self.hand_item_index = 0
+
+        # answer of the last dialog
+        self.menu_choice = 0
+        self.prevent_rest = False
+
+        # (message id, color) of the messages displayed
+        self.messages = []
+
+        self.random = random.Random(seed)
+
+    @staticmethod
+    def _block(location):
+        return location.x, location.y
+
+    def get_level_flag(self, flag):
+        return (self.level_flags >> flag) & 1
+
+    def set_level_flag(self, flag):
+        self.level_flags |= 1 << flag
+
+    def clear_level_flag(self, flag):
+        self.level_flags &= ~(1 << flag)
+
+    def get_global_flag(self, flag):
+        return (self.global_flags >> flag) & 1
+
+    def set_global_flag(self, flag):
+        self.global_flags |= 1 << flag
+
+    def clear_global_flag(self, flag):
+        self.global_flags &= ~(1 << flag)
+
+    def get_wall(self, location, side=0):
+        return self.maze.get_wall(location.x, location.y, side)
+
+    def set_wall(self, location, side, wall):
+        self.maze.set_wall(location.x, location.y, side, wall)
+
+    def open_door(self, location):
+        self.open_doors.add(self._block(location))
+
+    def close_door(self, location):
+        self.open_doors.discard(self._block(location))
+
+    def toggle_door(self, location):
+        self.open_doors.symmetric_difference_update([self._block(location)])
+
+    def count_items(self, location, item_type=None):
+        """
+        :param location:
+        :param item_type: None to count items of any type
+        :return:
+        """
+        items = self.items.get(self._block(location), ())
+        if item_type is None:
+            return len(items)
+
+        return sum(1 for item in items if self.item_types.get(item) == item_type)
+
+    def add_item(self, location, item):
+        self.items.setdefault(self._block(location), []).append(item)
+
+    def remove_items(self, location, item_type=None):
+        """
+        Remove the items of a block
+        :param location:
+        :param item_type: None to remove the items of any type
+        :return: the indices of the removed items
+        """
+        block = self._block(location)
+        items = self.items.get(block, [])
+
+        removed = [item for item in items if item_type is None or self.item_types.get(item) == item_type]
+        self.items[block] = [item for item in items if item not in removed]
+
+        return removed
+
+    def move_items(self, source, destination, item_type=None):
+        """
+        Move items from a block to another, destination None removes them from the level
+        :param source:
+        :param destination:
+        :param item_type: None to move the items of any type
+        :return:
+        """
+        items = self.remove_items(source, item_type)
+        if destination is not None:
+            self.items.setdefault(self._block(destination), []).extend(items)
+
+    def count_monsters(self, location):
+        return self.monsters.get(self._block(location), 0)
+
+    def add_monster(self, location):
+        block = self._block(location)
+        self.monsters[block] = self.monsters.get(block, 0) + 1
+
+    def move_monsters(self, source, destination):
+        count = self.monsters.pop(self._block(source), 0)
+        if count:
+            block = self._block(destination)
+            self.monsters[block] = self.monsters.get(block, 0) + count
+
+    def count_party_items(self, item_type):
+        return self.party_items.get(item_type, 0)
+
+    def is_party_at(self, location):
+        return int(self.party_position == self._block(location))
+
+    def has_race(self, race):
+        return int(race in self.party_races)
+
+    def has_class(self, class_):
+        return int(class_ in self.party_classes)
+
+    def has_alignment(self, alignment):
+        return int(alignment in self.party_alignments)
+
+    def roll(self, dice):
+        """
+        :param dice: entities.Dice
+        :return: the sum of the rolls plus the base
+        """
+        # 0dN+base dice are constants
+        if dice.sides <= 0 or dice.rolls <= 0:
+            return dice.base
+
+        return sum(self.random.randint(1, dice.sides) for _ in range(dice.rolls)) + dice.base
+
+    def get_hand_item(self, action, name_id=None):
+        """
+        Property of the item held by the mouse pointer, 0 when there's none
+        :param action: 0xF5 item, 0xF6 value, 0xE1 type, 0xD0 or 0xCF test of the unidentified or identified name
+        :param name_id: name to test for 0xD0 and 0xCF
+        :return:
+        """
+        item = self.hand_item
+        if item is None:
+            return 0
+
+        if action == 0xF5:
+            return self.hand_item_index
+        elif action == 0xF6:
+            return item['value']
+        elif action == 0xE1:
+            return item['type']
+        elif action == 0xD0:
+            return int(item['unidentified_name'] == name_id)
+        elif action == 0xCF:
+            return int(item['identified_name'] == name_id)
+
+        return 0
+
+    def get_unknown(self, opcode, value=None):
+        """
+        Value of the conditions whose meaning is not known yet
+        :param opcode:
+        :param value:
+        :return:
+        """
+        return 0
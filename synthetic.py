@@ -0,0 +1,590 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import struct
+
+import records
+from compression import encode_format80_image
+from flags import HandFlags, ItemFlags, ItemSlotFlags, ItemTypeUsage, ProfessionFlags
+
+# screens extract.py converts besides the graphics referenced by the levels
+SCREENS = [
+    'CHOICE', 'INVENT', 'ITEMICN', 'ITEML1', 'ITEMS1', 'MAP', 'MENU', 'WESTWOOD', 'INTRO', 'AZURE1', 'AZURE2',
+    'BEHOLDER',
+]
+
+# graphics shared by all the levels
+DOOR_NAME = 'door1'
+MONSTER_NAME = 'kobold'
+DECORATIONS_NAME = 'decor'
+DECORATIONS_FILE = 'decor.dec'
+
+MAZE_SIZE = 32
+CPS_SIZE = 320 * 200
+VMP_SHORTS_PER_TILESET = 431
+LEVELS_PER_TILESET = 3
+
+# opcodes of the script tokens
+END = 0xf1
+RETURN = 0xf0
+JUMP = 0xf2
+CALL = 0xef
+CONDITIONAL = 0xee
+
+
+def make_name(name):
+    """
+    Fixed size name of the INF headers
+    :param name:
+    :return:
+    """
+    return name.encode('latin-1')[:12].ljust(13, b'\0')
+
+
+def make_location(rng):
+    """
+    Two bytes location of a random maze block
+    :param rng:
+    :return:
+    """
+    return struct.pack('<H', rng.randrange(MAZE_SIZE) + rng.randrange(MAZE_SIZE) * MAZE_SIZE)
+
+
+def make_flags(rng, flag_class):
+    """
+    Random combination of the members of an IntFlag
+    :param rng:
+    :param flag_class:
+    :return:
+    """
+    value = 0
+    for member in flag_class:
+        if rng.random() < 0.3:
+            value |= member.value
+
+    return value
+
+
+# region Graphics
+
+
+def make_image_data(rng, size):
+    """
+    Palette indices compressing about as well as the game screens: gradients and runs with some noise
+    :param rng:
+    :param size:
+    :return:
+    """
+    data = bytearray(size)
+    pos = 0
+    while pos < size:
+        count = min(rng.randrange(4, 64), size - pos)
+        kind = rng.randrange(3)
+        if kind == 0:
+            data[pos:pos + count] = bytes([rng.randrange(256)]) * count
+        elif kind == 1:
+            start = rng.randrange(256)
+            data[pos:pos + count] = bytes((start + i) & 0xff for i in range(count))
+        else:
+            data[pos:pos + count] = bytes(rng.randrange(256) for _ in range(count))
+        pos += count
+
+    return bytes(data)
+
+
+def make_palette(rng):
+    """
+    PAL file, 256 colors of 6 bits components
+    :param rng:
+    :return:
+    """
+    return bytes(rng.randrange(64) for _ in range(768))
+
+
+def make_cps(rng):
+    """
+    Format80 compressed 320x200 image, without inline palette
+    :param rng:
+    :return:
+    """
+    return encode_format80_image(make_image_data(rng, CPS_SIZE))
+
+
+def make_vcn_data(rng, num_blocks):
+    """
+    VCN blocks, 32 bytes each
+    :param rng:
+    :param num_blocks:
+    :return:
+    """
+    return bytes(rng.randrange(256) for _ in range(num_blocks * 32))
+
+
+def make_vcn(rng, num_blocks):
+    """
+    Format80 compressed VCN file: blocks count, bg and walls palettes indices, then the blocks
+    :param rng:
+    :param num_blocks:
+    :return:
+    """
+    data = struct.pack('<H', num_blocks)
+    data += bytes(rng.randrange(256) for _ in range(32))
+    data += make_vcn_data(rng, num_blocks)
+
+    return encode_format80_image(data)
+
+
+def make_vmp(rng, num_blocks, num_wall_types):
+    """
+    VMP file: bg tiles then the tiles of each wall type, one short per tile made of a VCN block index and the
+    flip bit
+    :param rng:
+    :param num_blocks: blocks of the VCN file
+    :param num_wall_types:
+    :return:
+    """
+    num_tiles = VMP_SHORTS_PER_TILESET * (num_wall_types + 1)
+    tiles = [rng.randrange(num_blocks) | (0x4000 if rng.random() < 0.2 else 0) for _ in range(num_tiles)]
+
+    return struct.pack('<H', num_tiles) + struct.pack('<{count}H'.format(count=num_tiles), *tiles)
+
+
+def make_dcr(rng, count):
+    """
+    DCR file, the six sides of count monster shapes
+    :param rng:
+    :param count:
+    :return:
+    """
+    data = struct.pack('<H', count)
+    for _ in range(count * 6):
+        data += records.DCR_SIDE.pack({
+            'cps_x': rng.randrange(40),
+            'cps_y': rng.randrange(200),
+            'width': rng.randrange(1, 8),
+            'height': rng.randrange(1, 100),
+            'screen_x': rng.randrange(176),
+            'screen_y': rng.randrange(120),
+        })
+
+    return data
+
+
+def make_dec(rng, count, num_rectangles):
+    """
+    DEC file: decorations then the rectangles they use in their CPS
+    :param rng:
+    :param count:
+    :param num_rectangles:
+    :return:
+    """
+    data = struct.pack('<H', count)
+    for i in range(count):
+        indices = [rng.randrange(num_rectangles) if rng.random() < 0.5 else 255 for _ in range(10)]
+        next_index = rng.randrange(count) if rng.random() < 0.2 else -1
+        data += bytes(indices) + struct.pack('<bb', next_index, rng.randrange(4))
+        data += struct.pack('<20h', *[rng.randrange(-50, 176) for _ in range(20)])
+
+    data += struct.pack('<H', num_rectangles)
+    for _ in range(num_rectangles):
+        data += struct.pack('<4H', rng.randrange(40), rng.randrange(200), rng.randrange(1, 8), rng.randrange(1, 64))
+
+    return data
+
+
+# endregion
+
+# region Game data
+
+
+def make_maze(rng, width=MAZE_SIZE, height=MAZE_SIZE, num_wall_types=60):
+    """
+    MAZ file: size, bytes per block, then the N, E, S, W walls of every block, row by row
+    :param rng:
+    :param width:
+    :param height:
+    :param num_wall_types:
+    :return:
+    """
+    walls = bytes(rng.randrange(num_wall_types) if rng.random() < 0.4 else 0 for _ in range(width * height * 4))
+
+    return struct.pack('<3H', width, height, 4) + walls
+
+
+def make_texts(rng, count):
+    """
+    TEXT.DAT: offsets of the strings, then the NUL terminated strings
+    :param rng:
+    :param count:
+    :return:
+    """
+    texts = [('Text {index} '.format(index=i) + 'lorem ipsum ' * rng.randrange(4)).encode('latin-1') + b'\0'
+             for i in range(count)]
+
+    offset = 2 * count
+    offsets = []
+    for text in texts:
+        offsets.append(offset)
+        offset += len(text)
+
+    if offset > 0xffff:
+        raise ValueError('too many texts for TEXT.DAT')
+
+    return struct.pack('<{count}H'.format(count=count), *offsets) + b''.join(texts)
+
+
+def make_items(rng, count, num_names, num_types, num_levels):
+    """
+    ITEM.DAT: items then their names
+    :param rng:
+    :param count:
+    :param num_names: at most 256, names are referenced by a byte
+    :param num_types:
+    :param num_levels:
+    :return:
+    """
+    data = struct.pack('<H', count)
+    for i in range(count):
+        data += records.ITEM.pack({
+            'unidentified_name': rng.randrange(num_names),
+            'identified_name': rng.randrange(num_names),
+            'flags': rng.randrange(256),
+            'picture': rng.randrange(256),
+            'type': rng.randrange(num_types),
+            'sub_position': rng.randrange(8),
+            'coordinate': rng.randrange(MAZE_SIZE * MAZE_SIZE),
+            'next': rng.randrange(count),
+            'previous': rng.randrange(count),
+            'level': rng.randrange(min(num_levels, 255) + 1),
+            'value': rng.randrange(-1, 10),
+        })
+
+    data += struct.pack('<H', num_names)
+    for i in range(num_names):
+        data += records.ITEM_NAME.pack({'name': 'Item name {index}'.format(index=i)})
+
+    return data
+
+
+def make_item_types(rng, count):
+    """
+    ITEMTYPE.DAT
+    :param rng:
+    :param count:
+    :return:
+    """
+    data = struct.pack('<H', count)
+    for _ in range(count):
+        data += records.ITEM_TYPE.pack({
+            'slots': make_flags(rng, ItemSlotFlags),
+            'flags': make_flags(rng, ItemFlags),
+            'armor_class': rng.randrange(-5, 5),
+            'allowed_classes': make_flags(rng, ProfessionFlags),
+            'allowed_hands': make_flags(rng, HandFlags),
+            'damage_vs_small': (rng.randrange(1, 4), rng.randrange(1, 12), rng.randrange(4)),
+            'damage_vs_big': (rng.randrange(1, 4), rng.randrange(1, 12), rng.randrange(4)),
+            'unknown': rng.randrange(256),
+            'usage': make_flags(rng, ItemTypeUsage),
+        })
+
+    return data
+
+
+# endregion
+
+# region Levels
+
+
+def make_effect(rng, num_messages, num_items):
+    """
+    A script token which is neither control flow nor condition
+    :param rng:
+    :param num_messages:
+    :param num_items:
+    :return:
+    """
+    kind = rng.randrange(10)
+
+    if kind == 0:   # message
+        return b'\xf8' + struct.pack('<HH', rng.randrange(num_messages), rng.randrange(16))
+    if kind == 1:   # set level or global flag
+        return b'\xf7' + struct.pack('<bB', rng.choice((-17, -16)), rng.randrange(32))
+    if kind == 2:   # clear level or global flag
+        return b'\xf5' + struct.pack('<bB', rng.choice((-17, -16)), rng.randrange(32))
+    if kind == 3:   # open door
+        return b'\xfd' + make_location(rng)
+    if kind == 4:   # close door
+        return b'\xfc' + make_location(rng)
+    if kind == 5:   # set all the walls of a block
+        return b'\xff' + struct.pack('<b', -9) + make_location(rng) + bytes([rng.randrange(60)])
+    if kind == 6:   # change a wall
+        return b'\xfe' + struct.pack('<b', -23) + make_location(rng) + bytes(
+            [rng.randrange(4), rng.randrange(60), rng.randrange(60)])
+    if kind == 7:   # teleport the party
+        return b'\xfa' + struct.pack('<b', -24) + make_location(rng) + make_location(rng)
+    if kind == 8:   # new item
+        return b'\xea' + struct.pack('<H', rng.randrange(num_items)) + make_location(rng) + bytes(
+            [rng.randrange(4), 0])
+
+    # sound
+    return b'\xf6' + bytes([rng.randrange(40)]) + make_location(rng)
+
+
+def make_condition(rng):
+    """
+    Conditional token testing a level or a global flag, without its target
+    :param rng:
+    :return:
+    """
+    flag_opcode = rng.choice((0xef, 0xf0))
+    return bytes([CONDITIONAL, flag_opcode, rng.randrange(32), 0x01, 0xff, 0xee])
+
+
+def make_script(rng, num_triggers, num_messages=16, num_items=100, max_effects=6):
+    """
+    Level script made of one routine per trigger and some subroutines. A routine runs a few effects, may skip
+    some of them depending on a flag, may call a subroutine and ends with an End token. Jumps only go forward,
+    so every routine terminates.
+
+    :param rng:
+    :param num_triggers:
+    :param num_messages: messages of the level, referenced by the Message tokens
+    :param num_items:
+    :param max_effects: maximum number of effects in a row
+    :return: the script with its length, and the offsets of the routines
+    """
+    num_subroutines = max(1, num_triggers // 4)
+
+    # (label or None, token bytes, label of the target stored in the last two bytes or None)
+    code = []
+
+    def effects(label=None):
+        for i in range(rng.randrange(1, max_effects + 1)):
+            code.append((label if i == 0 else None, make_effect(rng, num_messages, num_items), None))
+
+    for routine in range(num_triggers):
+        effects(('routine', routine))
+
+        if rng.random() < 0.6:
+            code.append((None, make_condition(rng) + b'\0\0', ('end', routine)))
+            effects()
+
+        if rng.random() < 0.4:
+            code.append((None, bytes([CALL, 0, 0]), ('sub', rng.randrange(num_subroutines))))
+
+        if rng.random() < 0.2:
+            code.append((None, bytes([JUMP, 0, 0]), ('end', routine)))
+            effects()
+
+        code.append((('end', routine), bytes([END]), None))
+
+    for subroutine in range(num_subroutines):
+        effects(('sub', subroutine))
+        code.append((None, bytes([RETURN]), None))
+
+    labels = {}
+    offset = 2
+    for label, token, _ in code:
+        if label is not None:
+            labels[label] = offset
+        offset += len(token)
+
+    if offset > 0xffff:
+        raise ValueError('script too long, use fewer triggers')
+
+    script = bytearray(struct.pack('<H', offset))
+    for _, token, target in code:
+        if target is not None:
+            token = token[:-2] + struct.pack('<H', labels[target])
+        script += token
+
+    return bytes(script), [labels[('routine', routine)] for routine in range(num_triggers)]
+
+
+def make_level_header(rng, maze_name, vmp_name, num_wall_mappings=20):
+    """
+    INF level header: maze and graphics names, door, monster graphics and types, wall decorations
+    :param rng:
+    :param maze_name:
+    :param vmp_name:
+    :param num_wall_mappings:
+    :return:
+    """
+    header = struct.pack('<H', 0)
+    header += b'\xec' + make_name(maze_name) + make_name(vmp_name)
+
+    # palette of the VMP
+    header += b'\xff' + make_name('sound')
+
+    # one door
+    header += b'\xec' + make_name(DOOR_NAME) + bytes([1, rng.randrange(4), rng.randrange(2)])
+    header += struct.pack('<24H', *[rng.randrange(320) for _ in range(24)])
+    header += b'\xff'
+
+    # one monster graphics
+    header += struct.pack('<H', 30)
+    header += b'\xec' + bytes([1, 0]) + make_name(MONSTER_NAME) + bytes([0])
+    header += b'\xff'
+
+    # monster types
+    for index in range(rng.randrange(1, 4)):
+        header += bytes([index, 0, rng.randrange(20), 0])
+        header += bytes([rng.randrange(1, 8), rng.randrange(1, 10), rng.randrange(5)])
+        header += bytes([rng.randrange(1, 4)])
+        for _ in range(3):
+            header += bytes([rng.randrange(1, 3), rng.randrange(1, 10), rng.randrange(3)])
+        header += struct.pack('<4H', 0, 0, 0, rng.randrange(1000))
+        header += bytes([rng.randrange(3), rng.randrange(40), rng.randrange(40), 0])
+
+        if rng.random() < 0.5:
+            header += b'\x01' + bytes([rng.randrange(10), 2]) + bytes([3, 0, 4, 0])
+        else:
+            header += b'\xff'
+
+        header += struct.pack('<b', rng.randrange(-1, 10)) + bytes([0, 0, 0, 0])
+    header += b'\xff'
+
+    # wall decorations
+    header += b'\x01' + struct.pack('<H', 1 + num_wall_mappings)
+    header += b'\xec' + make_name(DECORATIONS_NAME) + make_name(DECORATIONS_FILE)
+    for index in range(num_wall_mappings):
+        header += b'\xfb' + struct.pack('<bBbBB', index + 23, rng.randrange(8), rng.randrange(-1, 10),
+                                         rng.randrange(256), rng.randrange(256))
+
+    return header + struct.pack('<I', 0xFFFFFFFF)
+
+
+def make_monsters(rng, count=30):
+    """
+    Monsters of an INF file, with their timers
+    :param rng:
+    :param count:
+    :return:
+    """
+    data = b'\x00'
+    for _ in range(rng.randrange(1, 4)):
+        data += bytes([0, rng.randrange(1, 20)])
+    data += b'\xff'
+
+    for index in range(count):
+        data += records.MONSTER.pack({
+            'index': index,
+            'timer_id': rng.randrange(4),
+            'location': struct.unpack('<bb', make_location(rng)),
+            'sub_position': rng.randrange(4),
+            'direction': rng.randrange(4),
+            'monster_type': rng.randrange(3),
+            'picture_index': rng.randrange(3),
+            'phase': rng.randrange(10),
+            'pause': rng.randrange(10),
+            'weapon': rng.randrange(100),
+            'pocket_item': rng.randrange(100),
+        })
+
+    return data
+
+
+def make_inf(rng, maze_name, vmp_name, num_triggers=40, num_messages=16, num_items=100):
+    """
+    Format80 compressed LEVELn.INF file: the two level headers, monsters, script, messages and triggers
+    :param rng:
+    :param maze_name:
+    :param vmp_name:
+    :param num_triggers:
+    :param num_messages:
+    :param num_items:
+    :return:
+    """
+    headers = make_level_header(rng, maze_name, vmp_name) + make_level_header(rng, maze_name, vmp_name)
+    script, entries = make_script(rng, num_triggers, num_messages, num_items)
+    messages = b''.join('Message {index}\0'.format(index=i).encode('latin-1') for i in range(num_messages))
+
+    data = struct.pack('<H', 2 + len(headers)) + headers
+    body = make_monsters(rng) + script + messages
+
+    # offset of the triggers
+    data += struct.pack('<H', len(data) + 2 + len(body)) + body
+
+    data += struct.pack('<H', num_triggers)
+    for entry in entries:
+        data += make_location(rng) + struct.pack('<HH', rng.choice((0x08, 0x20, 0x800)), entry)
+
+    return encode_format80_image(data)
+
+
+# endregion
+
+
+def generate(output_dir, scale=1, seed=1, num_levels=None, num_triggers=40, num_blocks=1200):
+    """
+    Write a complete set of game files, with the layouts extract.py reads. The scale 1 has as many levels as
+    the game, larger scales multiply the number of levels, tilesets, items and texts.
+
+    :param output_dir: the files are written there, existing ones are overwritten
+    :param scale:
+    :param seed:
+    :param num_levels: number of levels, 16 times the scale by default
+    :param num_triggers: triggers of each level
+    :param num_blocks: blocks of each VCN file
+    :return: the filenames written
+    """
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    filenames = []
+
+    def write(name, data):
+        filename = os.path.join(output_dir, name)
+        with open(filename, 'wb') as handle:
+            handle.write(data)
+        filenames.append(filename)
+
+    if num_levels is None:
+        num_levels = 16 * scale
+
+    num_items = min(500 * scale, 0xffff)
+    num_item_types = 64
+
+    write('TEXT.DAT', make_texts(rng, min(100 * scale, 2000)))
+    write('ITEM.DAT', make_items(rng, num_items, min(200 * scale, 256), num_item_types, num_levels))
+    write('ITEMTYPE.DAT', make_item_types(rng, num_item_types))
+
+    for name in SCREENS + [DOOR_NAME, MONSTER_NAME, DECORATIONS_NAME]:
+        write(name.upper() + '.CPS', make_cps(rng))
+
+    write(MONSTER_NAME.upper() + '.DCR', make_dcr(rng, 3))
+    write(DECORATIONS_FILE, make_dec(rng, 30, 40))
+
+    tilesets = set()
+    for level in range(1, num_levels + 1):
+        maze_name = 'level{level}.maz'.format(level=level)
+        vmp_name = 'set{index}'.format(index=(level - 1) // LEVELS_PER_TILESET)
+        tilesets.add(vmp_name)
+
+        write('LEVEL{level}.INF'.format(level=level), make_inf(rng, maze_name, vmp_name, num_triggers,
+                                                               num_items=num_items))
+        write(maze_name.upper(), make_maze(rng))
+
+    for vmp_name in sorted(tilesets):
+        write(vmp_name.upper() + '.PAL', make_palette(rng))
+        write(vmp_name.upper() + '.VCN', make_vcn(rng, num_blocks))
+        write(vmp_name.upper() + '.VMP', make_vmp(rng, num_blocks, 3))
+
+    return filenames
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Write synthetic game files, to run extract.py and the '
+                                                 'benchmarks without the original game data')
+    parser.add_argument('output', help='output directory, e.g. a data/ directory of a scratch tree')
+    parser.add_argument('-s', '--scale', type=int, default=1, help='size factor, 1 is about the size of the game')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('-l', '--levels', type=int, help='number of levels, 16 times the scale by default')
+    parser.add_argument('-t', '--triggers', type=int, default=40, help='triggers per level')
+    parser.add_argument('-b', '--blocks', type=int, default=1200, help='blocks per VCN file')
+    args = parser.parse_args()
+
+    written = generate(args.output, args.scale, args.seed, args.levels, args.triggers, args.blocks)
+    print('{count} files written to {output}'.format(count=len(written), output=args.output))
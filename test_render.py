@@ -1,5 +1,7 @@
+import os
 import sys
 import json
+from collections import OrderedDict
 
 from enum import Enum, IntFlag
 
@@ -11,6 +13,8 @@ import sdl2
 
 from ctypes import byref, cast, POINTER, c_int, c_uint8, c_double
 
+from maze import Maze, BINARY_EXTENSION
+
 RESOURCES = sdl2.ext.Resources(__file__, "build")
 
 BLOCK_SIZE = 8
@@ -24,6 +28,8 @@ VP_HEIGHT_PIXELS = VP_HEIGHT_BLOCKS * BLOCK_SIZE
 
 renderer = None
 bg_texture = None
+# the background of the viewport, baked once from bg_texture
+viewport_bg_texture = None
 walls_texture = None
 maze = None
 vmp = None
@@ -216,13 +222,41 @@ def get_vmp_wall_texture():
 
 def load_maze(maz_filename):
     global maze
-    with open(maz_filename, 'r') as fp:
-        maze = json.load(fp)
+    maze = Maze.open(os.path.basename(maz_filename), maz_filename + BINARY_EXTENSION)
 
     return maze
 
 
-def draw_bg():
+NO_ROTATION = c_double(0.0)
+
+
+def make_viewport_texture(texture, plan):
+    """
+    Render tiles once into a new texture the size of the viewport, transparent where no tile is drawn
+    :param texture: tileset
+    :param plan: list of (src_rect, dst_rect, flip flag)
+    :return:
+    """
+    viewport_texture = sdl2.SDL_CreateTexture(renderer, sdl2.SDL_PIXELFORMAT_RGBA8888, sdl2.SDL_TEXTUREACCESS_TARGET,
+                                              VP_WIDTH_PIXELS, VP_HEIGHT_PIXELS)
+    sdl2.SDL_SetTextureBlendMode(viewport_texture, sdl2.SDL_BLENDMODE_BLEND)
+
+    render_target = sdl2.SDL_GetRenderTarget(renderer)
+    sdl2.SDL_SetRenderTarget(renderer, viewport_texture)
+    sdl2.SDL_SetRenderDrawColor(renderer, 0, 0, 0, 0)
+    sdl2.SDL_RenderClear(renderer)
+
+    for src_rect, dst_rect, flag in plan:
+        sdl2.SDL_RenderCopyEx(renderer, texture, src_rect, dst_rect, NO_ROTATION, None, flag)
+
+    sdl2.SDL_SetRenderTarget(renderer, render_target)
+
+    return viewport_texture
+
+
+def make_bg_plan():
+    plan = []
+
     for block_y in range(VP_HEIGHT_BLOCKS):
         for block_x in range(VP_WIDTH_BLOCKS):
             block_index = block_y * VP_WIDTH_BLOCKS + block_x
@@ -235,82 +269,108 @@ def draw_bg():
 
             src_rect = sdl2.SDL_Rect(tileset_block_x * 8, tileset_block_y * 8, 8, 8)
             dst_rect = sdl2.SDL_Rect(block_x * 8, block_y * 8, 8, 8)
-            sdl2.SDL_RenderCopyEx(renderer, bg_texture, src_rect, dst_rect, c_double(0.0), None, flag)
+            plan.append((src_rect, dst_rect, flag))
 
+    return plan
 
-def draw_walls(position, direction):
+
+def make_viewport_bg_texture():
     """
-    # @formatter:off
-    
-    Field of vision: the 17 map positions required to read for rendering a screen and the 25 possible wall 
-    configurations that these positions might contain.
-    
-    A|B|C|D|E|F|G
-      ¯ ¯ ¯ ¯ ¯
-      H|I|J|K|L
-        ¯ ¯ ¯
-        M|N|O
-        ¯ ¯ ¯
-        P|^|Q
-        
-    # @formatter:on
+    The background never changes, its 330 tiles are drawn once
+    :return:
+    """
+    return make_viewport_texture(bg_texture, make_bg_plan())
+
 
+def draw_bg():
+    sdl2.SDL_RenderCopy(renderer, viewport_bg_texture, None, None)
+
+
+def make_view_plans():
     """
+    Where the 25 wall configurations are in the maze, for each direction of the party
+    :return: direction -> list of (dx, dy, side, wall position), dx and dy relative to the party
+    """
+    plans = {}
 
-    for i in range(25):
-        if direction == Direction.West or direction == Direction.East:
-            # side-ways view, x goes up-down in the field of vision while y goes left-right
-            x = maze_pos_offsets[i].delta_y * direction.scale_x
-            y = maze_pos_offsets[i].delta_x * direction.scale_y
-        else:
-            # vertical view, x goes left-right in the field of vision while y goes up-down
-            x = maze_pos_offsets[i].delta_x * direction.scale_x
-            y = maze_pos_offsets[i].delta_y * direction.scale_y
+    for direction in Direction:
+        plan = []
+
+        for wall_position, offset in enumerate(maze_pos_offsets):
+            if direction == Direction.West or direction == Direction.East:
+                # side-ways view, x goes up-down in the field of vision while y goes left-right
+                dx = offset.delta_y * direction.scale_x
+                dy = offset.delta_x * direction.scale_y
+            else:
+                # vertical view, x goes left-right in the field of vision while y goes up-down
+                dx = offset.delta_x * direction.scale_x
+                dy = offset.delta_y * direction.scale_y
 
-        wall_pos_x = x + position[0]
-        wall_pos_y = y + position[1]
+            plan.append((dx, dy, offset.direction.from_view_dir(direction).enc, wall_position))
 
-        if wall_pos_y < 0 or wall_pos_x < 0 or wall_pos_y > 31 or wall_pos_x > 31:
-            continue
+        plans[direction] = plan
 
-        wall_direction = maze_pos_offsets[i].direction.from_view_dir(direction)
+    return plans
 
-        # if wall_pos_y == 0 and (wall_pos_x & 0x1) == 0x1:
-        #     wall_mapping_index = 0
-        # elif wall_pos_y == 0 or wall_pos_y == 2:
-        #     wall_mapping_index = 1
-        # else:
-        #     wall_mapping_index = 0
 
-        wall_mapping_index = maze['walls'][wall_pos_x][wall_pos_y][wall_direction.symbol]
+view_plans = make_view_plans()
 
-        if wall_mapping_index == 0:
-            continue
+# (wall mapping index, wall position) -> list of (src_rect, dst_rect, flip flag) of the tiles of the wall, None
+# for the walls not drawn. Made the first time a wall is seen on the loaded VMP
+wall_plans = {}
 
-        draw_wmi(wall_mapping_index, i)
+# walls seen, a tuple of (wall mapping index, wall position) -> texture of these walls drawn over the viewport,
+# the least recently drawn first
+wall_composites = OrderedDict()
+MAX_WALL_COMPOSITES = 128
 
 
-def draw_wmi(wmi, wall_position):
-    def is_door_wmi(wmi):
-        return 2 < wmi < 23
+# wall mapping indices drawn as walls, the others are doors and decorations
+WALL_MAPPING_INDICES = [1, 2, 23, 24]
 
-    def is_wall_wmi(wmi):
-        return wmi in [1, 2, 23, 24]
+# tiles of a wall type in the wall tiles of a VMP
+WALL_TYPE_TILES = 431
 
-    if is_wall_wmi(wmi):
-        draw_wall(wmi, wall_position)
-    elif is_door_wmi(wmi):
-        pass
-    else:
-        # decoration
-        pass
+
+def reset_wall_plans():
+    """
+    Forget the walls of the previous VMP
+    :return:
+    """
+    wall_plans.clear()
+    clear_wall_composites()
 
 
-def draw_wall(wall_mapping_index, wall_position):
+def get_wall_type(wall_mapping_index):
     if wall_mapping_index == 1 or wall_mapping_index == 2:
-        wall_type = wall_mapping_index - 1
-    else:
-        wall_type = wall_mapping_index - 20
+        return wall_mapping_index - 1
+
+    return wall_mapping_index - 20
+
+
+def get_wall_plan(wall):
+    """
+    Tiles of a wall configuration of the loaded VMP. Doors and decorations aren't drawn yet, nor the wall types
+    the VMP has no tiles for.
+    :param wall: (wall mapping index, wall position)
+    :return: the plan, None if the wall isn't drawn
+    """
+    if wall in wall_plans:
+        return wall_plans[wall]
+
+    wall_mapping_index, wall_position = wall
+
+    plan = None
+    if wall_mapping_index in WALL_MAPPING_INDICES and \
+            get_wall_type(wall_mapping_index) < len(vmp['wallTiles']) // WALL_TYPE_TILES:
+        plan = make_wall_plan(wall_mapping_index, wall_position)
+
+    wall_plans[wall] = plan
+    return plan
+
+
+def make_wall_plan(wall_mapping_index, wall_position):
+    wall_type = get_wall_type(wall_mapping_index)
 
     cfg = walls_render_config[wall_position]
 
@@ -318,6 +378,8 @@ def draw_wall(wall_mapping_index, wall_position):
 
     tileset = vmp['wallTiles']
 
+    plan = []
+
     for t in range(cfg.blk_height):
 
         for s in range(cfg.blk_width):
@@ -330,7 +392,7 @@ def draw_wall(wall_mapping_index, wall_position):
             viewport_block_x = viewport_block_index % VP_WIDTH_BLOCKS
             viewport_block_y = viewport_block_index // VP_WIDTH_BLOCKS
 
-            tile = tileset[tiles_offset + 431*wall_type]
+            tile = tileset[tiles_offset + WALL_TYPE_TILES*wall_type]
             flip = tile['flipped'] != cfg.flip  # xor
             flag = sdl2.SDL_FLIP_HORIZONTAL if flip else sdl2.SDL_FLIP_NONE
 
@@ -342,13 +404,87 @@ def draw_wall(wall_mapping_index, wall_position):
             src_rect = sdl2.SDL_Rect(tileset_block_x * 8, tileset_block_y * 8, 8, 8)
             dst_rect = sdl2.SDL_Rect(viewport_block_x * 8, viewport_block_y * 8, 8, 8)
 
-            sdl2.SDL_RenderCopyEx(renderer, walls_texture, src_rect, dst_rect, c_double(0.0),
-                                  None, flag)
+            plan.append((src_rect, dst_rect, flag))
 
             tiles_offset += 1
 
         tiles_offset += cfg.skip
 
+    return plan
+
+
+def draw_walls(position, direction):
+    """
+    # @formatter:off
+    
+    Field of vision: the 17 map positions required to read for rendering a screen and the 25 possible wall 
+    configurations that these positions might contain.
+    
+    A|B|C|D|E|F|G
+      ¯ ¯ ¯ ¯ ¯
+      H|I|J|K|L
+        ¯ ¯ ¯
+        M|N|O
+        ¯ ¯ ¯
+        P|^|Q
+        
+    # @formatter:on
+
+    """
+    walls = get_view_walls(position, direction)
+    if not walls:
+        return
+
+    composite = wall_composites.get(walls)
+    if composite is None:
+        composite = make_wall_composite(walls)
+    else:
+        wall_composites.move_to_end(walls)
+
+    sdl2.SDL_RenderCopy(renderer, composite, None, None)
+
+
+def get_view_walls(position, direction):
+    """
+    Walls seen from a position of the maze, in the order they are drawn
+    :param position:
+    :param direction:
+    :return: tuple of (wall mapping index, wall position)
+    """
+    party_x, party_y = position
+
+    walls = []
+    for dx, dy, side, wall_position in view_plans[direction]:
+        wall_pos_x = party_x + dx
+        wall_pos_y = party_y + dy
+
+        if not maze.contains(wall_pos_x, wall_pos_y):
+            continue
+
+        # empty sides, doors and decorations have no plan
+        wall = (maze.get_wall(wall_pos_x, wall_pos_y, side), wall_position)
+        if get_wall_plan(wall) is not None:
+            walls.append(wall)
+
+    return tuple(walls)
+
+
+def make_wall_composite(walls):
+    composite = make_viewport_texture(walls_texture, [tile for wall in walls for tile in wall_plans[wall]])
+
+    wall_composites[walls] = composite
+    if len(wall_composites) > MAX_WALL_COMPOSITES:
+        sdl2.SDL_DestroyTexture(wall_composites.popitem(last=False)[1])
+
+    return composite
+
+
+def clear_wall_composites():
+    for composite in wall_composites.values():
+        sdl2.SDL_DestroyTexture(composite)
+
+    wall_composites.clear()
+
 
 KEY_W = 119
 KEY_S = 115
@@ -359,7 +495,7 @@ KEY_E = 101
 
 
 def run_raw():
-    global renderer, bg_texture, maze, vmp, walls_texture
+    global renderer, bg_texture, viewport_bg_texture, maze, vmp, walls_texture
 
     sdl2.SDL_Init(sdl2.SDL_INIT_VIDEO)
     window = sdl2.SDL_CreateWindow(b"Eye of the Beholder 2",
@@ -381,9 +517,11 @@ def run_raw():
     maze = load_maze('build/level1.maz')
 
     vmp = load_vmp('build/dung.vmp.json')
+    reset_wall_plans()
 
     bg_texture = get_vmp_bg_texture()
     walls_texture = get_vmp_wall_texture()
+    viewport_bg_texture = make_viewport_bg_texture()
 
     party_position = (5, 28)
     party_direction = Direction.North
@@ -424,6 +562,8 @@ def run_raw():
         sdl2.SDL_RenderCopy(renderer, render_target, None, None)
         sdl2.SDL_RenderPresent(renderer)
 
+    maze.close()
+
     sdl2.SDL_DestroyWindow(window)
     sdl2.SDL_Quit()
     return 0
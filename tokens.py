@@ -1,13 +1,34 @@
 from conditions import *
 from entities import Location
-from extract import directions
+from flags import directions
 
+# script opcode -> token class, the token is decoded by token_class(reader) once the opcode is read
+OPCODES = {}
 
+
+def register_opcode(opcode):
+    """
+    Class decorator registering the token class decoding a script opcode. A class registered for an opcode
+    that already has one replaces it.
+
+    :param opcode:
+    :return:
+    """
+    def register(token_class):
+        OPCODES[opcode] = token_class
+        return token_class
+
+    return register
+
+
+@register_opcode(0xee)
 class Conditional:
     """
 
     """
 
+    __slots__ = ('tokens', 'target', 'compiled')
+
     def __init__(self, reader):
         """
 
@@ -15,6 +36,7 @@ class Conditional:
         """
         self.tokens = []
         self.target = None
+        self.compiled = None
 
         self.decode(reader)
 
@@ -34,30 +56,7 @@ class Conditional:
             if opcode == 0xee:
                 break
 
-            if 0xf8 <= opcode <= 0xff: token = ConditionalOperator(opcode)
-            elif opcode == 0xf7: token = ConditionalGetWallIndex(reader)
-            elif opcode == 0xf5: token = ConditionalItemCount(reader)
-            elif opcode == 0xf3: token = ConditionalMonsterCount(reader)
-            elif opcode == 0xf1: token = ConditionalGetParty(reader)
-            elif opcode == 0xf0: token = ConditionalGetGlobalFlag(reader)
-            elif opcode == 0xef: token = ConditionalGetLevelFlag(reader)
-            elif opcode == 0xee: break
-            elif opcode == 0xed: token = ConditionalGetPartyDirection(reader)
-            elif opcode == 0xe9: token = ConditionalGetWallSide(reader)
-            elif opcode == 0xe7: token = ConditionalGetPointerItem(reader)
-            elif opcode == 0xe4: token = ConditionalMenuChoice(reader)
-            elif opcode == 0xe0: token = ConditionalGetTriggerFlag(reader)
-            elif opcode == 0xdd: token = ConditionalContainRace(reader)
-            elif opcode == 0xdc: token = ConditionalContainClass(reader)
-            elif opcode == 0xdb: token = ConditionalThrowDice(reader)
-            elif opcode == 0xda: token = ConditionalPartyVisible(reader)
-            elif opcode == 0xd2: token = ConditionalimmediateShort(reader)
-            elif opcode == 0xce: token = ConditionalContainAlignment(reader)
-            elif opcode == 0xd7: token = ConditionalD7(reader)
-            elif opcode == 0xdf: token = ConditionalDF(reader)
-            elif opcode == 0x01: token = ConditionalPushTrue()
-            elif opcode == 0x00: token = ConditionalPushFalse()
-            else: token = ConditionalPushValue(reader, opcode)
+            token = CONDITION_DECODERS.get(opcode, ConditionalPushValue)(reader, opcode)
 
             if not token:
                 continue
@@ -67,6 +66,47 @@ class Conditional:
         self.target = reader.read_ushort()
         i = 1
 
+    def compile(self):
+        """
+        Turn the postfix condition tokens into a single function evaluating the condition, built on first use.
+
+        :return: function(state) returning the value left on top of the stack
+        """
+        if self.compiled is not None:
+            return self.compiled
+
+        stack = []
+        for token in self.tokens:
+            if isinstance(token, ConditionalOperator):
+                if len(stack) < 2:
+                    raise ValueError('Operator{text}is missing operands'.format(text=token.text))
+
+                right = stack.pop()
+                left = stack.pop()
+                stack.append(token.compile(left, right))
+                continue
+
+            compiled = token.compile()
+            if isinstance(compiled, tuple):
+                stack.extend(compiled)
+            else:
+                stack.append(compiled)
+
+        if not stack:
+            raise ValueError('Empty condition')
+
+        self.compiled = stack[-1]
+        return self.compiled
+
+    def evaluate(self, state):
+        """
+        Whether the condition holds, if it does not the script continues at target
+
+        :param state: GameState
+        :return:
+        """
+        return bool(self.compile()(state))
+
     def run(self):
 
         str = "If "
@@ -76,6 +116,7 @@ class Conditional:
         return str + ' else goto 0x{target:04X}'.format(target=self.target)
 
 
+@register_opcode(0xff)
 class SetWall:
     """
 
@@ -83,6 +124,8 @@ class SetWall:
     :return:
     """
 
+    __slots__ = ('type', 'location', 'to', 'side', 'direction')
+
     def __init__(self, reader):
         """
 
@@ -133,12 +176,17 @@ class SetWall:
             return "Set party direction to {direction}".format(direction=directions[self.direction])
 
 
+@register_opcode(0xfb)
 class CreateMonster:
     """
 
     :return:
     """
 
+    __slots__ = (
+        'unit', 'timer', 'location', 'pos', 'dir', 'type', 'frame', 'phase', 'pause', 'weapon', 'pocket'
+    )
+
     def __init__(self, reader):
 
         self.unit = None
@@ -180,6 +228,7 @@ class CreateMonster:
         )
 
 
+@register_opcode(0xfa)
 class Teleport:
     """
 
@@ -187,6 +236,11 @@ class Teleport:
     :return:
     """
 
+    __slots__ = (
+        'type', 'source', 'destination', 'item_type', 'src_level', 'dst_level', 'src_blk', 'dst_blk', 'sub',
+        'payload'
+    )
+
     def __init__(self, reader):
         """
 
@@ -277,6 +331,7 @@ class Teleport:
             return "Teleport ### #{id}".format(id=self.type)
 
 
+@register_opcode(0xf8)
 class Message:
     """
 
@@ -284,6 +339,8 @@ class Message:
     :return:
     """
 
+    __slots__ = ('message_id', 'color')
+
     def __init__(self, reader):
         """
 
@@ -313,6 +370,7 @@ class Message:
             .format(color=self.color, msg=self.message_id)
 
 
+@register_opcode(0xf7)
 class SetFlag:
     """
 
@@ -320,6 +378,8 @@ class SetFlag:
     :return:
     """
 
+    __slots__ = ('type', 'flag', 'monster_id')
+
     def __init__(self, reader):
         """
 
@@ -372,6 +432,7 @@ class SetFlag:
             return "Set 'Prevent rest' flag".format()
 
 
+@register_opcode(0xf5)
 class ClearFlag:
     """
 
@@ -379,6 +440,8 @@ class ClearFlag:
     :return:
     """
 
+    __slots__ = ('type', 'flag', 'monster_id')
+
     def __init__(self, reader):
         """
 
@@ -424,6 +487,7 @@ class ClearFlag:
             return "Clear 'Prevent rest' flag".format()
 
 
+@register_opcode(0xf6)
 class Sound:
     """
 
@@ -431,6 +495,8 @@ class Sound:
     :return:
     """
 
+    __slots__ = ('id', 'location')
+
     def __init__(self, reader):
         """
 
@@ -462,12 +528,15 @@ class Sound:
             return "Play sound {id}".format(id=self.id)
 
 
+@register_opcode(0xf2)
 class Jump:
     """
 
     :return:
     """
 
+    __slots__ = ('addr',)
+
     def __init__(self, reader):
 
         self.addr = None
@@ -484,12 +553,15 @@ class Jump:
         return "Jump to [0x{target:04X}]".format(target=self.addr)
 
 
+@register_opcode(0xf1)
 class End:
     """
 
     :return:
     """
 
+    __slots__ = ()
+
     def __init__(self, reader):
 
         self.decode(reader)
@@ -503,12 +575,15 @@ class End:
         return "End"
 
 
+@register_opcode(0xf0)
 class Return:
     """
 
     :return:
     """
 
+    __slots__ = ()
+
     def __init__(self, reader):
 
         self.decode(reader)
@@ -522,6 +597,7 @@ class Return:
         return "Return"
 
 
+@register_opcode(0xea)
 class NewItem:
     """
 
@@ -529,6 +605,8 @@ class NewItem:
     :return:
     """
 
+    __slots__ = ('type', 'location', 'subpos', 'flags', 'item_id', 'item_value', 'item_flag', 'item_icon')
+
     def __init__(self, reader):
         """
 
@@ -583,6 +661,7 @@ class NewItem:
                 item_id=self.item_id, location=self.location, sub=self.subpos, flags=self.flags)
 
 
+@register_opcode(0xe5)
 class Wait:
     """
 
@@ -590,6 +669,8 @@ class Wait:
     :return:
     """
 
+    __slots__ = ('delay',)
+
     def __init__(self, reader):
         """
 
@@ -615,6 +696,7 @@ class Wait:
         return "Wait {delay} ticks ({ms} ms)".format(delay=self.delay, ms=self.delay * 55)
 
 
+@register_opcode(0xe4)
 class UpdateScreen:
     """
 
@@ -622,6 +704,8 @@ class UpdateScreen:
     :return:
     """
 
+    __slots__ = ()
+
     def __init__(self, reader):
         """
 
@@ -644,12 +728,15 @@ class UpdateScreen:
         return "Update screen"
 
 
+@register_opcode(0xe3)
 class Dialog:
     """
 
     :return:
     """
 
+    __slots__ = ('type', 'picture_name', 'x', 'y', 'rect', 'flags', 'text_id', 'buttons')
+
     def __init__(self, reader):
 
         self.type = None
@@ -729,6 +816,7 @@ class Dialog:
             return "Print dialog text: x message id {x} , y message id {y}".format(x=self.x, y=self.y)
 
 
+@register_opcode(0xec)
 class ChangeLevel:
     """
 
@@ -736,6 +824,8 @@ class ChangeLevel:
     :return:
     """
 
+    __slots__ = ('cmd', 'index', 'level', 'sub', 'location', 'direction', 'monster')
+
     def __init__(self, reader):
         """
 
@@ -784,6 +874,7 @@ class ChangeLevel:
                 shape=self.monster[0], id=self.level, type=self.index)
 
 
+@register_opcode(0xef)
 class Call:
     """
 
@@ -791,6 +882,8 @@ class Call:
     :return:
     """
 
+    __slots__ = ('target',)
+
     def __init__(self, reader):
         """
 
@@ -818,6 +911,7 @@ class Call:
             .format(target=self.target)
 
 
+@register_opcode(0xfd)
 class OpenDoor:
     """
 
@@ -825,6 +919,8 @@ class OpenDoor:
     :return:
     """
 
+    __slots__ = ('location',)
+
     def __init__(self, reader):
         """
 
@@ -851,6 +947,7 @@ class OpenDoor:
         return "Open door at {location}".format(location=self.location)
 
 
+@register_opcode(0xfc)
 class CloseDoor:
     """
 
@@ -858,6 +955,8 @@ class CloseDoor:
     :return:
     """
 
+    __slots__ = ('location',)
+
     def __init__(self, reader):
         """
 
@@ -884,6 +983,7 @@ class CloseDoor:
         return "Close door at {location}".format(location=self.location)
 
 
+@register_opcode(0xed)
 class ConsumeItem:
     """
 
@@ -891,6 +991,8 @@ class ConsumeItem:
     :return:
     """
 
+    __slots__ = ('type', 'location')
+
     def __init__(self, reader):
         """
 
@@ -923,6 +1025,7 @@ class ConsumeItem:
             return "Consume item of type {type} at {location}".format(type=self.type, location=self.location)
 
 
+@register_opcode(0xfe)
 class ChangeWall:
     """
 
@@ -930,6 +1033,8 @@ class ChangeWall:
     :return:
     """
 
+    __slots__ = ('type', 'location', 'to', 'side', 'model')
+
     def __init__(self, reader):
         """
 
@@ -983,6 +1088,7 @@ class ChangeWall:
                 location=self.location)
 
 
+@register_opcode(0xe9)
 class Launcher:
     """
 
@@ -990,6 +1096,8 @@ class Launcher:
     :return:
     """
 
+    __slots__ = ('type', 'item_id', 'location', 'direction', 'sub_position')
+
     def __init__(self, reader):
         """
 
@@ -1032,6 +1140,7 @@ class Launcher:
             )
 
 
+@register_opcode(0xe8)
 class Turn:
     """
 
@@ -1039,6 +1148,8 @@ class Turn:
     :return:
     """
 
+    __slots__ = ('cmd', 'dir')
+
     def __init__(self, reader):
         """
 
@@ -1075,6 +1186,7 @@ class Turn:
             return '[ERROR] Turn'
 
 
+@register_opcode(0xf4)
 class Heal:
     """
 
@@ -1082,6 +1194,8 @@ class Heal:
     :return:
     """
 
+    __slots__ = ('target', 'points')
+
     def __init__(self, reader):
         """
 
@@ -1112,6 +1226,7 @@ class Heal:
             return "Heal team of {points} points".format(points=self.points)
 
 
+@register_opcode(0xf3)
 class Damage:
     """
 
@@ -1119,6 +1234,11 @@ class Damage:
     :return:
     """
 
+    __slots__ = (
+        'target', 'times', 'itemOrPips', 'mod', 'flags', 'savingThrowType', 'savingThrowEffect', 'vs_small',
+        'vs_big'
+    )
+
     def __init__(self, reader):
         """
 
@@ -1164,6 +1284,7 @@ class Damage:
         )
 
 
+@register_opcode(0xeb)
 class GiveXP:
     """
 
@@ -1171,6 +1292,8 @@ class GiveXP:
     :return:
     """
 
+    __slots__ = ('type', 'amount')
+
     def __init__(self, reader):
         """
 
@@ -1201,6 +1324,7 @@ class GiveXP:
             )
 
 
+@register_opcode(0xe7)
 class IdentifyAllItems:
     """
 
@@ -1208,6 +1332,8 @@ class IdentifyAllItems:
     :return:
     """
 
+    __slots__ = ('location',)
+
     def __init__(self, reader):
         """
 
@@ -1235,6 +1361,7 @@ class IdentifyAllItems:
         )
 
 
+@register_opcode(0xe6)
 class Sequence:
     """
 
@@ -1242,6 +1369,8 @@ class Sequence:
     :return:
     """
 
+    __slots__ = ('cmd',)
+
     def __init__(self, reader):
         """
 
@@ -1288,6 +1417,7 @@ class Sequence:
         )
 
 
+@register_opcode(0xf9)
 class StealSmallItem:
     """
 
@@ -1295,6 +1425,8 @@ class StealSmallItem:
     :return:
     """
 
+    __slots__ = ('whom', 'location', 'sub_position')
+
     def __init__(self, reader):
         """
 
@@ -1331,6 +1463,7 @@ class StealSmallItem:
             )
 
 
+@register_opcode(0xe2)
 class SpecialEvent:
     """
 
@@ -1338,6 +1471,8 @@ class SpecialEvent:
     :return:
     """
 
+    __slots__ = ('id',)
+
     def __init__(self, reader):
         """
 
@@ -0,0 +1,319 @@
+import tokens
+
+# kinds of instructions
+EFFECT = 0
+JUMP = 1
+CONDITION = 2
+CALL = 3
+RETURN = 4
+END = 5
+INVALID = 6
+
+
+class StepLimitExceeded(RuntimeError):
+    pass
+
+
+class InvalidInstruction(RuntimeError):
+    pass
+
+
+class Program:
+    """
+    A decompiled Script as parallel arrays of instructions, indexed by their position in offset order.
+
+    Jump, call and branch targets are resolved to instruction indices once, so that running a script never looks
+    up an offset. Two sentinel instructions follow the tokens: END, where running off the last token lands, and
+    INVALID, where every target which is not the offset of a token lands.
+    """
+
+    def __init__(self, script):
+        """
+
+        :param script: decompiled Script
+        """
+        self.offsets = sorted(script.tokens)
+        self.indices = {offset: i for i, offset in enumerate(self.offsets)}
+
+        count = len(self.offsets)
+        self.end = count
+        self.invalid = count + 1
+
+        self.tokens = [script.tokens[offset] for offset in self.offsets] + [None, None]
+        self.kinds = [EFFECT] * count + [END, INVALID]
+        self.targets = [0] * (count + 2)
+        self.conditions = [None] * (count + 2)
+
+        for i, token in enumerate(self.tokens[:count]):
+            if isinstance(token, tokens.Jump):
+                self.kinds[i] = JUMP
+                self.targets[i] = self.indices.get(token.addr, self.invalid)
+
+            elif isinstance(token, tokens.Call):
+                self.kinds[i] = CALL
+                self.targets[i] = self.indices.get(token.target, self.invalid)
+
+            elif isinstance(token, tokens.Conditional):
+                try:
+                    self.conditions[i] = token.compile()
+                except ValueError:
+                    self.kinds[i] = INVALID
+                    continue
+
+                self.kinds[i] = CONDITION
+                self.targets[i] = self.indices.get(token.target, self.invalid)
+
+            elif isinstance(token, tokens.Return):
+                self.kinds[i] = RETURN
+
+            elif isinstance(token, tokens.End):
+                self.kinds[i] = END
+
+    def __len__(self):
+        return self.end
+
+    def index_of(self, offset):
+        """
+        Instruction index of the token at offset
+        :param offset:
+        :return:
+        """
+        try:
+            return self.indices[offset]
+        except KeyError:
+            raise KeyError('no token at offset 0x{offset:04X}'.format(offset=offset))
+
+
+class Interpreter:
+    """
+    Runs a Program against a state.GameState.
+
+    The tokens which are neither control flow nor conditions are effects, run by the handler registered for
+    their class: a function (state, token). Effects without handler do nothing. DEFAULT_HANDLERS apply the
+    effects of the tokens on the GameState, handlers given to the constructor are added to them or replace them.
+    """
+
+    def __init__(self, program, state, handlers=None, max_steps=100000):
+        """
+
+        :param program: Program
+        :param state: state.GameState
+        :param handlers: token class -> function (state, token)
+        :param max_steps: number of instructions after which a run is aborted, to stop endless loops
+        """
+        self.program = program
+        self.state = state
+        self.max_steps = max_steps
+
+        self.handlers = dict(DEFAULT_HANDLERS)
+        if handlers:
+            self.handlers.update(handlers)
+
+        # handler of each instruction, looked up once
+        self._effects = [self.handlers.get(type(token)) for token in program.tokens]
+
+    def run(self, offset, trigger_flags=0):
+        """
+        Run the script from the token at offset until its End, or a Return outside of any call
+        :param offset:
+        :param trigger_flags: flags of the trigger running the script
+        :return: number of instructions run
+        """
+        program = self.program
+        kinds = program.kinds
+        targets = program.targets
+        conditions = program.conditions
+        script_tokens = program.tokens
+        effects = self._effects
+        state = self.state
+        max_steps = self.max_steps
+
+        state.trigger_flags = trigger_flags
+
+        pc = program.index_of(offset)
+        calls = []
+        steps = 0
+
+        while True:
+            steps += 1
+            if steps > max_steps:
+                raise StepLimitExceeded('more than {steps} steps from offset 0x{offset:04X}'.format(
+                    steps=max_steps, offset=offset))
+
+            kind = kinds[pc]
+
+            if kind == EFFECT:
+                effect = effects[pc]
+                if effect is not None:
+                    effect(state, script_tokens[pc])
+                pc += 1
+
+            elif kind == CONDITION:
+                pc = pc + 1 if conditions[pc](state) else targets[pc]
+
+            elif kind == JUMP:
+                pc = targets[pc]
+
+            elif kind == CALL:
+                calls.append(pc + 1)
+                pc = targets[pc]
+
+            elif kind == RETURN:
+                if not calls:
+                    return steps
+                pc = calls.pop()
+
+            elif kind == END:
+                return steps
+
+            else:
+                raise InvalidInstruction(self._describe_invalid(pc))
+
+    def run_trigger(self, trigger):
+        """
+        Run the script of a trigger
+        :param trigger: extract.Trigger
+        :return: number of instructions run
+        """
+        return self.run(trigger.offset, trigger.flags or 0)
+
+    def _describe_invalid(self, pc):
+        program = self.program
+        if pc == program.invalid:
+            return 'jump to an offset which is not a token'
+
+        return 'invalid condition at offset 0x{offset:04X}'.format(offset=program.offsets[pc])
+
+
+# region Effects
+
+def set_wall(state, token):
+    if token.type == -9:
+        for side in range(4):
+            state.set_wall(token.location, side, token.to)
+
+    elif token.type == -23:
+        state.set_wall(token.location, token.side, token.to)
+
+    elif token.type == -19:
+        state.party_direction = token.direction
+
+
+def change_wall(state, token):
+    if token.type == -9:
+        for side in range(4):
+            state.set_wall(token.location, side, token.to)
+
+    elif token.type == -23:
+        state.set_wall(token.location, token.side, token.to)
+
+    elif token.type == -22:
+        state.toggle_door(token.location)
+
+
+def open_door(state, token):
+    state.open_door(token.location)
+
+
+def close_door(state, token):
+    state.close_door(token.location)
+
+
+def set_flag(state, token):
+    if token.type == -17:
+        state.set_level_flag(token.flag)
+
+    elif token.type == -16:
+        state.set_global_flag(token.flag)
+
+    elif token.type == -13:
+        state.monster_flags[token.monster_id] = state.monster_flags.get(token.monster_id, 0) | (1 << token.flag)
+
+    elif token.type == -28:
+        state.menu_choice = 1
+
+    elif token.type == -47:
+        state.prevent_rest = True
+
+
+def clear_flag(state, token):
+    if token.type == -17:
+        state.clear_level_flag(token.flag)
+
+    elif token.type == -16:
+        state.clear_global_flag(token.flag)
+
+    elif token.type == -28:
+        state.menu_choice = 0
+
+    elif token.type == -47:
+        state.prevent_rest = False
+
+
+def teleport(state, token):
+    if token.type == -24:
+        state.party_position = (token.destination.x, token.destination.y)
+
+    elif token.type == -13:
+        state.move_monsters(token.source, token.destination)
+
+    elif token.type == -31:
+        state.move_items(token.src_blk, token.dst_blk, token.item_type)
+
+    elif token.type == -11:
+        if token.sub == 0xeb:
+            state.move_items(token.source, token.dst_blk)
+        elif token.sub == 0xe5:
+            # to another level
+            state.move_items(token.source, None)
+
+
+def new_item(state, token):
+    state.add_item(token.location, token.item_id)
+
+
+def consume_item(state, token):
+    if token.type == -1:
+        state.hand_item = None
+        state.hand_item_index = 0
+    else:
+        state.remove_items(token.location, token.type)
+
+
+def create_monster(state, token):
+    state.add_monster(token.location)
+
+
+def turn(state, token):
+    if token.cmd == -15:
+        state.party_direction = token.dir
+
+
+def change_level(state, token):
+    if token.cmd == -27:
+        state.level = token.index
+        state.party_position = (token.location.x, token.location.y)
+        state.party_direction = token.direction
+
+
+def message(state, token):
+    state.messages.append((token.message_id, token.color))
+
+
+DEFAULT_HANDLERS = {
+    tokens.SetWall: set_wall,
+    tokens.ChangeWall: change_wall,
+    tokens.OpenDoor: open_door,
+    tokens.CloseDoor: close_door,
+    tokens.SetFlag: set_flag,
+    tokens.ClearFlag: clear_flag,
+    tokens.Teleport: teleport,
+    tokens.NewItem: new_item,
+    tokens.ConsumeItem: consume_item,
+    tokens.CreateMonster: create_monster,
+    tokens.Turn: turn,
+    tokens.ChangeLevel: change_level,
+    tokens.Message: message,
+}
+
+# endregion
@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+import json
+import os
+
+import conditions
+import tokens
+from entities import Location
+
+XREF_FILENAME = 'xref.json'
+XREF_VERSION = 1
+
+# kinds of references
+GLOBAL_FLAG = 'global_flag'
+LEVEL_FLAG = 'level_flag'
+MESSAGE = 'message'
+ITEM = 'item'  # index in ITEM.DAT
+ITEM_TYPE = 'item_type'
+MONSTER_TYPE = 'monster_type'
+LOCATION = 'location'
+
+KINDS = (GLOBAL_FLAG, LEVEL_FLAG, MESSAGE, ITEM, ITEM_TYPE, MONSTER_TYPE, LOCATION)
+
+# how a token uses what it references
+READ = 'read'
+WRITE = 'write'
+
+
+def make_key(value):
+    """
+    Key of a referenced value: the value itself as a string, locations as their coordinates ('05x12')
+    :param value: int, Location, (x, y) or already a key
+    :return:
+    """
+    if isinstance(value, Location):
+        return value.coordinates()
+
+    if isinstance(value, tuple):
+        return '{x:02}x{y:02}'.format(x=value[0], y=value[1])
+
+    return str(value)
+
+
+class CrossReferenceIndex:
+    """
+    Where the level scripts use flags, messages, items, monster types and maze locations.
+
+    references[kind][key][level] is the list of the tokens of the level script referencing key, each one a dict
+    with the level name, the token offset and class, the access (read or write) and the coordinates of the
+    triggers whose script can run the token, found with the control flow graph of the level.
+
+    Level flags, messages and locations are only meaningful within their level, so lookups of these kinds are
+    usually done with a level name. Keys are strings, see make_key().
+    """
+
+    def __init__(self):
+        self.references = {kind: {} for kind in KINDS}
+
+    def add_level(self, inf):
+        """
+        Index the script of a decoded level
+        :param inf: extract.Inf
+        :return:
+        """
+        self.merge(level_references(inf))
+
+    def merge(self, references):
+        """
+        Add the references of some levels
+        :param references: as returned by level_references() or references of another index
+        :return:
+        """
+        for kind, keys in references.items():
+            index = self.references.setdefault(kind, {})
+            for key, levels in keys.items():
+                index.setdefault(key, {}).update(levels)
+
+    def get_level(self, level):
+        """
+        References of one level
+        :param level: level name
+        :return: in the layout of level_references()
+        """
+        references = {}
+        for kind, keys in self.references.items():
+            for key, levels in keys.items():
+                if level in levels:
+                    references.setdefault(kind, {})[key] = {level: levels[level]}
+
+        return references
+
+    def find(self, kind, value, level=None):
+        """
+        Tokens referencing a value
+        :param kind: one of KINDS
+        :param value: see make_key()
+        :param level: level name, None for all the levels
+        :return: list of references
+        """
+        levels = self.references[kind].get(make_key(value))
+        if not levels:
+            return []
+
+        if level is not None:
+            return levels.get(level, [])
+
+        return [reference for name in sorted(levels) for reference in levels[name]]
+
+    def find_triggers(self, kind, value, level=None):
+        """
+        Triggers whose script may reference a value
+        :param kind:
+        :param value:
+        :param level:
+        :return: sorted list of (level name, trigger coordinates)
+        """
+        return sorted({(reference['level'], trigger)
+                       for reference in self.find(kind, value, level) for trigger in reference['triggers']})
+
+    def save(self, filename):
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(filename, 'w') as handle:
+            json.dump({'version': XREF_VERSION, 'references': self.references}, handle, sort_keys=True)
+
+    @staticmethod
+    def load(filename):
+        """
+        :param filename:
+        :return: CrossReferenceIndex, empty if the file was written by another version
+        """
+        with open(filename, 'r') as handle:
+            data = json.load(handle)
+
+        index = CrossReferenceIndex()
+        if data.get('version') == XREF_VERSION:
+            index.merge(data['references'])
+
+        return index
+
+
+def level_references(inf):
+    """
+    References of the script of a decoded level, in the layout of CrossReferenceIndex.references
+    :param inf: extract.Inf
+    :return:
+    """
+    script_tokens = inf.script.tokens
+    cfg = inf.get_cfg()
+
+    # token offset -> coordinates of the triggers which can run it
+    triggers = {}
+    for trigger in inf.triggers:
+        if trigger.offset not in script_tokens:
+            continue
+
+        for offset in cfg.reachable_offsets(trigger.offset):
+            triggers.setdefault(offset, set()).add(trigger.location.coordinates())
+
+    references = {}
+    for offset in sorted(script_tokens):
+        token = script_tokens[offset]
+        token_triggers = sorted(triggers.get(offset, ()))
+
+        # one reference per access, shared by everything the token references that way
+        by_access = {}
+
+        for kind, value, access in token_references(token):
+            reference = by_access.get(access)
+            if reference is None:
+                reference = by_access[access] = {
+                    'level': inf.name,
+                    'offset': offset,
+                    'token': type(token).__name__,
+                    'access': access,
+                    'triggers': token_triggers,
+                }
+
+            levels = references.setdefault(kind, {}).setdefault(make_key(value), {})
+            level = levels.setdefault(inf.name, [])
+            if not level or level[-1] is not reference:
+                level.append(reference)
+
+    return references
+
+
+def token_references(token):
+    """
+    What a script token references
+    :param token:
+    :return: list of (kind, value, access)
+    """
+    if isinstance(token, tokens.Conditional):
+        return [reference
+                for condition in token.tokens
+                for reference in _get_references(CONDITION_REFERENCES, condition)]
+
+    return _get_references(TOKEN_REFERENCES, token)
+
+
+def _get_references(table, token):
+    get_references = table.get(type(token))
+    if get_references is None:
+        return []
+
+    return [reference for reference in get_references(token) if reference[1] is not None]
+
+
+def _location(location, access):
+    if isinstance(location, Location):
+        return LOCATION, location, access
+
+    return LOCATION, None, access
+
+
+# region Tokens
+
+def _flag_references(token):
+    if token.type == -17:
+        return [(LEVEL_FLAG, token.flag, WRITE)]
+
+    if token.type == -16:
+        return [(GLOBAL_FLAG, token.flag, WRITE)]
+
+    return []
+
+
+def _wall_references(token):
+    return [_location(token.location, WRITE)]
+
+
+def _door_references(token):
+    return [_location(token.location, WRITE)]
+
+
+def _teleport_references(token):
+    if token.type == -24:
+        return [_location(token.destination, WRITE)]
+
+    if token.type == -13:
+        return [_location(token.source, WRITE), _location(token.destination, WRITE)]
+
+    if token.type == -31:
+        return [(ITEM_TYPE, token.item_type, WRITE), _location(token.src_blk, WRITE),
+                _location(token.dst_blk, WRITE)]
+
+    if token.type == -11:
+        references = [_location(token.source, WRITE)]
+        if token.sub == 0xeb:
+            references.append(_location(token.dst_blk, WRITE))
+        return references
+
+    return []
+
+
+def _message_references(token):
+    return [(MESSAGE, token.message_id, READ)]
+
+
+def _dialog_references(token):
+    if token.type == -40:   # the text and the buttons, 0xFFFF for a missing button
+        message_ids = [token.text_id] + token.buttons[:3]
+    elif token.type == -8:  # the two lines of text
+        message_ids = [token.x, token.y]
+    else:
+        return []
+
+    return [(MESSAGE, message_id, READ) for message_id in message_ids if message_id is not None and message_id >= 0]
+
+
+def _new_item_references(token):
+    return [(ITEM, token.item_id, WRITE), _location(token.location, WRITE)]
+
+
+def _consume_item_references(token):
+    if token.type == -1:
+        return []
+
+    return [(ITEM_TYPE, token.type, WRITE), _location(token.location, WRITE)]
+
+
+def _create_monster_references(token):
+    return [(MONSTER_TYPE, token.type, WRITE), _location(token.location, WRITE)]
+
+
+def _change_level_references(token):
+    if token.cmd == -27:
+        return []
+
+    return [(MONSTER_TYPE, token.index, READ)]
+
+
+def _sound_references(token):
+    return [_location(token.location, READ)]
+
+
+def _launcher_references(token):
+    references = [_location(token.location, WRITE)]
+    if token.type == -20:
+        references.append((ITEM, token.item_id, READ))
+
+    return references
+
+
+TOKEN_REFERENCES = {
+    tokens.SetFlag: _flag_references,
+    tokens.ClearFlag: _flag_references,
+    tokens.SetWall: _wall_references,
+    tokens.ChangeWall: _wall_references,
+    tokens.OpenDoor: _door_references,
+    tokens.CloseDoor: _door_references,
+    tokens.Teleport: _teleport_references,
+    tokens.Message: _message_references,
+    tokens.Dialog: _dialog_references,
+    tokens.NewItem: _new_item_references,
+    tokens.ConsumeItem: _consume_item_references,
+    tokens.CreateMonster: _create_monster_references,
+    tokens.ChangeLevel: _change_level_references,
+    tokens.Sound: _sound_references,
+    tokens.Launcher: _launcher_references,
+}
+
+# endregion
+
+# region Conditions
+
+
+def _item_count_references(condition):
+    references = [_location(condition.location, READ)]
+    if condition.type != 0xFF00:
+        references.append((ITEM_TYPE, condition.type, READ))
+
+    return references
+
+
+def _party_references(condition):
+    if condition.code == 0xF5:
+        return [(ITEM_TYPE, condition.type, READ)]
+
+    return [_location(condition.location, READ)]
+
+
+CONDITION_REFERENCES = {
+    conditions.ConditionalGetLevelFlag: lambda condition: [(LEVEL_FLAG, condition.flag, READ)],
+    conditions.ConditionalSetLevelFlag: lambda condition: [(LEVEL_FLAG, condition.flag, WRITE)],
+    conditions.ConditionalGetGlobalFlag: lambda condition: [(GLOBAL_FLAG, condition.flag, READ)],
+    conditions.ConditionalSetGlobalFlag: lambda condition: [(GLOBAL_FLAG, condition.flag, WRITE)],
+    conditions.ConditionalGetWallSide: lambda condition: [_location(condition.location, READ)],
+    conditions.ConditionalGetWallIndex: lambda condition: [_location(condition.location, READ)],
+    conditions.ConditionalMonsterCount: lambda condition: [_location(condition.location, READ)],
+    conditions.ConditionalItemCount: _item_count_references,
+    conditions.ConditionalGetParty: _party_references,
+}
+
+# endregion
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Find the level script tokens referencing a flag, message, '
+                                                 'item, monster type or location')
+    parser.add_argument('kind', choices=KINDS)
+    parser.add_argument('value', help='flag, message id, item index or type, monster type, or location as XXxYY')
+    parser.add_argument('-l', '--level', help='level name, e.g. LEVEL1')
+    parser.add_argument('-i', '--index', default=os.path.join('build', XREF_FILENAME),
+                        help='index written by extract.py, build/{name} by default'.format(name=XREF_FILENAME))
+    args = parser.parse_args()
+
+    for found in CrossReferenceIndex.load(args.index).find(args.kind, args.value, args.level):
+        print('{level} 0x{offset:04X} {token} ({access}) triggers: {triggers}'.format(
+            level=found['level'], offset=found['offset'], token=found['token'], access=found['access'],
+            triggers=', '.join(found['triggers']) or '-'))